@@ -3,6 +3,7 @@ Application configuration module
 Loads environment variables and defines constants
 """
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timezone, timedelta
@@ -23,10 +24,68 @@ DB_NAME = os.environ['DB_NAME']
 OSTICKET_URL = os.environ.get('OSTICKET_URL', '')
 OSTICKET_API_KEY = os.environ.get('OSTICKET_API_KEY', '')
 
+# osTicket outbox dispatcher: parallel sends and retry schedule
+OSTICKET_OUTBOX_CONCURRENCY = int(os.environ.get('OSTICKET_OUTBOX_CONCURRENCY', '4'))
+OSTICKET_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OSTICKET_OUTBOX_MAX_ATTEMPTS', '8'))
+OSTICKET_OUTBOX_BACKOFF_SECONDS = float(os.environ.get('OSTICKET_OUTBOX_BACKOFF_SECONDS', '30'))
+OSTICKET_OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get('OSTICKET_OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+OSTICKET_OUTBOX_POLL_SECONDS = float(os.environ.get('OSTICKET_OUTBOX_POLL_SECONDS', '10'))
+
+# osTicket status reconciliation: round interval (0 disables), parallel fetches, fetch rate
+OSTICKET_SYNC_INTERVAL_SECONDS = float(os.environ.get('OSTICKET_SYNC_INTERVAL_SECONDS', '300'))
+OSTICKET_SYNC_CONCURRENCY = int(os.environ.get('OSTICKET_SYNC_CONCURRENCY', '4'))
+OSTICKET_SYNC_RATE_PER_SECOND = float(os.environ.get('OSTICKET_SYNC_RATE_PER_SECOND', '5'))
+
+# Webhook ingestion: background apply concurrency, attempts, dedupe window
+WEBHOOK_WORKER_CONCURRENCY = int(os.environ.get('WEBHOOK_WORKER_CONCURRENCY', '4'))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+WEBHOOK_RETENTION_DAYS = int(os.environ.get('WEBHOOK_RETENTION_DAYS', '7'))
+
+# Razorpay SDK calls (synchronous): dedicated thread pool size and per-call timeout
+RAZORPAY_MAX_THREADS = int(os.environ.get('RAZORPAY_MAX_THREADS', '8'))
+RAZORPAY_TIMEOUT_SECONDS = float(os.environ.get('RAZORPAY_TIMEOUT_SECONDS', '15'))
+
+# Outbound HTTP: pooled keep-alive clients, per-integration timeout and connection cap
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY_SECONDS', '30'))
+OSTICKET_HTTP_TIMEOUT_SECONDS = float(os.environ.get('OSTICKET_HTTP_TIMEOUT_SECONDS', '30'))
+OSTICKET_HTTP_MAX_CONNECTIONS = int(os.environ.get('OSTICKET_HTTP_MAX_CONNECTIONS', '20'))
+TICKETING_TEST_HTTP_TIMEOUT_SECONDS = float(os.environ.get('TICKETING_TEST_HTTP_TIMEOUT_SECONDS', '10'))
+TICKETING_TEST_HTTP_MAX_CONNECTIONS = int(os.environ.get('TICKETING_TEST_HTTP_MAX_CONNECTIONS', '5'))
+
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET', 'warranty-portal-secret-key-change-in-prod')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480
 
+# Authenticated principal cache (0 disables)
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '60'))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', '10000'))
+
+# Reference data cache: how often other workers' version bumps are picked up
+REFERENCE_CACHE_REVALIDATE_SECONDS = float(os.environ.get('REFERENCE_CACHE_REVALIDATE_SECONDS', '5'))
+
+# PDF / QR rendering process pool
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+RENDER_MAX_CONCURRENCY = int(os.environ.get('RENDER_MAX_CONCURRENCY', str(RENDER_WORKERS)))
+RENDER_MAX_QUEUE = int(os.environ.get('RENDER_MAX_QUEUE', '32'))
+
+# Background render jobs (bulk QR labels): output files and retention
+RENDER_JOB_DIR = Path(os.environ.get('RENDER_JOB_DIR', str(Path(tempfile.gettempdir()) / 'warranty-portal-jobs')))
+RENDER_JOB_TTL_HOURS = int(os.environ.get('RENDER_JOB_TTL_HOURS', '24'))
+RENDER_JOB_BATCH_SIZE = int(os.environ.get('RENDER_JOB_BATCH_SIZE', '200'))
+# Render pool slots background jobs may hold at once; the rest stay free for interactive downloads
+RENDER_JOB_MAX_CONCURRENCY = int(os.environ.get('RENDER_JOB_MAX_CONCURRENCY', str(max(1, RENDER_MAX_CONCURRENCY - 1))))
+
+# Rendered warranty report cache (disk, LRU by size)
+WARRANTY_PDF_CACHE_DIR = Path(os.environ.get('WARRANTY_PDF_CACHE_DIR', str(Path(tempfile.gettempdir()) / 'warranty-portal-pdf-cache')))
+WARRANTY_PDF_CACHE_MAX_MB = int(os.environ.get('WARRANTY_PDF_CACHE_MAX_MB', '256'))
+
+# Bulk imports: rows validated, duplicate-checked and written per chunk
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', '1000'))
+BULK_IMPORT_MAX_UPLOAD_MB = int(os.environ.get('BULK_IMPORT_MAX_UPLOAD_MB', '50'))
+
+# Universal search: per-category time budget (keystroke-driven, keep it tight)
+SEARCH_CATEGORY_TIMEOUT_MS = int(os.environ.get('SEARCH_CATEGORY_TIMEOUT_MS', '80'))
+
 # Indian Standard Time (IST = UTC+5:30)
 IST = timezone(timedelta(hours=5, minutes=30))
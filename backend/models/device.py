@@ -2,9 +2,9 @@
 Device and Parts related models
 """
 import uuid
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_validator
 from typing import List, Optional
-from utils.helpers import get_ist_isoformat
+from utils.helpers import get_ist_isoformat, normalize_lookup_key
 
 
 class ConsumableItem(BaseModel):
@@ -48,9 +48,18 @@ class Device(BaseModel):
     consumable_notes: Optional[str] = None
     # NEW: Multiple consumables support
     consumables: List[dict] = Field(default_factory=list)
+    # Normalized lookup keys (see utils.helpers.normalize_lookup_key)
+    serial_key: Optional[str] = None
+    asset_tag_key: Optional[str] = None
     is_deleted: bool = False
     created_at: str = Field(default_factory=get_ist_isoformat)
 
+    @model_validator(mode="after")
+    def set_lookup_keys(self):
+        self.serial_key = normalize_lookup_key(self.serial_number)
+        self.asset_tag_key = normalize_lookup_key(self.asset_tag)
+        return self
+
 
 class DeviceCreate(BaseModel):
     company_id: str
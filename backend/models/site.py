@@ -12,6 +12,8 @@ class Site(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     company_id: str
     name: str
+    # Customer's own reference; with company_id, the natural key for bulk upserts
+    site_code: Optional[str] = None
     site_type: str = "office"
     address: Optional[str] = None
     city: Optional[str] = None
@@ -27,6 +29,7 @@ class Site(BaseModel):
 class SiteCreate(BaseModel):
     company_id: str
     name: str
+    site_code: Optional[str] = None
     site_type: str = "office"
     address: Optional[str] = None
     city: Optional[str] = None
@@ -38,6 +41,7 @@ class SiteCreate(BaseModel):
 
 class SiteUpdate(BaseModel):
     name: Optional[str] = None
+    site_code: Optional[str] = None
     site_type: Optional[str] = None
     address: Optional[str] = None
     city: Optional[str] = None
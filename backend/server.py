@@ -4,12 +4,13 @@ Warranty & Asset Tracking Portal - Main Server
 This is a refactored version with modular architecture.
 Models, services, and utilities are now in separate modules.
 """
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Request, Response
 from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 import os
+import asyncio
 import logging
 from typing import List, Optional, Any
 import uuid
@@ -17,28 +18,48 @@ from datetime import datetime, timezone, timedelta
 import httpx
 import base64
 from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.units import inch
 import shutil
+import tempfile
 import json
-import qrcode
 import jwt
 from pydantic import BaseModel
+from pymongo.errors import ExecutionTimeout
 
 # Import from modular structure
-from config import ROOT_DIR, UPLOAD_DIR, OSTICKET_URL, OSTICKET_API_KEY, SECRET_KEY, ALGORITHM, IST
+from config import ROOT_DIR, UPLOAD_DIR, OSTICKET_URL, OSTICKET_API_KEY, SECRET_KEY, ALGORITHM, IST, SEARCH_CATEGORY_TIMEOUT_MS, BULK_IMPORT_MAX_UPLOAD_MB
 from database import db, client
-from utils.helpers import get_ist_now, get_ist_isoformat, calculate_warranty_expiry, is_warranty_active, days_until_expiry
+from utils.helpers import (
+    get_ist_now, get_ist_isoformat, calculate_warranty_expiry, is_warranty_active, days_until_expiry,
+    normalize_lookup_key, device_lookup_keys, device_identifier_query
+)
 from services.auth import (
     verify_password, get_password_hash, create_access_token,
     get_current_admin, get_current_company_user, require_company_admin,
-    log_audit, security
+    log_audit, security, PRINCIPAL_PROJECTION
 )
-from services.osticket import create_osticket
+from services.http_clients import http_clients
+from services.razorpay_gateway import razorpay_gateway
+from services.deployment_devices import sync_items_to_devices, linked_ids_update
+from services.bulk_import import IMPORT_KINDS, IMPORT_MODES, create_import, stream_upload_import
+from services.osticket_sync import osticket_reconciler
+from services.webhooks import webhook_worker, store_event, payload_hash, razorpay_entity_key, RAZORPAY, OSTICKET
+from services.osticket_outbox import enqueue_osticket, retry_entry, osticket_dispatcher, OUTBOX_STATUSES, NOT_CONFIGURED as OSTICKET_NOT_CONFIGURED
 from services.seeding import seed_default_masters, seed_default_supplies
+from services.indexes import ensure_indexes
+from services.migrations import backfill_device_lookup_keys
+from services.loader import EntityLoader, get_loader, pick_fields
+from services.search_index import search_entities, sync_entities, sync_matching, ensure_search_index
+from services.principal_cache import principal_cache, COMPANY_USER, ENGINEER, ORG_USER
+from services.reference_cache import reference_cache, not_modified, SETTINGS, MASTERS, PLANS
+from services.render_pool import render_pool
+from services.warranty_pdf_cache import warranty_pdf_cache
+from services.warranty_reports import render_warranty_report
+from services.render_jobs import (
+    create_job, get_job, start_job, run_qr_label_job, run_warranty_report_job, job_file_response,
+    purge_expired_job_files, QR_LABELS, WARRANTY_REPORTS, COMPLETED
+)
+from utils.rendering import render_qr_label_pdf
+from utils.spreadsheets import spreadsheet_extension
 
 # Import all models
 from models.auth import Token, AdminUser, AdminLogin, AdminCreate
@@ -99,11 +120,23 @@ app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 async def root():
     return {"message": "Warranty & Asset Tracking Portal API"}
 
-@api_router.get("/settings/public")
-async def get_public_settings():
+async def _load_settings() -> dict:
     settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if not settings:
-        settings = Settings().model_dump()
+    return settings or Settings().model_dump()
+
+async def _load_masters() -> list:
+    return await db.masters.find({}, {"_id": 0}).sort([("type", 1), ("sort_order", 1)]).to_list(None)
+
+async def _load_active_plans() -> list:
+    plans = await db.pricing_plans.find({"is_active": True}, {"_id": 0}).sort("sort_order", 1).to_list(10)
+    return plans or DEFAULT_PLANS
+
+@api_router.get("/settings/public")
+async def get_public_settings(request: Request, response: Response):
+    settings, etag = await reference_cache.get(SETTINGS, "settings", _load_settings)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
     return {
         "logo_url": settings.get("logo_url"),
         "logo_base64": settings.get("logo_base64"),
@@ -159,10 +192,7 @@ async def public_org_warranty_search(slug: str, q: str):
         {"$and": [
             {"organization_id": org_id},
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{q}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{q}$", "$options": "i"}}
-            ]}
+            device_identifier_query(q)
         ]},
         {"_id": 0}
     )
@@ -316,12 +346,13 @@ async def public_org_warranty_search(slug: str, q: str):
 # ==================== SAAS / SUBSCRIPTION ENDPOINTS ====================
 
 @api_router.get("/plans")
-async def get_pricing_plans():
+async def get_pricing_plans(request: Request, response: Response):
     """Get all active pricing plans (public)"""
-    # Check if plans exist in DB, otherwise use defaults
-    plans = await db.pricing_plans.find({"is_active": True}, {"_id": 0}).sort("sort_order", 1).to_list(10)
-    if not plans:
-        plans = DEFAULT_PLANS
+    # Plans from the DB, otherwise the defaults
+    plans, etag = await reference_cache.get(PLANS, "active", _load_active_plans)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
     return {"plans": plans}
 
 
@@ -508,15 +539,22 @@ async def get_current_org_user(request: Request) -> dict:
         user_id = payload.get("sub")
         org_id = payload.get("org_id")
         
-        user = await db.org_users.find_one({"id": user_id}, {"_id": 0})
+        cached = principal_cache.get(ORG_USER, (user_id, org_id))
+        if cached is not None:
+            return cached
+        
+        user, org = await asyncio.gather(
+            db.org_users.find_one({"id": user_id}, PRINCIPAL_PROJECTION),
+            db.organizations.find_one({"id": org_id}, {"_id": 0})
+        )
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        org = await db.organizations.find_one({"id": org_id}, {"_id": 0})
         if not org:
             raise HTTPException(status_code=401, detail="Organization not found")
         
-        return {"user": user, "organization": org}
+        principal = {"user": user, "organization": org}
+        principal_cache.set(ORG_USER, (user_id, org_id), principal, organization_id=org_id)
+        return principal
         
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -577,7 +615,7 @@ async def get_subscription_details(user: dict = Depends(get_current_org_user)):
     subscription = None
     if org.get("subscription_id"):
         from services.razorpay_service import get_subscription
-        result = get_subscription(org["subscription_id"])
+        result = await razorpay_gateway.call(get_subscription, org["subscription_id"])
         if result.get("success"):
             subscription = result["subscription"]
     
@@ -625,7 +663,8 @@ async def create_subscription(data: CreateSubscriptionRequest, user: dict = Depe
         raise HTTPException(status_code=400, detail="Plan not available for this billing cycle")
     
     # Create or get customer
-    customer_result = create_customer(
+    customer_result = await razorpay_gateway.call(
+        create_customer,
         name=user["name"],
         email=user["email"],
         phone=user.get("phone")
@@ -637,7 +676,8 @@ async def create_subscription(data: CreateSubscriptionRequest, user: dict = Depe
     customer_id = customer_result["customer"]["id"]
     
     # Create subscription
-    result = create_subscription(
+    result = await razorpay_gateway.call(
+        create_subscription,
         plan_id=razorpay_plan_id,
         customer_id=customer_id,
         notes={
@@ -677,13 +717,12 @@ async def create_subscription(data: CreateSubscriptionRequest, user: dict = Depe
 
 @api_router.post("/webhooks/razorpay")
 async def razorpay_webhook(request: Request):
-    """Handle Razorpay webhook events"""
+    """
+    Handle Razorpay webhook events.
+    The verified event is stored and applied in the background (services.webhooks);
+    retried deliveries of the same event are acknowledged without being applied again.
+    """
     from services.razorpay_service import verify_webhook_signature
-    from services.saas_service import (
-        handle_subscription_activated,
-        handle_subscription_cancelled,
-        handle_payment_failed
-    )
     
     payload = await request.body()
     signature = request.headers.get("X-Razorpay-Signature", "")
@@ -692,49 +731,18 @@ async def razorpay_webhook(request: Request):
     if not verify_webhook_signature(payload.decode(), signature):
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    data = await request.json()
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
     event = data.get("event")
-    payload_data = data.get("payload", {})
     
     logger.info(f"Razorpay webhook: {event}")
     
-    # Handle events
-    if event == "subscription.activated":
-        subscription = payload_data.get("subscription", {}).get("entity", {})
-        org_id = subscription.get("notes", {}).get("org_id")
-        if org_id:
-            await handle_subscription_activated(db, org_id, subscription)
-    
-    elif event == "subscription.cancelled":
-        subscription = payload_data.get("subscription", {}).get("entity", {})
-        org_id = subscription.get("notes", {}).get("org_id")
-        if org_id:
-            await handle_subscription_cancelled(db, org_id)
-    
-    elif event == "subscription.halted" or event == "payment.failed":
-        subscription = payload_data.get("subscription", {}).get("entity", {})
-        org_id = subscription.get("notes", {}).get("org_id")
-        if org_id:
-            await handle_payment_failed(db, org_id)
-    
-    elif event == "payment.captured":
-        payment = payload_data.get("payment", {}).get("entity", {})
-        # Save payment record
-        payment_record = {
-            "id": str(uuid.uuid4()),
-            "org_id": payment.get("notes", {}).get("org_id"),
-            "razorpay_payment_id": payment.get("id"),
-            "razorpay_order_id": payment.get("order_id"),
-            "amount": payment.get("amount"),
-            "currency": payment.get("currency", "INR"),
-            "status": "captured",
-            "method": payment.get("method"),
-            "created_at": datetime.utcnow().isoformat()
-        }
-        if payment_record["org_id"]:
-            await db.payments.insert_one(payment_record)
+    event_id = request.headers.get("X-Razorpay-Event-Id") or payload_hash(payload)
+    stored = await store_event(RAZORPAY, event_id, event, razorpay_entity_key(data), data)
     
-    return {"status": "ok"}
+    return {"status": "ok", "duplicate": not stored}
 
 
 # ==================== ORG DASHBOARD ENDPOINTS ====================
@@ -1026,12 +1034,18 @@ async def delete_org_company(company_id: str, user: dict = Depends(get_current_o
         raise HTTPException(status_code=404, detail="Company not found")
     
     # Delete related data
+    site_ids = [s["id"] for s in await db.sites.find(
+        {"company_id": company_id, "organization_id": org_id}, {"_id": 0, "id": 1}
+    ).to_list(None)]
     await db.sites.delete_many({"company_id": company_id, "organization_id": org_id})
+    await sync_entities("sites", *site_ids)
     await db.org_users.delete_many({"company_id": company_id, "organization_id": org_id})
+    principal_cache.invalidate_organization(org_id)
     await db.devices.update_many(
         {"company_id": company_id, "organization_id": org_id},
         {"$set": {"company_id": None}}
     )
+    await warranty_pdf_cache.invalidate(company_id=company_id)
     
     # Delete company
     await db.org_companies.delete_one({"id": company_id})
@@ -1100,6 +1114,7 @@ async def create_org_site(data: OrgSiteCreate, user: dict = Depends(get_current_
     }
     
     await db.sites.insert_one(site)
+    await sync_entities("sites", site["id"])
     return {"message": "Site created", "id": site["id"]}
 
 
@@ -1116,6 +1131,7 @@ async def update_org_site(site_id: str, data: OrgSiteCreate, user: dict = Depend
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
     await db.sites.update_one({"id": site_id}, {"$set": update_data})
+    await sync_entities("sites", site_id)
     return {"message": "Site updated"}
 
 
@@ -1128,6 +1144,7 @@ async def delete_org_site(site_id: str, user: dict = Depends(get_current_org_use
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Site not found")
     
+    await sync_entities("sites", site_id)
     return {"message": "Site deleted"}
 
 
@@ -1150,7 +1167,7 @@ async def get_org_users(user: dict = Depends(get_current_org_user), search: Opti
             {"phone": search_regex}
         ]
     
-    users = await db.org_users.find(query, {"_id": 0, "password_hash": 0}).sort("name", 1).to_list(500)
+    users = await db.org_users.find(query, {"_id": 0, "password_hash": 0, "hashed_password": 0}).sort("name", 1).to_list(500)
     return users
 
 
@@ -1218,6 +1235,7 @@ async def update_org_user(user_id: str, data: OrgUserCreate, user: dict = Depend
         update_data["password_hash"] = pwd_context.hash(data.password)
     
     await db.org_users.update_one({"id": user_id}, {"$set": update_data})
+    principal_cache.invalidate(ORG_USER, (user_id, org_id))
     return {"message": "User updated"}
 
 
@@ -1234,6 +1252,7 @@ async def delete_org_user(user_id: str, user: dict = Depends(get_current_org_use
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    principal_cache.invalidate(ORG_USER, (user_id, org_id))
     return {"message": "User deleted"}
 
 
@@ -1258,15 +1277,28 @@ class OrgDeviceCreate(BaseModel):
     consumables: Optional[list] = []
 
 
+async def ensure_org_device_identifiers_free(org_id: str, serial_number: str, asset_tag: Optional[str], exclude_id: Optional[str] = None):
+    """Raise 400 if another device in the organization already uses this serial number or asset tag"""
+    base_query = {"organization_id": org_id}
+    if exclude_id:
+        base_query["id"] = {"$ne": exclude_id}
+    
+    serial_key = normalize_lookup_key(serial_number)
+    if serial_key and await db.devices.find_one({**base_query, "serial_key": serial_key}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Serial number already exists")
+    
+    asset_tag_key = normalize_lookup_key(asset_tag)
+    if asset_tag_key and await db.devices.find_one({**base_query, "asset_tag_key": asset_tag_key}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Asset tag already exists")
+
+
 @api_router.post("/org/devices")
 async def create_org_device(data: OrgDeviceCreate, user: dict = Depends(get_current_org_user)):
     """Create a new device for this organization"""
     org_id = user["organization"]["id"]
     
-    # Check if serial number already exists
-    existing = await db.devices.find_one({"serial_number": data.serial_number, "organization_id": org_id})
-    if existing:
-        raise HTTPException(status_code=400, detail="Serial number already exists")
+    # Check if serial number / asset tag already exists (both are unique per organization)
+    await ensure_org_device_identifiers_free(org_id, data.serial_number, data.asset_tag)
     
     device = {
         "id": str(uuid.uuid4()),
@@ -1290,8 +1322,10 @@ async def create_org_device(data: OrgDeviceCreate, user: dict = Depends(get_curr
         "created_at": datetime.utcnow().isoformat(),
         "created_by": user["user"]["id"]
     }
+    device.update(device_lookup_keys(device))
     
     await db.devices.insert_one(device)
+    await sync_entities("devices", device["id"])
     return {"message": "Device created", "id": device["id"]}
 
 
@@ -1316,6 +1350,8 @@ async def update_org_device(device_id: str, data: OrgDeviceCreate, user: dict =
     if not existing:
         raise HTTPException(status_code=404, detail="Device not found")
     
+    await ensure_org_device_identifiers_free(org_id, data.serial_number, data.asset_tag, exclude_id=device_id)
+    
     update_data = {
         "company_id": data.company_id,
         "device_type": data.device_type,
@@ -1335,8 +1371,11 @@ async def update_org_device(device_id: str, data: OrgDeviceCreate, user: dict =
         "consumables": data.consumables,
         "updated_at": datetime.utcnow().isoformat()
     }
+    update_data.update(device_lookup_keys(update_data))
     
     await db.devices.update_one({"id": device_id}, {"$set": update_data})
+    await sync_entities("devices", device_id)
+    await warranty_pdf_cache.invalidate([device_id])
     return {"message": "Device updated"}
 
 
@@ -1349,6 +1388,8 @@ async def delete_org_device(device_id: str, user: dict = Depends(get_current_org
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Device not found")
     
+    await sync_entities("devices", device_id)
+    await warranty_pdf_cache.invalidate([device_id])
     return {"message": "Device deleted"}
 
 
@@ -1403,6 +1444,7 @@ async def create_org_part(data: OrgPartCreate, user: dict = Depends(get_current_
     }
     
     await db.parts.insert_one(part)
+    await warranty_pdf_cache.invalidate([data.device_id])
     return {"message": "Part created", "id": part["id"]}
 
 
@@ -1419,6 +1461,7 @@ async def update_org_part(part_id: str, data: OrgPartCreate, user: dict = Depend
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
     await db.parts.update_one({"id": part_id}, {"$set": update_data})
+    await warranty_pdf_cache.invalidate([existing.get("device_id"), data.device_id])
     return {"message": "Part updated"}
 
 
@@ -1427,10 +1470,11 @@ async def delete_org_part(part_id: str, user: dict = Depends(get_current_org_use
     """Delete a part"""
     org_id = user["organization"]["id"]
     
-    result = await db.parts.delete_one({"id": part_id, "organization_id": org_id})
-    if result.deleted_count == 0:
+    part = await db.parts.find_one_and_delete({"id": part_id, "organization_id": org_id}, {"_id": 0, "device_id": 1})
+    if not part:
         raise HTTPException(status_code=404, detail="Part not found")
     
+    await warranty_pdf_cache.invalidate([part.get("device_id")])
     return {"message": "Part deleted"}
 
 
@@ -1479,6 +1523,7 @@ async def create_org_service_entry(data: OrgServiceCreate, user: dict = Depends(
     }
     
     await db.service_history.insert_one(entry)
+    await sync_entities("service_history", entry["id"])
     return {"message": "Service entry created", "id": entry["id"]}
 
 
@@ -1815,19 +1860,22 @@ async def delete_org_supply_order(order_id: str, user: dict = Depends(get_curren
 # ==================== ORG MASTER DATA ====================
 
 @api_router.get("/org/masters")
-async def get_org_masters(user: dict = Depends(get_current_org_user)):
+async def get_org_masters(request: Request, response: Response, user: dict = Depends(get_current_org_user)):
     """Get master data for dropdowns"""
-    # Fetch from global masters collection
-    device_types = await db.masters.find({"type": "device_type"}, {"_id": 0}).to_list(100)
-    brands = await db.masters.find({"type": "brand"}, {"_id": 0}).to_list(100)
-    conditions = await db.masters.find({"type": "condition"}, {"_id": 0}).to_list(100)
-    statuses = await db.masters.find({"type": "asset_status"}, {"_id": 0}).to_list(100)
+    # Global masters collection, served from the reference cache
+    masters, etag = await reference_cache.get(MASTERS, "all", _load_masters)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+    
+    def values(master_type: str) -> List[str]:
+        return [m.get("value", "") for m in masters if m.get("type") == master_type][:100]
     
     return {
-        "device_types": [d.get("value", "") for d in device_types],
-        "brands": [b.get("value", "") for b in brands],
-        "conditions": [c.get("value", "") for c in conditions],
-        "statuses": [s.get("value", "") for s in statuses]
+        "device_types": values("device_type"),
+        "brands": values("brand"),
+        "conditions": values("condition"),
+        "statuses": values("asset_status")
     }
 
 
@@ -1875,6 +1923,7 @@ async def update_org_settings(data: OrgSettingsUpdate, user: dict = Depends(get_
         {"id": org["id"]},
         {"$set": update_data}
     )
+    principal_cache.invalidate_organization(org["id"])
     
     return {"message": "Settings updated successfully"}
 
@@ -1887,19 +1936,15 @@ class TestTicketingRequest(BaseModel):
 @api_router.post("/org/settings/test-ticketing")
 async def test_ticketing_connection(data: TestTicketingRequest, user: dict = Depends(get_current_org_user)):
     """Test ticketing system connection"""
-    import httpx
-    
     try:
-        # Try to connect to the ticketing system API
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Try a simple GET request to check if API is accessible
-            headers = {"X-API-Key": data.api_key}
-            response = await client.get(data.url, headers=headers)
-            
-            if response.status_code < 500:
-                return {"success": True, "message": "Connection successful"}
-            else:
-                return {"success": False, "message": f"Server error: {response.status_code}"}
+        # Try a simple GET request to check if the ticketing system API is accessible
+        headers = {"X-API-Key": data.api_key}
+        response = await http_clients.request("ticketing_test", "GET", data.url, headers=headers)
+        
+        if response.status_code < 500:
+            return {"success": True, "message": "Connection successful"}
+        else:
+            return {"success": False, "message": f"Server error: {response.status_code}"}
     except httpx.TimeoutException:
         return {"success": False, "message": "Connection timeout - check URL"}
     except httpx.RequestError as e:
@@ -1925,6 +1970,7 @@ async def get_all_plans(admin: dict = Depends(get_current_admin)):
                 {"$setOnInsert": plan},
                 upsert=True
             )
+        await reference_cache.bump(PLANS)
     
     return {"plans": plans}
 
@@ -1969,6 +2015,7 @@ async def create_plan(data: PlanCreate, admin: dict = Depends(get_current_admin)
     }
     
     await db.pricing_plans.insert_one(plan_data)
+    await reference_cache.bump(PLANS)
     
     await log_audit("plan", data.id, "create", {"plan": data.display_name}, admin)
     
@@ -1998,6 +2045,7 @@ async def update_plan(plan_id: str, data: PlanCreate, admin: dict = Depends(get_
     }
     
     await db.pricing_plans.update_one({"id": plan_id}, {"$set": update_data})
+    await reference_cache.bump(PLANS)
     
     await log_audit("plan", plan_id, "update", {"changes": "Plan updated"}, admin)
     
@@ -2017,6 +2065,7 @@ async def toggle_plan_status(plan_id: str, admin: dict = Depends(get_current_adm
         {"id": plan_id},
         {"$set": {"is_active": new_status, "updated_at": datetime.utcnow().isoformat()}}
     )
+    await reference_cache.bump(PLANS)
     
     await log_audit("plan", plan_id, "toggle", {"is_active": new_status}, admin)
     
@@ -2025,24 +2074,29 @@ async def toggle_plan_status(plan_id: str, admin: dict = Depends(get_current_adm
 
 @api_router.get("/masters/public")
 async def get_public_masters(
+    request: Request,
+    response: Response,
     master_type: Optional[str] = None,
     q: Optional[str] = None,
     limit: int = Query(default=50, le=200)
 ):
     """Get active masters for public forms with optional search"""
-    query = {"is_active": True}
-    if master_type:
-        query["type"] = master_type
+    masters, etag = await reference_cache.get(MASTERS, "all", _load_masters)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
     
-    # Add search filter
+    masters = [m for m in masters if m.get("is_active") and (not master_type or m.get("type") == master_type)]
+    
+    # Search filter on name / code (case-insensitive substring)
     if q and q.strip():
-        search_regex = {"$regex": q.strip(), "$options": "i"}
-        query["$or"] = [
-            {"name": search_regex},
-            {"code": search_regex}
+        needle = q.strip().lower()
+        masters = [
+            m for m in masters
+            if needle in (m.get("name") or "").lower() or needle in (m.get("code") or "").lower()
         ]
     
-    masters = await db.masters.find(query, {"_id": 0}).sort("sort_order", 1).to_list(limit)
+    masters = sorted(masters, key=lambda m: m.get("sort_order", 0))[:limit]
     
     # Add label for SmartSelect compatibility
     for m in masters:
@@ -2070,10 +2124,7 @@ async def search_warranty(q: str):
     device = await db.devices.find_one(
         {"$and": [
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{q}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{q}$", "$options": "i"}}
-            ]}
+            device_identifier_query(q)
         ]},
         {"_id": 0}
     )
@@ -2223,10 +2274,7 @@ async def generate_warranty_pdf(serial_number: str):
     device = await db.devices.find_one(
         {"$and": [
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{serial_number}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{serial_number}$", "$options": "i"}}
-            ]}
+            device_identifier_query(serial_number)
         ]},
         {"_id": 0}
     )
@@ -2234,168 +2282,12 @@ async def generate_warranty_pdf(serial_number: str):
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    company = await db.companies.find_one({"id": device["company_id"]}, {"_id": 0, "name": 1})
-    company_name = company.get("name") if company else "Unknown"
-    
-    parts_cursor = db.parts.find({"device_id": device["id"], "is_deleted": {"$ne": True}}, {"_id": 0})
-    parts = []
-    async for part in parts_cursor:
-        parts.append(part)
-    
-    # P0 FIX: Check AMC from amc_device_assignments JOIN (not old amc collection)
-    active_amc_assignment = await db.amc_device_assignments.find_one({
-        "device_id": device["id"],
-        "status": "active"
-    }, {"_id": 0})
-    
-    amc_contract_info = None
-    if active_amc_assignment:
-        # Check if AMC coverage is still valid
-        if is_warranty_active(active_amc_assignment.get("coverage_end", "")):
-            # Get full AMC contract details
-            amc_contract = await db.amc_contracts.find_one({
-                "id": active_amc_assignment["amc_contract_id"],
-                "is_deleted": {"$ne": True}
-            }, {"_id": 0})
-            
-            if amc_contract:
-                amc_contract_info = {
-                    "name": amc_contract.get("name"),
-                    "amc_type": amc_contract.get("amc_type"),
-                    "coverage_start": active_amc_assignment.get("coverage_start"),
-                    "coverage_end": active_amc_assignment.get("coverage_end"),
-                    "coverage_includes": amc_contract.get("coverage_includes"),
-                    "entitlements": amc_contract.get("entitlements")
-                }
-    
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    portal_name = settings.get("company_name", "Warranty Portal") if settings else "Warranty Portal"
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=18, spaceAfter=20, textColor=colors.HexColor('#0F172A'))
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, spaceAfter=10, textColor=colors.HexColor('#0F172A'))
-    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, spaceAfter=5, textColor=colors.HexColor('#64748B'))
-    
-    story.append(Paragraph(f"{portal_name} - Warranty Report", title_style))
-    story.append(Paragraph(f"Generated: {get_ist_now().strftime('%d %B %Y, %H:%M')}", body_style))
-    story.append(Spacer(1, 20))
-    
-    story.append(Paragraph("Device Information", heading_style))
-    device_data = [
-        ["Device Type", device.get("device_type", "-")],
-        ["Brand", device.get("brand", "-")],
-        ["Model", device.get("model", "-")],
-        ["Serial Number", device.get("serial_number", "-")],
-        ["Asset Tag", device.get("asset_tag", "-") or "-"],
-        ["Company", company_name],
-        ["Purchase Date", device.get("purchase_date", "-")],
-        ["Condition", device.get("condition", "-").title()],
-        ["Warranty Expiry", device.get("warranty_end_date", "-") or "Not specified"],
-        ["Warranty Status", "Active" if is_warranty_active(device.get("warranty_end_date", "")) else "Expired / Not Covered"]
-    ]
-    
-    device_table = Table(device_data, colWidths=[2*inch, 4*inch])
-    device_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F8FAFC')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#0F172A')),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
-    ]))
-    story.append(device_table)
-    story.append(Spacer(1, 20))
-    
-    if parts:
-        story.append(Paragraph("Parts Warranty Status", heading_style))
-        parts_data = [["Part Name", "Replaced Date", "Warranty", "Expiry", "Status"]]
-        for part in parts:
-            status = "Active" if is_warranty_active(part.get("warranty_expiry_date", "")) else "Expired"
-            parts_data.append([
-                part.get("part_name", "-"),
-                part.get("replaced_date", "-"),
-                f"{part.get('warranty_months', 0)} months",
-                part.get("warranty_expiry_date", "-"),
-                status
-            ])
-        
-        parts_table = Table(parts_data, colWidths=[1.5*inch, 1.2*inch, 1*inch, 1.2*inch, 1*inch])
-        parts_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0F62FE')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ]))
-        story.append(parts_table)
-        story.append(Spacer(1, 20))
-    
-    story.append(Paragraph("AMC / Service Coverage", heading_style))
-    if amc_contract_info:
-        amc_type_display = (amc_contract_info.get("amc_type") or "standard").replace("_", " ").title()
-        coverage_includes = amc_contract_info.get("coverage_includes", {})
-        
-        # Build coverage details string
-        coverage_items = []
-        if coverage_includes.get("onsite_support"):
-            coverage_items.append("Onsite Support")
-        if coverage_includes.get("remote_support"):
-            coverage_items.append("Remote Support")
-        if coverage_includes.get("preventive_maintenance"):
-            coverage_items.append("Preventive Maintenance")
-        coverage_str = ", ".join(coverage_items) if coverage_items else "Standard Coverage"
-        
-        # Build entitlements string
-        entitlements = amc_contract_info.get("entitlements", {})
-        entitlement_items = []
-        if entitlements.get("onsite_visits_per_year"):
-            visits = entitlements["onsite_visits_per_year"]
-            entitlement_items.append(f"{visits} Onsite Visits/Year" if visits != -1 else "Unlimited Onsite Visits")
-        if entitlements.get("remote_support_count"):
-            remote = entitlements["remote_support_count"]
-            entitlement_items.append(f"{remote} Remote Support Sessions" if remote != -1 else "Unlimited Remote Support")
-        entitlement_str = ", ".join(entitlement_items) if entitlement_items else "-"
-        
-        amc_data = [
-            ["Contract Name", amc_contract_info.get("name", "-")],
-            ["AMC Type", amc_type_display],
-            ["Coverage Start", amc_contract_info.get("coverage_start", "-")],
-            ["Coverage End", amc_contract_info.get("coverage_end", "-")],
-            ["Status", "Active"],
-            ["Coverage Includes", coverage_str],
-            ["Entitlements", entitlement_str]
-        ]
-    else:
-        amc_data = [["Status", "No active AMC found for this device"]]
-    
-    amc_table = Table(amc_data, colWidths=[2*inch, 4*inch])
-    amc_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F8FAFC')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#0F172A')),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
-    ]))
-    story.append(amc_table)
-    story.append(Spacer(1, 30))
-    
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.HexColor('#94A3B8'))
-    story.append(Paragraph("This document is auto-generated and valid as of the date mentioned above.", footer_style))
-    story.append(Paragraph("For any discrepancies, please contact support.", footer_style))
-    
-    doc.build(story)
-    buffer.seek(0)
+    settings, _ = await reference_cache.get(SETTINGS, "settings", _load_settings)
+    pdf_bytes = await render_warranty_report(device, settings.get("company_name", "Warranty Portal"))
     
     filename = f"warranty_report_{serial_number}_{get_ist_now().strftime('%Y%m%d')}.pdf"
     return StreamingResponse(
-        buffer,
+        BytesIO(pdf_bytes),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -2427,6 +2319,7 @@ async def osticket_webhook(
 ):
     """
     Webhook endpoint for osTicket to sync ticket updates back to the portal.
+    The update is stored and applied in the background, in order per ticket (services.webhooks).
     
     Configure in osTicket:
     1. Go to Admin Panel → Manage → API Keys
@@ -2441,106 +2334,16 @@ async def osticket_webhook(
     
     logger.info(f"osTicket webhook received: ticket_id={payload.ticket_id}, event={payload.event_type}, status={payload.status}")
     
-    # Find ticket in our system by osticket_id
-    ticket = await db.service_tickets.find_one(
-        {"osticket_id": payload.ticket_id},
-        {"_id": 0}
-    )
-    
-    # Also check quick service requests
-    quick_request = None
-    if not ticket:
-        quick_request = await db.quick_service_requests.find_one(
-            {"osticket_id": payload.ticket_id},
-            {"_id": 0}
-        )
-    
-    if not ticket and not quick_request:
-        # Try to find by ticket number if provided
-        if payload.ticket_number:
-            ticket = await db.service_tickets.find_one(
-                {"ticket_number": {"$regex": payload.ticket_number, "$options": "i"}},
-                {"_id": 0}
-            )
-        
-        if not ticket:
-            logger.warning(f"osTicket webhook: Ticket not found for osticket_id={payload.ticket_id}")
-            return {"success": False, "message": "Ticket not found in portal"}
-    
-    # Map osTicket status to our status
-    status_mapping = {
-        "open": "open",
-        "new": "open",
-        "in progress": "in_progress",
-        "in-progress": "in_progress",
-        "pending": "pending",
-        "on hold": "on_hold",
-        "resolved": "resolved",
-        "closed": "closed",
-        "answered": "in_progress",
-        "overdue": "overdue"
-    }
-    
-    new_status = status_mapping.get(payload.status.lower() if payload.status else "", None)
-    
-    update_data = {
-        "updated_at": get_ist_isoformat()
-    }
-    
-    if new_status:
-        update_data["status"] = new_status
-        
-        # Set resolved/closed timestamps
-        if new_status == "resolved":
-            update_data["resolved_at"] = get_ist_isoformat()
-        elif new_status == "closed":
-            update_data["closed_at"] = get_ist_isoformat()
-    
-    # Add the reply/message as a comment if provided
-    if payload.last_message and payload.last_responder:
-        comment = {
-            "id": str(uuid.uuid4()),
-            "text": payload.last_message,
-            "author": payload.last_responder,
-            "author_type": "osticket_staff",
-            "created_at": get_ist_isoformat(),
-            "source": "osticket_webhook"
-        }
-        
-        if ticket:
-            await db.service_tickets.update_one(
-                {"id": ticket["id"]},
-                {
-                    "$set": update_data,
-                    "$push": {"comments": comment}
-                }
-            )
-        elif quick_request:
-            await db.quick_service_requests.update_one(
-                {"id": quick_request["id"]},
-                {"$set": {**update_data, "last_response": payload.last_message}}
-            )
-    else:
-        # Just update status
-        if ticket:
-            await db.service_tickets.update_one(
-                {"id": ticket["id"]},
-                {"$set": update_data}
-            )
-        elif quick_request:
-            await db.quick_service_requests.update_one(
-                {"id": quick_request["id"]},
-                {"$set": update_data}
-            )
-    
-    target = ticket or quick_request
-    logger.info(f"osTicket webhook: Updated ticket {target.get('ticket_number', target.get('id'))} with status={new_status}")
+    data = payload.model_dump()
+    # Only a timestamped payload identifies its delivery; without one, a repeated
+    # body is a real transition (e.g. a ticket reopened after closing)
+    event_id = payload_hash(data) if payload.updated_at else None
+    stored = await store_event(OSTICKET, event_id, payload.event_type, payload.ticket_id, data)
     
     return {
         "success": True,
-        "message": "Ticket updated successfully",
-        "portal_ticket_id": target.get("id"),
-        "new_status": new_status
+        "message": "Update accepted" if stored else "Update already received",
+        "duplicate": not stored
     }
 
 
@@ -2554,6 +2357,43 @@ async def test_osticket_webhook():
     }
 
 
+# ==================== OSTICKET OUTBOX ====================
+
+@api_router.get("/admin/osticket-outbox")
+async def list_osticket_outbox(
+    status: Optional[str] = None,
+    limit: int = Query(default=50, le=200),
+    admin: dict = Depends(get_current_admin)
+):
+    """Queued, delivered and dead-lettered osTicket tickets, with counts per status"""
+    if status and status not in OUTBOX_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(OUTBOX_STATUSES)}")
+    
+    query = {"status": status} if status else {}
+    entries = await db.osticket_outbox.find(
+        query,
+        {"_id": 0, "payload.message": 0}  # Rendered HTML bodies are large
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    
+    counts = {s: 0 for s in OUTBOX_STATUSES}
+    async for row in db.osticket_outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    
+    return {"counts": counts, "entries": entries}
+
+
+@api_router.post("/admin/osticket-outbox/{entry_id}/retry")
+async def retry_osticket_outbox_entry(entry_id: str, admin: dict = Depends(get_current_admin)):
+    """Requeue a dead-lettered osTicket ticket"""
+    entry = await retry_entry(entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Dead-lettered entry not found")
+    
+    await log_audit("osticket_outbox", entry_id, "retry", {"collection": entry["collection"], "record_id": entry["record_id"]}, admin)
+    entry["payload"].pop("message", None)
+    return entry
+
+
 # ==================== QR CODE & QUICK SERVICE REQUEST ====================
 
 class QuickServiceRequest(BaseModel):
@@ -2565,6 +2405,18 @@ class QuickServiceRequest(BaseModel):
     description: str
 
 
+def qr_frontend_url() -> str:
+    """Base URL of the public device page encoded in QR codes"""
+    frontend_url = os.environ.get('FRONTEND_URL', '')
+    if not frontend_url:
+        cors_origins = os.environ.get('CORS_ORIGINS', '')
+        if cors_origins and cors_origins != '*':
+            frontend_url = cors_origins.split(',')[0].strip()
+        else:
+            frontend_url = "https://your-portal-url.com"
+    return frontend_url
+
+
 @api_router.get("/device/{identifier}/qr")
 async def generate_device_qr_code(identifier: str):
     """
@@ -2572,20 +2424,11 @@ async def generate_device_qr_code(identifier: str):
     The QR code links to the public device info page.
     Includes Serial Number and Asset Tag below the QR code.
     """
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.utils import ImageReader
-    from PIL import Image
-    
     # Find device by serial number or asset tag
     device = await db.devices.find_one(
         {"$and": [
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{identifier}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{identifier}$", "$options": "i"}}
-            ]}
+            device_identifier_query(identifier)
         ]},
         {"_id": 0, "serial_number": 1, "asset_tag": 1, "brand": 1, "model": 1}
     )
@@ -2593,116 +2436,43 @@ async def generate_device_qr_code(identifier: str):
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    # Get frontend URL from environment or use default
-    frontend_url = os.environ.get('FRONTEND_URL', '')
-    if not frontend_url:
-        cors_origins = os.environ.get('CORS_ORIGINS', '')
-        if cors_origins and cors_origins != '*':
-            frontend_url = cors_origins.split(',')[0].strip()
-        else:
-            frontend_url = "https://your-portal-url.com"
-    
-    # Create QR code URL pointing to public device page
-    device_url = f"{frontend_url}/device/{device['serial_number']}"
+    frontend_url = qr_frontend_url()
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=1,
-    )
-    qr.add_data(device_url)
-    qr.make(fit=True)
-    
-    # Create QR image at high resolution for PDF
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    qr_img = qr_img.resize((300, 300), Image.Resampling.LANCZOS)  # High res for PDF
-    
-    # Convert PIL image to bytes for ReportLab
-    qr_buffer = BytesIO()
-    qr_img.save(qr_buffer, format='PNG')
-    qr_buffer.seek(0)
-    qr_reader = ImageReader(qr_buffer)
-    
-    # Create PDF
-    pdf_buffer = BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
-    page_width, page_height = A4
-    
-    # QR size: 1.5 inch x 1.5 inch
-    qr_size = 1.5 * inch
-    label_height = 0.4 * inch  # Space for text below QR
-    total_height = qr_size + label_height
-    
-    # Center the QR code on the page
-    x = (page_width - qr_size) / 2
-    y = (page_height - total_height) / 2 + label_height
-    
-    # Draw QR code
-    c.drawImage(qr_reader, x, y, width=qr_size, height=qr_size)
-    
-    # Draw border around QR (for cutting guide)
-    c.setStrokeColorRGB(0.8, 0.8, 0.8)
-    c.setLineWidth(0.5)
-    margin = 5
-    c.rect(x - margin, y - label_height - margin, qr_size + 2*margin, total_height + 2*margin)
-    
-    # Draw labels below QR
-    text_x = page_width / 2
-    
-    # Serial Number (bold)
-    c.setFont("Helvetica-Bold", 10)
-    c.drawCentredString(text_x, y - 15, f"S/N: {device.get('serial_number', 'N/A')}")
-    
-    # Asset Tag (if exists)
-    if device.get('asset_tag'):
-        c.setFont("Helvetica", 9)
-        c.drawCentredString(text_x, y - 28, f"Tag: {device['asset_tag']}")
-    
-    # Device info
-    device_info = f"{device.get('brand', '')} {device.get('model', '')}"
-    if device_info.strip():
-        c.setFont("Helvetica", 8)
-        c.setFillColorRGB(0.5, 0.5, 0.5)
-        c.drawCentredString(text_x, y - 40, device_info[:40])
-    
-    c.save()
-    pdf_buffer.seek(0)
+    # QR code URL pointing to public device page, rendered in the worker pool
+    pdf_bytes = await render_pool.run("qr_label", render_qr_label_pdf, {
+        "url": f"{frontend_url}/device/{device['serial_number']}",
+        "serial_number": device.get("serial_number"),
+        "asset_tag": device.get("asset_tag"),
+        "caption": f"{device.get('brand', '')} {device.get('model', '')}"
+    })
     
     filename = f"QR_{device.get('serial_number', identifier)}.pdf"
     
     return StreamingResponse(
-        pdf_buffer,
+        BytesIO(pdf_bytes),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
-class BulkQRRequest(BaseModel):
-    """Request body for bulk QR code generation"""
+class DeviceSelection(BaseModel):
+    """Devices targeted by a bulk operation"""
     device_ids: Optional[List[str]] = None  # Specific device IDs
     company_id: Optional[str] = None  # All devices from a company
     site_id: Optional[str] = None  # All devices from a site
 
 
-@api_router.post("/devices/bulk-qr-pdf")
-async def generate_bulk_qr_pdf(
-    request: BulkQRRequest,
-    admin: dict = Depends(get_current_admin)
-):
-    """
-    Generate a printable A4 PDF with multiple QR codes.
-    Each QR code is 1.5 inch x 1.5 inch with Serial Number and Asset Tag.
-    A4 paper fits 4 columns x 5 rows = 20 QR codes per page.
-    """
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.utils import ImageReader
-    from PIL import Image
-    
-    # Build query based on filters
+class BulkQRRequest(DeviceSelection):
+    """Request body for bulk QR code generation"""
+
+
+class WarrantyReportExportRequest(DeviceSelection):
+    """Request body for a bulk warranty report export"""
+    format: str = "zip"  # zip (one PDF per device) or pdf (single merged PDF)
+
+
+def device_selection_query(request: DeviceSelection) -> dict:
+    """Device filter for a bulk request: selected devices > site > company > all"""
     query = {"is_deleted": {"$ne": True}}
     
     if request.device_ids and len(request.device_ids) > 0:
@@ -2711,127 +2481,10 @@ async def generate_bulk_qr_pdf(
         query["site_id"] = request.site_id
     elif request.company_id:
         query["company_id"] = request.company_id
-    
-    # Fetch devices
-    devices = await db.devices.find(
-        query,
-        {"_id": 0, "id": 1, "serial_number": 1, "asset_tag": 1, "brand": 1, "model": 1}
-    ).sort("serial_number", 1).to_list(500)
-    
-    if not devices:
-        raise HTTPException(status_code=404, detail="No devices found matching criteria")
-    
-    # Get frontend URL for QR codes
-    frontend_url = os.environ.get('FRONTEND_URL', '')
-    if not frontend_url:
-        cors_origins = os.environ.get('CORS_ORIGINS', '')
-        if cors_origins and cors_origins != '*':
-            frontend_url = cors_origins.split(',')[0].strip()
-        else:
-            frontend_url = "https://your-portal-url.com"
-    
-    # PDF settings - Fixed 1.5 inch QR codes
-    page_width, page_height = A4  # 595 x 842 points (8.27 x 11.69 inches)
-    
-    # QR code size: 1.5 inch x 1.5 inch
-    qr_size = 1.5 * inch  # 108 points
-    label_height = 0.35 * inch  # Space for text below QR
-    cell_padding = 0.15 * inch  # Padding between cells
-    
-    cell_width = qr_size + cell_padding
-    cell_height = qr_size + label_height + cell_padding
-    
-    # Calculate grid: how many fit on A4
-    margin_x = (page_width - (4 * cell_width)) / 2  # Center 4 columns
-    margin_y = 0.5 * inch  # Top/bottom margin
-    
-    columns = 4  # 4 columns of 1.5 inch QR codes fit on A4 width
-    rows_per_page = 5  # 5 rows fit on A4 height
-    
-    # Create PDF
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    
-    current_row = 0
-    current_col = 0
-    
-    for device in devices:
-        # Calculate position
-        x = margin_x + (current_col * cell_width)
-        y = page_height - margin_y - ((current_row + 1) * cell_height)
-        
-        # Generate QR code for this device
-        device_url = f"{frontend_url}/device/{device['serial_number']}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(device_url)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_img = qr_img.resize((300, 300), Image.Resampling.LANCZOS)  # High res for print
-        
-        # Convert PIL image to ReportLab ImageReader
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        qr_reader = ImageReader(qr_buffer)
-        
-        # Draw QR code (1.5 inch x 1.5 inch)
-        qr_x = x + (cell_width - qr_size) / 2
-        qr_y = y + label_height
-        c.drawImage(qr_reader, qr_x, qr_y, width=qr_size, height=qr_size)
-        
-        # Draw labels below QR
-        serial = device.get('serial_number', 'N/A')
-        asset_tag = device.get('asset_tag', '')
-        text_x = x + cell_width / 2
-        
-        # Serial Number (bold)
-        c.setFont("Helvetica-Bold", 7)
-        c.setFillColorRGB(0, 0, 0)
-        serial_display = serial if len(serial) <= 20 else serial[:17] + "..."
-        c.drawCentredString(text_x, y + label_height - 12, f"S/N: {serial_display}")
-        
-        # Asset Tag (if exists)
-        if asset_tag:
-            c.setFont("Helvetica", 6)
-            c.setFillColorRGB(0.3, 0.3, 0.3)
-            tag_display = asset_tag if len(asset_tag) <= 20 else asset_tag[:17] + "..."
-            c.drawCentredString(text_x, y + label_height - 22, f"Tag: {tag_display}")
-        
-        # Draw cutting guide border
-        c.setStrokeColorRGB(0.85, 0.85, 0.85)
-        c.setLineWidth(0.5)
-        c.rect(x + 2, y + 2, cell_width - 4, cell_height - 4)
-        
-        # Reset fill color
-        c.setFillColorRGB(0, 0, 0)
-        
-        # Move to next cell
-        current_col += 1
-        if current_col >= columns:
-            current_col = 0
-            current_row += 1
-            
-            # Check if we need a new page
-            if current_row >= rows_per_page:
-                c.showPage()
-                current_row = 0
-    
-    # Footer with generation info
-    c.setFont("Helvetica", 7)
-    c.setFillColorRGB(0.5, 0.5, 0.5)
-    c.drawString(margin_x, 12, f"Generated: {get_ist_now().strftime('%Y-%m-%d %H:%M')} | {len(devices)} QR codes | Size: 1.5\" x 1.5\"")
-    
-    c.save()
-    buffer.seek(0)
-    
-    # Generate filename
-    filename_parts = ["QR_Codes"]
+    return query
+
+async def device_selection_filename(prefix: str, request: DeviceSelection, extension: str) -> str:
+    filename_parts = [prefix]
     if request.company_id:
         company = await db.companies.find_one({"id": request.company_id}, {"_id": 0, "name": 1})
         if company:
@@ -2842,15 +2495,101 @@ async def generate_bulk_qr_pdf(
             filename_parts.append(site["name"].replace(" ", "_")[:20])
     
     filename_parts.append(get_ist_now().strftime('%Y%m%d'))
-    filename = "_".join(filename_parts) + ".pdf"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    return "_".join(filename_parts) + f".{extension}"
+
+
+@api_router.post("/devices/bulk-qr-pdf")
+async def generate_bulk_qr_pdf(
+    request: BulkQRRequest,
+    admin: dict = Depends(get_current_admin)
+):
+    """
+    Retired: the inline sheet was capped at 500 devices and built in memory.
+    Bulk QR sheets are rendered by POST /devices/bulk-qr-jobs.
+    """
+    raise HTTPException(
+        status_code=410,
+        detail="Bulk QR PDFs are generated as jobs: POST /api/devices/bulk-qr-jobs, then download the finished job"
     )
 
 
+@api_router.post("/devices/bulk-qr-jobs", status_code=202)
+async def submit_bulk_qr_job(
+    request: BulkQRRequest,
+    admin: dict = Depends(get_current_admin)
+):
+    """
+    Start rendering QR label sheets for any number of devices in the background.
+    Poll GET /devices/bulk-qr-jobs/{job_id} and download the PDF when completed.
+    """
+    query = device_selection_query(request)
+    total = await db.devices.count_documents(query)
+    if not total:
+        raise HTTPException(status_code=404, detail="No devices found matching criteria")
+    
+    purge_expired_job_files()
+    job = await create_job(QR_LABELS, admin["email"], total, await device_selection_filename("QR_Codes", request, "pdf"))
+    start_job(run_qr_label_job(job["id"], query, qr_frontend_url()))
+    return job
+
+
+@api_router.get("/devices/bulk-qr-jobs/{job_id}")
+async def get_bulk_qr_job(job_id: str, admin: dict = Depends(get_current_admin)):
+    """Progress of a bulk QR job (status, processed / total, progress %)"""
+    return await get_job(job_id, admin["email"], QR_LABELS)
+
+
+@api_router.get("/devices/bulk-qr-jobs/{job_id}/download")
+async def download_bulk_qr_job(job_id: str, request: Request, admin: dict = Depends(get_current_admin)):
+    """Download a completed bulk QR PDF (supports Range requests)"""
+    job = await get_job(job_id, admin["email"], QR_LABELS, include_file=True)
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job_file_response(request, job, "application/pdf")
+
+
+@api_router.post("/admin/warranty-reports/jobs", status_code=202)
+async def submit_warranty_report_export(
+    request: WarrantyReportExportRequest,
+    admin: dict = Depends(get_current_admin)
+):
+    """
+    Export warranty reports for a company, site or list of devices in the
+    background, as a ZIP of per-device PDFs or one merged PDF.
+    Poll GET /admin/warranty-reports/jobs/{job_id} for progress.
+    """
+    if request.format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="format must be 'zip' or 'pdf'")
+    
+    query = device_selection_query(request)
+    total = await db.devices.count_documents(query)
+    if not total:
+        raise HTTPException(status_code=404, detail="No devices found matching criteria")
+    
+    settings, _ = await reference_cache.get(SETTINGS, "settings", _load_settings)
+    purge_expired_job_files()
+    filename = await device_selection_filename("Warranty_Reports", request, request.format)
+    job = await create_job(WARRANTY_REPORTS, admin["email"], total, filename)
+    start_job(run_warranty_report_job(job["id"], query, request.format, settings.get("company_name", "Warranty Portal")))
+    return job
+
+
+@api_router.get("/admin/warranty-reports/jobs/{job_id}")
+async def get_warranty_report_export(job_id: str, admin: dict = Depends(get_current_admin)):
+    """Progress of a warranty report export (status, processed / total, progress %)"""
+    return await get_job(job_id, admin["email"], WARRANTY_REPORTS)
+
+
+@api_router.get("/admin/warranty-reports/jobs/{job_id}/download")
+async def download_warranty_report_export(job_id: str, request: Request, admin: dict = Depends(get_current_admin)):
+    """Download a completed warranty report export (supports Range requests)"""
+    job = await get_job(job_id, admin["email"], WARRANTY_REPORTS, include_file=True)
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    media_type = "application/zip" if job["filename"].endswith(".zip") else "application/pdf"
+    return job_file_response(request, job, media_type)
+
+
 @api_router.get("/device/{identifier}/info")
 async def get_public_device_info(identifier: str):
     """
@@ -2861,10 +2600,7 @@ async def get_public_device_info(identifier: str):
     device = await db.devices.find_one(
         {"$and": [
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{identifier}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{identifier}$", "$options": "i"}}
-            ]}
+            device_identifier_query(identifier)
         ]},
         {"_id": 0}
     )
@@ -2973,10 +2709,7 @@ async def create_quick_service_request(identifier: str, request: QuickServiceReq
     device = await db.devices.find_one(
         {"$and": [
             {"is_deleted": {"$ne": True}},
-            {"$or": [
-                {"serial_number": {"$regex": f"^{identifier}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{identifier}$", "$options": "i"}}
-            ]}
+            device_identifier_query(identifier)
         ]},
         {"_id": 0}
     )
@@ -3014,8 +2747,10 @@ async def create_quick_service_request(identifier: str, request: QuickServiceReq
     # Store in database
     await db.quick_service_requests.insert_one(quick_request)
     
-    # Create osTicket if configured
-    osticket_result = await create_osticket(
+    # Queue the osTicket ticket; the outbox dispatcher sends it in the background
+    outbox_entry = await enqueue_osticket(
+        "quick_service_requests",
+        quick_request["id"],
         email=request.email,
         name=request.name,
         subject=f"[Quick Request] {request.issue_category.title()} Issue - {device.get('brand')} {device.get('model')}",
@@ -3050,17 +2785,12 @@ async def create_quick_service_request(identifier: str, request: QuickServiceReq
         phone=request.phone or ""
     )
     
-    if osticket_result.get("ticket_id"):
-        await db.quick_service_requests.update_one(
-            {"id": quick_request["id"]},
-            {"$set": {"osticket_id": osticket_result["ticket_id"]}}
-        )
-    
     return {
         "success": True,
         "ticket_number": ticket_number,
         "message": "Your service request has been submitted successfully. Our team will contact you shortly.",
-        "osticket_id": osticket_result.get("ticket_id"),
+        "osticket_id": None,
+        "osticket_status": "queued" if outbox_entry else None,
         "device": {
             "brand": device.get("brand"),
             "model": device.get("model"),
@@ -3110,15 +2840,22 @@ async def setup_first_admin(admin_data: AdminCreate):
 # ==================== MASTER DATA ENDPOINTS ====================
 
 @api_router.get("/admin/masters")
-async def list_masters(master_type: Optional[str] = None, include_inactive: bool = False, admin: dict = Depends(get_current_admin)):
-    query = {}
-    if master_type:
-        query["type"] = master_type
-    if not include_inactive:
-        query["is_active"] = True
+async def list_masters(
+    request: Request,
+    response: Response,
+    master_type: Optional[str] = None,
+    include_inactive: bool = False,
+    admin: dict = Depends(get_current_admin)
+):
+    masters, etag = await reference_cache.get(MASTERS, "all", _load_masters)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
     
-    masters = await db.masters.find(query, {"_id": 0}).sort([("type", 1), ("sort_order", 1)]).to_list(1000)
-    return masters
+    return [
+        m for m in masters
+        if (not master_type or m.get("type") == master_type) and (include_inactive or m.get("is_active"))
+    ][:1000]
 
 @api_router.post("/admin/masters")
 async def create_master(item: MasterItemCreate, admin: dict = Depends(get_current_admin)):
@@ -3129,6 +2866,7 @@ async def create_master(item: MasterItemCreate, admin: dict = Depends(get_curren
     
     master = MasterItem(**item.model_dump())
     await db.masters.insert_one(master.model_dump())
+    await reference_cache.bump(MASTERS)
     await log_audit("master", master.id, "create", {"data": item.model_dump()}, admin)
     return master.model_dump()
 
@@ -3151,6 +2889,7 @@ async def update_master(master_id: str, updates: MasterItemUpdate, admin: dict =
     result = await db.masters.update_one({"id": master_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Master item not found")
+    await reference_cache.bump(MASTERS)
     
     await log_audit("master", master_id, "update", changes, admin)
     return await db.masters.find_one({"id": master_id}, {"_id": 0})
@@ -3161,6 +2900,7 @@ async def disable_master(master_id: str, admin: dict = Depends(get_current_admin
     result = await db.masters.update_one({"id": master_id}, {"$set": {"is_active": False}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Master item not found")
+    await reference_cache.bump(MASTERS)
     
     await log_audit("master", master_id, "disable", {"is_active": {"old": True, "new": False}}, admin)
     return {"message": "Master item disabled"}
@@ -3188,6 +2928,7 @@ async def quick_create_master(item: MasterItemCreate, admin: dict = Depends(get_
     master_data["sort_order"] = next_order
     master = MasterItem(**master_data)
     await db.masters.insert_one(master.model_dump())
+    await reference_cache.bump(MASTERS)
     await log_audit("master", master.id, "quick_create", {"data": item.model_dump()}, admin)
     
     result = master.model_dump()
@@ -3232,6 +2973,7 @@ async def create_company(company_data: CompanyCreate, admin: dict = Depends(get_
     company_dict = {k: v for k, v in company_data.model_dump().items() if v is not None}
     company = Company(**company_dict)
     await db.companies.insert_one(company.model_dump())
+    await sync_entities("companies", company.id)
     await log_audit("company", company.id, "create", {"data": company_data.model_dump()}, admin)
     result = company.model_dump()
     result["label"] = result["name"]
@@ -3254,6 +2996,7 @@ async def quick_create_company(company_data: CompanyCreate, admin: dict = Depend
     company_dict = {k: v for k, v in company_data.model_dump().items() if v is not None}
     company = Company(**company_dict)
     await db.companies.insert_one(company.model_dump())
+    await sync_entities("companies", company.id)
     await log_audit("company", company.id, "quick_create", {"data": company_data.model_dump()}, admin)
     
     result = company.model_dump()
@@ -3283,6 +3026,8 @@ async def update_company(company_id: str, updates: CompanyUpdate, admin: dict =
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Company not found")
     
+    await sync_entities("companies", company_id)
+    await warranty_pdf_cache.invalidate(company_id=company_id)
     await log_audit("company", company_id, "update", changes, admin)
     return await db.companies.find_one({"id": company_id}, {"_id": 0})
 
@@ -3294,244 +3039,95 @@ async def delete_company(company_id: str, admin: dict = Depends(get_current_admi
     
     # Soft delete related users
     await db.users.update_many({"company_id": company_id}, {"$set": {"is_deleted": True}})
+    await sync_entities("companies", company_id)
+    await warranty_pdf_cache.invalidate(company_id=company_id)
+    await sync_matching("users", {"company_id": company_id})
     await log_audit("company", company_id, "delete", {"is_deleted": True}, admin)
     return {"message": "Company archived"}
 
 # ==================== BULK IMPORT ENDPOINTS ====================
 
-@api_router.post("/admin/bulk-import/companies")
-async def bulk_import_companies(data: dict, admin: dict = Depends(get_current_admin)):
-    """Bulk import companies from CSV data"""
+def _bulk_import_mode(mode: Optional[str]) -> str:
+    mode = mode or "insert"
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode. Use one of: {', '.join(IMPORT_MODES)}")
+    return mode
+
+async def _bulk_import_records(kind: str, data: dict) -> dict:
+    """
+    Import {"records": [...], "mode": "insert" | "upsert"}. Upsert matches
+    existing records on their natural key and reports each row as created,
+    updated or unchanged.
+    """
     records = data.get("records", [])
     if not records:
         raise HTTPException(status_code=400, detail="No records provided")
+    mode = _bulk_import_mode(data.get("mode"))
     
-    success_count = 0
-    errors = []
-    
-    for idx, record in enumerate(records):
-        try:
-            # Check required fields
-            if not record.get("name"):
-                errors.append({"row": idx + 2, "message": "Company name is required"})
-                continue
-            
-            # Check for duplicate company code (field is 'code' in Company model)
-            company_code = record.get("company_code") or record.get("code")
-            if company_code:
-                existing = await db.companies.find_one({
-                    "code": company_code,
-                    "is_deleted": {"$ne": True}
-                })
-                if existing:
-                    errors.append({"row": idx + 2, "message": f"Company code {company_code} already exists"})
-                    continue
-            
-            company = Company(
-                name=record.get("name"),
-                code=company_code or f"C{str(uuid.uuid4())[:6].upper()}",
-                industry=record.get("industry"),
-                contact_name=record.get("contact_name"),
-                contact_email=record.get("contact_email"),
-                contact_phone=record.get("contact_phone"),
-                address=record.get("address"),
-                city=record.get("city"),
-                state=record.get("state"),
-                country=record.get("country", "India"),
-                pincode=record.get("pincode"),
-                gst_number=record.get("gst_number"),
-                notes=record.get("notes"),
-                status="active"
-            )
-            
-            await db.companies.insert_one(company.model_dump())
-            success_count += 1
-            
-        except Exception as e:
-            errors.append({"row": idx + 2, "message": str(e)})
-    
-    return {"success": success_count, "errors": errors}
+    importer = await create_import(kind, mode)
+    await importer.add(records)
+    return importer.result()
+
+@api_router.post("/admin/bulk-import/companies")
+async def bulk_import_companies(data: dict, admin: dict = Depends(get_current_admin)):
+    """Bulk import companies from CSV data"""
+    return await _bulk_import_records("companies", data)
 
 @api_router.post("/admin/bulk-import/sites")
 async def bulk_import_sites(data: dict, admin: dict = Depends(get_current_admin)):
     """Bulk import sites from CSV data"""
-    records = data.get("records", [])
-    if not records:
-        raise HTTPException(status_code=400, detail="No records provided")
-    
-    # Get company mapping by code and name
-    companies = await db.companies.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(1000)
-    company_by_code = {c.get("code", "").upper(): c["id"] for c in companies if c.get("code")}
-    company_by_name = {c["name"].lower(): c["id"] for c in companies}
-    
-    success_count = 0
-    errors = []
-    
-    for idx, record in enumerate(records):
-        try:
-            if not record.get("name"):
-                errors.append({"row": idx + 2, "message": "Site name is required"})
-                continue
-            
-            # Find company by code or name
-            company_id = None
-            if record.get("company_code"):
-                company_id = company_by_code.get(record["company_code"].upper())
-            if not company_id and record.get("company_name"):
-                company_id = company_by_name.get(record["company_name"].lower())
-            
-            if not company_id:
-                errors.append({"row": idx + 2, "message": "Company not found"})
-                continue
-            
-            site = Site(
-                company_id=company_id,
-                name=record.get("name"),
-                site_code=record.get("site_code"),
-                address=record.get("address"),
-                city=record.get("city"),
-                state=record.get("state"),
-                pincode=record.get("pincode"),
-                country=record.get("country", "India"),
-                contact_person=record.get("contact_person"),
-                contact_phone=record.get("contact_phone"),
-                contact_email=record.get("contact_email"),
-                notes=record.get("notes"),
-                status="active"
-            )
-            
-            await db.sites.insert_one(site.model_dump())
-            success_count += 1
-            
-        except Exception as e:
-            errors.append({"row": idx + 2, "message": str(e)})
-    
-    return {"success": success_count, "errors": errors}
+    return await _bulk_import_records("sites", data)
 
 @api_router.post("/admin/bulk-import/devices")
 async def bulk_import_devices(data: dict, admin: dict = Depends(get_current_admin)):
     """Bulk import devices from CSV data"""
-    records = data.get("records", [])
-    if not records:
-        raise HTTPException(status_code=400, detail="No records provided")
-    
-    # Get lookups
-    companies = await db.companies.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(1000)
-    company_by_code = {c.get("code", "").upper(): c["id"] for c in companies if c.get("code")}
-    company_by_name = {c["name"].lower(): c["id"] for c in companies}
-    
-    success_count = 0
-    errors = []
-    
-    for idx, record in enumerate(records):
-        try:
-            # Required fields
-            if not record.get("serial_number"):
-                errors.append({"row": idx + 2, "message": "Serial number is required"})
-                continue
-            if not record.get("brand"):
-                errors.append({"row": idx + 2, "message": "Brand is required"})
-                continue
-            if not record.get("model"):
-                errors.append({"row": idx + 2, "message": "Model is required"})
-                continue
-            
-            # Find company
-            company_id = None
-            if record.get("company_code"):
-                company_id = company_by_code.get(record["company_code"].upper())
-            if not company_id and record.get("company_name"):
-                company_id = company_by_name.get(record["company_name"].lower())
-            
-            if not company_id:
-                errors.append({"row": idx + 2, "message": "Company not found"})
-                continue
-            
-            # Check for duplicate serial number
-            existing = await db.devices.find_one({
-                "serial_number": record["serial_number"],
-                "is_deleted": {"$ne": True}
-            })
-            if existing:
-                errors.append({"row": idx + 2, "message": f"Serial number {record['serial_number']} already exists"})
-                continue
-            
-            device = Device(
-                company_id=company_id,
-                device_type=record.get("device_type", "Laptop"),
-                brand=record.get("brand"),
-                model=record.get("model"),
-                serial_number=record.get("serial_number"),
-                asset_tag=record.get("asset_tag"),
-                purchase_date=record.get("purchase_date", get_ist_isoformat().split("T")[0]),
-                purchase_cost=float(record["purchase_cost"]) if record.get("purchase_cost") else None,
-                vendor=record.get("vendor"),
-                warranty_end_date=record.get("warranty_end_date"),
-                location=record.get("location"),
-                condition=record.get("condition", "good"),
-                status=record.get("status", "active"),
-                notes=record.get("notes")
-            )
-            
-            await db.devices.insert_one(device.model_dump())
-            success_count += 1
-            
-        except Exception as e:
-            errors.append({"row": idx + 2, "message": str(e)})
-    
-    return {"success": success_count, "errors": errors}
+    return await _bulk_import_records("devices", data)
 
 @api_router.post("/admin/bulk-import/supply-products")
 async def bulk_import_supply_products(data: dict, admin: dict = Depends(get_current_admin)):
     """Bulk import supply products from CSV data"""
-    records = data.get("records", [])
-    if not records:
-        raise HTTPException(status_code=400, detail="No records provided")
-    
-    # Get category mapping
-    categories = await db.supply_categories.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(100)
-    category_by_name = {c["name"].lower(): c["id"] for c in categories}
-    
-    success_count = 0
-    errors = []
-    
-    for idx, record in enumerate(records):
-        try:
-            if not record.get("name"):
-                errors.append({"row": idx + 2, "message": "Product name is required"})
-                continue
-            
-            # Find category
-            category_id = None
-            if record.get("category"):
-                category_id = category_by_name.get(record["category"].lower())
-            
-            if not category_id:
-                # Create category if it doesn't exist
-                if record.get("category"):
-                    new_cat = SupplyCategory(name=record["category"])
-                    await db.supply_categories.insert_one(new_cat.model_dump())
-                    category_id = new_cat.id
-                    category_by_name[record["category"].lower()] = category_id
-                else:
-                    errors.append({"row": idx + 2, "message": "Category is required"})
-                    continue
-            
-            product = SupplyProduct(
-                category_id=category_id,
-                name=record.get("name"),
-                description=record.get("description"),
-                unit=record.get("unit", "piece"),
-                internal_notes=record.get("internal_notes")
-            )
-            
-            await db.supply_products.insert_one(product.model_dump())
-            success_count += 1
-            
-        except Exception as e:
-            errors.append({"row": idx + 2, "message": str(e)})
-    
-    return {"success": success_count, "errors": errors}
+    return await _bulk_import_records("supply-products", data)
+
+@api_router.post("/admin/bulk-import/{kind}/upload")
+async def bulk_import_upload(
+    kind: str,
+    file: UploadFile = File(...),
+    mode: str = Query("insert"),
+    admin: dict = Depends(get_current_admin)
+):
+    """
+    Bulk import from an uploaded CSV / XLSX file (mode insert or upsert).
+    The file is parsed and imported chunk by chunk; the response streams
+    NDJSON progress, one line per chunk, ending with a line that has
+    "done": true and the result.
+    """
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown import type")
+    mode = _bulk_import_mode(mode)
+    extension = spreadsheet_extension(file.filename)
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Upload a .csv or .xlsx file.")
+    
+    # Copy the upload to a file of our own: form files are closed before the response streams
+    max_bytes = BULK_IMPORT_MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=extension, prefix="bulk-import-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(1024 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=400, detail=f"File too large. Maximum {BULK_IMPORT_MAX_UPLOAD_MB}MB.")
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    
+    logger.info(f"Bulk import upload: {kind} ({mode}) from {file.filename} ({size} bytes) by {admin.get('email')}")
+    return StreamingResponse(
+        stream_upload_import(kind, path, file.filename, mode),
+        media_type="application/x-ndjson"
+    )
 
 @api_router.get("/admin/companies/{company_id}/overview")
 async def get_company_overview(company_id: str, admin: dict = Depends(get_current_admin)):
@@ -3542,71 +3138,82 @@ async def get_company_overview(company_id: str, admin: dict = Depends(get_curren
         raise HTTPException(status_code=404, detail="Company not found")
     
     # Get all related data in parallel
-    devices_cursor = db.devices.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    devices = await devices_cursor.to_list(500)
+    company_query = {"company_id": company_id, "is_deleted": {"$ne": True}}
+    devices, sites, users, deployments, licenses, amc_contracts = await asyncio.gather(
+        db.devices.find(company_query, {"_id": 0}).to_list(500),
+        db.sites.find(company_query, {"_id": 0}).to_list(100),
+        db.users.find(company_query, {"_id": 0}).to_list(500),
+        db.deployments.find(company_query, {"_id": 0}).to_list(100),
+        db.licenses.find(company_query, {"_id": 0}).to_list(100),
+        db.amc_contracts.find(company_query, {"_id": 0}).to_list(50)
+    )
+    
+    device_ids = [d["id"] for d in devices]
+    contract_ids = [a["id"] for a in amc_contracts]
+    sites_by_id = {s["id"]: s for s in sites}
+    missing_site_ids = list({dep.get("site_id") for dep in deployments} - set(sites_by_id) - {None})
+    
+    async def fetch_services():
+        # Service history for this company's devices
+        if not device_ids:
+            return []
+        return await db.service_history.find({
+            "device_id": {"$in": device_ids},
+            "is_deleted": {"$ne": True}
+        }, {"_id": 0}).sort("service_date", -1).limit(100).to_list(100)
+    
+    async def fetch_extra_sites():
+        # Deployment sites beyond the first 100 fetched above
+        if not missing_site_ids:
+            return []
+        return await db.sites.find({"id": {"$in": missing_site_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    
+    # Second round: everything keyed by the ids fetched above, again in parallel
+    assignments, coverage_counts, services, extra_sites = await asyncio.gather(
+        db.amc_device_assignments.aggregate([
+            {"$match": {"device_id": {"$in": device_ids}, "status": "active"}},
+            {"$group": {"_id": "$device_id", "coverage_end": {"$first": "$coverage_end"}}}
+        ]).to_list(None),
+        db.amc_device_assignments.aggregate([
+            {"$match": {"amc_contract_id": {"$in": contract_ids}, "status": "active"}},
+            {"$group": {"_id": "$amc_contract_id", "count": {"$sum": 1}}}
+        ]).to_list(None),
+        fetch_services(),
+        fetch_extra_sites()
+    )
+    coverage_end_by_device = {a["_id"]: a.get("coverage_end") for a in assignments}
+    devices_covered_by_contract = {c["_id"]: c["count"] for c in coverage_counts}
+    sites_by_id.update({s["id"]: s for s in extra_sites})
     
     # Enrich devices with warranty status
     for device in devices:
         device["warranty_active"] = is_warranty_active(device.get("warranty_end_date", ""))
         # Check AMC status
-        amc_assignment = await db.amc_device_assignments.find_one({
-            "device_id": device["id"],
-            "status": "active"
-        }, {"_id": 0})
-        if amc_assignment and is_warranty_active(amc_assignment.get("coverage_end", "")):
+        coverage_end = coverage_end_by_device.get(device["id"])
+        if coverage_end and is_warranty_active(coverage_end):
             device["amc_status"] = "active"
-            device["amc_coverage_end"] = amc_assignment.get("coverage_end")
+            device["amc_coverage_end"] = coverage_end
         else:
             device["amc_status"] = "none"
     
-    # Get sites
-    sites_cursor = db.sites.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    sites = await sites_cursor.to_list(100)
-    
-    # Get users/contacts
-    users_cursor = db.users.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    users = await users_cursor.to_list(500)
-    
-    # Get deployments
-    deployments_cursor = db.deployments.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    deployments = await deployments_cursor.to_list(100)
     for dep in deployments:
-        site = await db.sites.find_one({"id": dep.get("site_id")}, {"_id": 0, "name": 1})
+        site = sites_by_id.get(dep.get("site_id"))
         dep["site_name"] = site.get("name") if site else "Unknown"
         dep["items_count"] = len(dep.get("items", []))
     
-    # Get licenses
-    licenses_cursor = db.licenses.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    licenses = await licenses_cursor.to_list(100)
     for lic in licenses:
         lic["is_expired"] = not is_warranty_active(lic.get("end_date", ""))
     
-    # Get AMC contracts
-    amc_cursor = db.amc_contracts.find({"company_id": company_id, "is_deleted": {"$ne": True}}, {"_id": 0})
-    amc_contracts = await amc_cursor.to_list(50)
     for amc in amc_contracts:
         amc["is_active"] = is_warranty_active(amc.get("end_date", ""))
         # Count devices covered
-        device_count = await db.amc_device_assignments.count_documents({
-            "amc_contract_id": amc["id"],
-            "status": "active"
-        })
-        amc["devices_covered"] = device_count
+        amc["devices_covered"] = devices_covered_by_contract.get(amc["id"], 0)
     
-    # Get service history
-    # First get all device IDs for this company
-    device_ids = [d["id"] for d in devices]
-    services = []
-    if device_ids:
-        services_cursor = db.service_history.find({
-            "device_id": {"$in": device_ids},
-            "is_deleted": {"$ne": True}
-        }, {"_id": 0}).sort("service_date", -1).limit(100)
-        services = await services_cursor.to_list(100)
-        for svc in services:
-            device = next((d for d in devices if d["id"] == svc.get("device_id")), None)
-            if device:
-                svc["device_info"] = f"{device.get('brand', '')} {device.get('model', '')} ({device.get('serial_number', '')})"
+    devices_by_id = {d["id"]: d for d in devices}
+    for svc in services:
+        device = devices_by_id.get(svc.get("device_id"))
+        if device:
+            svc["device_info"] = f"{device.get('brand', '')} {device.get('model', '')} ({device.get('serial_number', '')})"
     
     # Calculate summary stats
     summary = {
@@ -3708,6 +3315,7 @@ async def delete_company_portal_user(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Portal user not found")
     
+    principal_cache.invalidate(COMPANY_USER, user_id)
     return {"message": "Portal user deleted"}
 
 @api_router.put("/admin/companies/{company_id}/portal-users/{user_id}/reset-password")
@@ -3777,6 +3385,7 @@ async def create_user(user_data: UserCreate, admin: dict = Depends(get_current_a
     
     user = User(**user_data.model_dump())
     await db.users.insert_one(user.model_dump())
+    await sync_entities("users", user.id)
     await log_audit("user", user.id, "create", {"data": user_data.model_dump()}, admin)
     result = user.model_dump()
     result["label"] = result["name"]
@@ -3800,6 +3409,7 @@ async def quick_create_user(user_data: UserCreate, admin: dict = Depends(get_cur
     
     user = User(**user_data.model_dump())
     await db.users.insert_one(user.model_dump())
+    await sync_entities("users", user.id)
     await log_audit("user", user.id, "quick_create", {"data": user_data.model_dump()}, admin)
     
     result = user.model_dump()
@@ -3826,6 +3436,7 @@ async def update_user(user_id: str, updates: UserUpdate, admin: dict = Depends(g
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
     
     result = await db.users.update_one({"id": user_id}, {"$set": update_data})
+    await sync_entities("users", user_id)
     await log_audit("user", user_id, "update", changes, admin)
     return await db.users.find_one({"id": user_id}, {"_id": 0})
 
@@ -3834,13 +3445,25 @@ async def delete_user(user_id: str, admin: dict = Depends(get_current_admin)):
     result = await db.users.update_one({"id": user_id}, {"$set": {"is_deleted": True}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await sync_entities("users", user_id)
     await log_audit("user", user_id, "delete", {"is_deleted": True}, admin)
     return {"message": "User archived"}
 
 # ==================== ADMIN ENDPOINTS - DEVICES ====================
 
+def _lookup_first(collection: str, local_field: str, as_field: str, fields: list, match: Optional[dict] = None, nested: Optional[list] = None) -> dict:
+    """$lookup stage joining one document on `id` and keeping only `fields`"""
+    pipeline = [
+        {"$match": {"$expr": {"$eq": ["$id", "$$key"]}, **(match or {})}},
+        {"$limit": 1},
+        *(nested or []),
+        {"$project": {"_id": 0, **{f: 1 for f in fields}}}
+    ]
+    return {"$lookup": {"from": collection, "let": {"key": f"${local_field}"}, "pipeline": pipeline, "as": as_field}}
+
 @api_router.get("/admin/devices")
 async def list_devices(
+    response: Response,
     company_id: Optional[str] = None, 
     status: Optional[str] = None,
     amc_status: Optional[str] = None,  # Filter by AMC status: active, none, expired
@@ -3849,7 +3472,11 @@ async def list_devices(
     page: int = Query(default=1, ge=1),
     admin: dict = Depends(get_current_admin)
 ):
-    """List devices with AMC status - P0 Fix"""
+    """
+    List devices with AMC status; total count in X-Total-Count.
+    Unfiltered by AMC status, only the page is joined (count_documents for the
+    total); filtering by it joins the matching set once in a single $facet.
+    """
     query = {"is_deleted": {"$ne": True}}
     if company_id:
         query["company_id"] = company_id
@@ -3860,79 +3487,112 @@ async def list_devices(
     if q and q.strip():
         search_regex = {"$regex": q.strip(), "$options": "i"}
         query["$or"] = [
-            {"serial_number": search_regex},
-            {"asset_tag": search_regex},
-            {"brand": search_regex},
-            {"model": search_regex}
-        ]
-    
-    skip = (page - 1) * limit
-    devices = await db.devices.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    
-    # Enrich each device with AMC status from amc_device_assignments JOIN
-    result = []
-    for device in devices:
-        # Get company name
-        company = await db.companies.find_one({"id": device.get("company_id")}, {"_id": 0, "name": 1})
-        device["company_name"] = company.get("name") if company else "Unknown"
-        
-        # Get assigned user name
-        if device.get("assigned_user_id"):
-            user = await db.users.find_one({"id": device["assigned_user_id"]}, {"_id": 0, "name": 1})
-            device["assigned_user_name"] = user.get("name") if user else None
-        
-        # JOIN amc_device_assignments to get AMC status
-        amc_assignment = await db.amc_device_assignments.find_one({
-            "device_id": device["id"],
-            "status": "active"
-        }, {"_id": 0})
-        
-        if amc_assignment:
-            # Check if coverage is still valid
-            coverage_active = is_warranty_active(amc_assignment.get("coverage_end", ""))
-            if coverage_active:
-                # Get AMC contract details
-                amc_contract = await db.amc_contracts.find_one({
-                    "id": amc_assignment["amc_contract_id"],
-                    "is_deleted": {"$ne": True}
-                }, {"_id": 0, "name": 1, "amc_type": 1})
-                
-                device["amc_status"] = "active"
-                device["amc_contract_id"] = amc_assignment["amc_contract_id"]
-                device["amc_contract_name"] = amc_contract.get("name") if amc_contract else None
-                device["amc_coverage_end"] = amc_assignment.get("coverage_end")
-            else:
-                device["amc_status"] = "expired"
-                device["amc_contract_id"] = amc_assignment["amc_contract_id"]
-                device["amc_coverage_end"] = amc_assignment.get("coverage_end")
-        else:
-            device["amc_status"] = "none"
-            device["amc_contract_id"] = None
-            device["amc_contract_name"] = None
-            device["amc_coverage_end"] = None
-        
-        # Add SmartSelect label
-        device["label"] = f"{device.get('brand', '')} {device.get('model', '')} - {device.get('serial_number', '')}"
-        
-        # Add deployment info if device was created from deployment
-        if device.get("source") == "deployment" and device.get("deployment_id"):
-            deployment = await db.deployments.find_one(
-                {"id": device["deployment_id"], "is_deleted": {"$ne": True}}, 
-                {"_id": 0, "name": 1, "site_id": 1}
-            )
-            if deployment:
-                device["deployment_name"] = deployment.get("name")
-                # Get site name
-                site = await db.sites.find_one({"id": deployment.get("site_id")}, {"_id": 0, "name": 1})
-                device["site_name"] = site.get("name") if site else None
-        
-        # Filter by AMC status if requested
-        if amc_status and device["amc_status"] != amc_status:
-            continue
-        
-        result.append(device)
+            {"serial_number": search_regex},
+            {"asset_tag": search_regex},
+            {"brand": search_regex},
+            {"model": search_regex}
+        ]
     
-    return result
+    today = get_ist_now().strftime("%Y-%m-%d")
+    skip = (page - 1) * limit
+    
+    amc_stages = [
+        # JOIN amc_device_assignments to get AMC status
+        {"$lookup": {
+            "from": "amc_device_assignments",
+            "let": {"device_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$device_id", "$$device_id"]}, "status": "active"}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "amc_contract_id": 1, "coverage_end": 1}}
+            ],
+            "as": "_amc"
+        }},
+        {"$addFields": {"_amc": {"$arrayElemAt": ["$_amc", 0]}}},
+        # Coverage is active while coverage_end (YYYY-MM-DD) is today or later; like
+        # is_warranty_active, anything else (other strings, BSON dates) is not active
+        {"$addFields": {"amc_status": {"$switch": {
+            "branches": [
+                {"case": {"$eq": [{"$type": "$_amc"}, "missing"]}, "then": "none"},
+                {"case": {"$and": [
+                    {"$regexMatch": {
+                        "input": {"$cond": [{"$eq": [{"$type": "$_amc.coverage_end"}, "string"]}, "$_amc.coverage_end", ""]},
+                        "regex": r"^\d{4}-\d{2}-\d{2}$"
+                    }},
+                    {"$gte": ["$_amc.coverage_end", today]}
+                ]}, "then": "active"}
+            ],
+            "default": "expired"
+        }}}}
+    ]
+    
+    from_deployment = {"$and": [
+        {"$eq": ["$source", "deployment"]},
+        {"$gt": [{"$size": "$_deployment"}, 0]}
+    ]}
+    enrich_stages = [
+        _lookup_first("companies", "company_id", "_company", ["name"]),
+        _lookup_first("users", "assigned_user_id", "_user", ["name"]),
+        _lookup_first("amc_contracts", "_amc.amc_contract_id", "_contract", ["name"], match={"is_deleted": {"$ne": True}}),
+        _lookup_first(
+            "deployments", "deployment_id", "_deployment", ["name", "_site"],
+            match={"is_deleted": {"$ne": True}},
+            nested=[_lookup_first("sites", "site_id", "_site", ["name"])]
+        ),
+        {"$addFields": {
+            "company_name": {"$ifNull": [{"$arrayElemAt": ["$_company.name", 0]}, "Unknown"]},
+            "assigned_user_name": {"$cond": [
+                {"$and": ["$assigned_user_id", {"$ne": ["$assigned_user_id", ""]}]},
+                {"$ifNull": [{"$arrayElemAt": ["$_user.name", 0]}, None]},
+                "$$REMOVE"
+            ]},
+            "amc_contract_id": {"$ifNull": ["$_amc.amc_contract_id", None]},
+            "amc_contract_name": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$amc_status", "active"]}, "then": {"$ifNull": [{"$arrayElemAt": ["$_contract.name", 0]}, None]}},
+                    {"case": {"$eq": ["$amc_status", "none"]}, "then": None}
+                ],
+                "default": "$$REMOVE"
+            }},
+            "amc_coverage_end": {"$ifNull": ["$_amc.coverage_end", None]},
+            # SmartSelect label
+            "label": {"$concat": [
+                {"$ifNull": ["$brand", ""]}, " ", {"$ifNull": ["$model", ""]}, " - ", {"$ifNull": ["$serial_number", ""]}
+            ]},
+            # Deployment info if device was created from a deployment
+            "deployment_name": {"$cond": [from_deployment, {"$arrayElemAt": ["$_deployment.name", 0]}, "$$REMOVE"]},
+            "site_name": {"$cond": [
+                from_deployment,
+                {"$ifNull": [{"$arrayElemAt": [{"$arrayElemAt": ["$_deployment._site.name", 0]}, 0]}, None]},
+                "$$REMOVE"
+            ]}
+        }},
+        {"$project": {"_id": 0, "_amc": 0, "_company": 0, "_user": 0, "_contract": 0, "_deployment": 0}}
+    ]
+    
+    if not amc_status:
+        items, total = await asyncio.gather(
+            db.devices.aggregate([
+                {"$match": query}, {"$skip": skip}, {"$limit": limit}, *amc_stages, *enrich_stages
+            ]).to_list(limit),
+            db.devices.count_documents(query)
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return items
+    
+    # Filter by AMC status before pagination so pages are full and the total is exact
+    pipeline = [
+        {"$match": query},
+        *amc_stages,
+        {"$match": {"amc_status": amc_status}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "items": [{"$skip": skip}, {"$limit": limit}, *enrich_stages]
+        }}
+    ]
+    facet = (await db.devices.aggregate(pipeline).to_list(1))[0]
+    response.headers["X-Total-Count"] = str(facet["total"][0]["count"] if facet["total"] else 0)
+    return facet["items"]
 
 @api_router.post("/admin/devices")
 async def create_device(device_data: DeviceCreate, admin: dict = Depends(get_current_admin)):
@@ -3940,12 +3600,13 @@ async def create_device(device_data: DeviceCreate, admin: dict = Depends(get_cur
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    existing = await db.devices.find_one({"serial_number": device_data.serial_number, "is_deleted": {"$ne": True}}, {"_id": 0})
+    existing = await db.devices.find_one({"serial_key": normalize_lookup_key(device_data.serial_number), "is_deleted": {"$ne": True}}, {"_id": 0})
     if existing:
         raise HTTPException(status_code=400, detail="Serial number already exists")
     
     device = Device(**device_data.model_dump())
     await db.devices.insert_one(device.model_dump())
+    await sync_entities("devices", device.id)
     
     # Log initial assignment if user is assigned
     if device_data.assigned_user_id:
@@ -4048,7 +3709,7 @@ async def update_device(device_id: str, updates: DeviceUpdate, admin: dict = Dep
     # Check serial number uniqueness if updating
     if "serial_number" in update_data:
         dup = await db.devices.find_one({
-            "serial_number": update_data["serial_number"],
+            "serial_key": normalize_lookup_key(update_data["serial_number"]),
             "id": {"$ne": device_id},
             "is_deleted": {"$ne": True}
         }, {"_id": 0})
@@ -4081,8 +3742,11 @@ async def update_device(device_id: str, updates: DeviceUpdate, admin: dict = Dep
         await db.assignment_history.insert_one(assignment.model_dump())
     
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
+    update_data.update(device_lookup_keys(update_data))
     
     result = await db.devices.update_one({"id": device_id}, {"$set": update_data})
+    await sync_entities("devices", device_id)
+    await warranty_pdf_cache.invalidate([device_id])
     await log_audit("device", device_id, "update", changes, admin)
     return await db.devices.find_one({"id": device_id}, {"_id": 0})
 
@@ -4094,7 +3758,9 @@ async def delete_device(device_id: str, admin: dict = Depends(get_current_admin)
     
     # Soft delete related data
     await db.parts.update_many({"device_id": device_id}, {"$set": {"is_deleted": True}})
+    await warranty_pdf_cache.invalidate([device_id])
     await db.amc.update_many({"device_id": device_id}, {"$set": {"is_deleted": True}})
+    await sync_entities("devices", device_id)
     await log_audit("device", device_id, "delete", {"is_deleted": True}, admin)
     return {"message": "Device archived"}
 
@@ -4266,6 +3932,7 @@ async def create_service(service_data: ServiceHistoryCreate, admin: dict = Depen
         created_by_name=admin.get("name")
     )
     await db.service_history.insert_one(service.model_dump())
+    await sync_entities("service_history", service.id)
     await log_audit("service", service.id, "create", {"data": service_data.model_dump()}, admin)
     return service.model_dump()
 
@@ -4289,6 +3956,7 @@ async def update_service(service_id: str, updates: ServiceHistoryUpdate, admin:
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
     
     result = await db.service_history.update_one({"id": service_id}, {"$set": update_data})
+    await sync_entities("service_history", service_id)
     await log_audit("service", service_id, "update", changes, admin)
     return await db.service_history.find_one({"id": service_id}, {"_id": 0})
 
@@ -4393,6 +4061,7 @@ async def create_part(part_data: PartCreate, admin: dict = Depends(get_current_a
         warranty_expiry_date=warranty_expiry
     )
     await db.parts.insert_one(part.model_dump())
+    await warranty_pdf_cache.invalidate([part.device_id])
     await log_audit("part", part.id, "create", {"data": part_data.model_dump()}, admin)
     return part.model_dump()
 
@@ -4421,14 +4090,16 @@ async def update_part(part_id: str, updates: PartUpdate, admin: dict = Depends(g
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
     
     result = await db.parts.update_one({"id": part_id}, {"$set": update_data})
+    await warranty_pdf_cache.invalidate([existing.get("device_id")])
     await log_audit("part", part_id, "update", changes, admin)
     return await db.parts.find_one({"id": part_id}, {"_id": 0})
 
 @api_router.delete("/admin/parts/{part_id}")
 async def delete_part(part_id: str, admin: dict = Depends(get_current_admin)):
-    result = await db.parts.update_one({"id": part_id}, {"$set": {"is_deleted": True}})
-    if result.matched_count == 0:
+    part = await db.parts.find_one_and_update({"id": part_id}, {"$set": {"is_deleted": True}}, {"_id": 0, "device_id": 1})
+    if not part:
         raise HTTPException(status_code=404, detail="Part not found")
+    await warranty_pdf_cache.invalidate([part.get("device_id")])
     await log_audit("part", part_id, "delete", {"is_deleted": True}, admin)
     return {"message": "Part archived"}
 
@@ -4515,8 +4186,27 @@ def get_days_until_expiry(end_date: str) -> Optional[int]:
     except:
         return None
 
+def amc_status_query(status: str) -> dict:
+    """Date-range predicate equivalent to get_amc_status() == status, for use in queries"""
+    today = get_ist_now().date()
+    today_str = today.strftime("%Y-%m-%d")
+    tomorrow_str = (today + timedelta(days=1)).strftime("%Y-%m-%d")
+    date_pattern = {"$regex": r"^\d{4}-\d{2}-\d{2}"}
+    
+    # Every branch requires both dates to parse, so the statuses never overlap "unknown"
+    if status == "active":
+        return {"start_date": {**date_pattern, "$lt": tomorrow_str}, "end_date": {**date_pattern, "$gte": today_str}}
+    if status == "upcoming":
+        return {"start_date": {**date_pattern, "$gte": tomorrow_str}, "end_date": date_pattern}
+    if status == "expired":
+        return {"start_date": {**date_pattern, "$lt": tomorrow_str}, "end_date": {**date_pattern, "$lt": today_str}}
+    if status == "unknown":
+        return {"$or": [{"start_date": {"$not": date_pattern}}, {"end_date": {"$not": date_pattern}}]}
+    return {"id": {"$in": []}}  # No contract can have any other status
+
 @api_router.get("/admin/amc-contracts")
 async def list_amc_contracts(
+    response: Response,
     company_id: Optional[str] = None,
     status: Optional[str] = None,
     serial: Optional[str] = None,  # Search by device serial number
@@ -4526,7 +4216,7 @@ async def list_amc_contracts(
     page: int = Query(default=1, ge=1),
     admin: dict = Depends(get_current_admin)
 ):
-    """List AMC contracts with serial number search - P0 Fix"""
+    """List AMC contracts with serial number search; total count in X-Total-Count"""
     query = {"is_deleted": {"$ne": True}}
     if company_id:
         query["company_id"] = company_id
@@ -4543,6 +4233,7 @@ async def list_amc_contracts(
         device_ids = [d["id"] for d in devices]
         
         if not device_ids:
+            response.headers["X-Total-Count"] = "0"
             return []  # No devices match, so no contracts
         
         # Find assignments for these devices
@@ -4552,6 +4243,7 @@ async def list_amc_contracts(
         
         contract_ids = list(set([a["amc_contract_id"] for a in assignments]))
         if not contract_ids:
+            response.headers["X-Total-Count"] = "0"
             return []
         
         query["id"] = {"$in": contract_ids}
@@ -4563,39 +4255,50 @@ async def list_amc_contracts(
             {"name": search_regex}
         ]
     
+    # Status is derived from the contract dates, so filter on them before paginating
+    if status:
+        query.setdefault("$and", []).append(amc_status_query(status))
+    
+    def grouped_count(collection: str, match: dict, as_field: str) -> dict:
+        return {"$lookup": {
+            "from": collection,
+            "let": {"contract_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$amc_contract_id", "$$contract_id"]}, **match}},
+                {"$group": {"_id": None, "count": {"$sum": 1}}}
+            ],
+            "as": as_field
+        }}
+    
     skip = (page - 1) * limit
-    contracts = await db.amc_contracts.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
+    page_stages = [
+        {"$skip": skip},
+        {"$limit": limit},
+        _lookup_first("companies", "company_id", "_company", ["name"]),
+        grouped_count("amc_usage", {}, "_usage"),
+        grouped_count("amc_device_assignments", {"status": "active"}, "_assigned"),
+        {"$addFields": {
+            "company_name": {"$ifNull": [{"$arrayElemAt": ["$_company.name", 0]}, "Unknown"]},
+            "usage_count": {"$ifNull": [{"$arrayElemAt": ["$_usage.count", 0]}, 0]},
+            "assigned_devices_count": {"$ifNull": [{"$arrayElemAt": ["$_assigned.count", 0]}, 0]},
+            "label": "$name"  # SmartSelect compatibility
+        }},
+        {"$project": {"_id": 0, "_company": 0, "_usage": 0, "_assigned": 0}}
+    ]
+    result = await db.amc_contracts.aggregate([
+        {"$match": query},
+        {"$facet": {"total": [{"$count": "count"}], "items": page_stages}}
+    ]).to_list(1)
+    
+    facet = result[0] if result else {"total": [], "items": []}
+    contracts = facet["items"]
+    response.headers["X-Total-Count"] = str(facet["total"][0]["count"] if facet["total"] else 0)
     
-    # Compute status and enrich for each contract
-    result = []
     for contract in contracts:
-        status_val = get_amc_status(contract.get("start_date", ""), contract.get("end_date", ""))
-        days_left = get_days_until_expiry(contract.get("end_date", ""))
-        
-        # Get company name
-        company = await db.companies.find_one({"id": contract.get("company_id")}, {"_id": 0, "name": 1})
-        
-        # Get usage stats
-        usage_count = await db.amc_usage.count_documents({"amc_contract_id": contract["id"]})
-        
-        # Get assigned devices count
-        devices_count = await db.amc_device_assignments.count_documents({
-            "amc_contract_id": contract["id"],
-            "status": "active"
-        })
-        
-        contract["status"] = status_val
-        contract["days_until_expiry"] = days_left
-        contract["company_name"] = company.get("name") if company else "Unknown"
-        contract["usage_count"] = usage_count
-        contract["assigned_devices_count"] = devices_count
-        contract["label"] = contract.get("name")  # SmartSelect compatibility
-        
-        if status and status_val != status:
-            continue
-        result.append(contract)
+        contract["status"] = get_amc_status(contract.get("start_date", ""), contract.get("end_date", ""))
+        contract["days_until_expiry"] = get_days_until_expiry(contract.get("end_date", ""))
     
-    return result
+    return contracts
 
 @api_router.post("/admin/amc-contracts")
 async def create_amc_contract(data: AMCContractCreate, admin: dict = Depends(get_current_admin)):
@@ -4621,6 +4324,7 @@ async def create_amc_contract(data: AMCContractCreate, admin: dict = Depends(get
     
     contract = AMCContract(**contract_data)
     await db.amc_contracts.insert_one(contract.model_dump())
+    await sync_entities("amc_contracts", contract.id)
     await log_audit("amc_contract", contract.id, "create", {"data": contract_data}, admin)
     
     result = contract.model_dump()
@@ -4703,6 +4407,8 @@ async def update_amc_contract(contract_id: str, updates: AMCContractUpdate, admi
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
     
     await db.amc_contracts.update_one({"id": contract_id}, {"$set": update_data})
+    await sync_entities("amc_contracts", contract_id)
+    await warranty_pdf_cache.invalidate(amc_contract_id=contract_id)
     await log_audit("amc_contract", contract_id, "update", changes, admin)
     
     result = await db.amc_contracts.find_one({"id": contract_id}, {"_id": 0})
@@ -4715,6 +4421,8 @@ async def delete_amc_contract(contract_id: str, admin: dict = Depends(get_curren
     result = await db.amc_contracts.update_one({"id": contract_id}, {"$set": {"is_deleted": True}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="AMC Contract not found")
+    await sync_entities("amc_contracts", contract_id)
+    await warranty_pdf_cache.invalidate(amc_contract_id=contract_id)
     await log_audit("amc_contract", contract_id, "delete", {"is_deleted": True}, admin)
     return {"message": "AMC Contract archived"}
 
@@ -4830,7 +4538,8 @@ async def list_sites(
     q: Optional[str] = None,
     limit: int = Query(default=100, le=500),
     page: int = Query(default=1, ge=1),
-    admin: dict = Depends(get_current_admin)
+    admin: dict = Depends(get_current_admin),
+    loader: EntityLoader = Depends(get_loader)
 ):
     """List all sites with optional search support"""
     query = {"is_deleted": {"$ne": True}}
@@ -4849,17 +4558,19 @@ async def list_sites(
     skip = (page - 1) * limit
     sites = await db.sites.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     
+    companies = await loader.load_many("companies", [s.get("company_id") for s in sites])
+    deployments_by_site = await loader.load_grouped(
+        "deployments", "site_id", [s["id"] for s in sites], {"is_deleted": {"$ne": True}}
+    )
+    
     # Enrich with company names and counts
     for site in sites:
-        company = await db.companies.find_one({"id": site.get("company_id")}, {"_id": 0, "name": 1})
+        company = companies.get(site.get("company_id"))
         site["company_name"] = company.get("name") if company else "Unknown"
         site["label"] = site["name"]  # SmartSelect compatibility
         
         # Count deployments and items
-        deployments = await db.deployments.find(
-            {"site_id": site["id"], "is_deleted": {"$ne": True}},
-            {"_id": 0}
-        ).to_list(100)
+        deployments = deployments_by_site.get(site["id"], [])
         site["deployments_count"] = len(deployments)
         
         # Count total items across deployments
@@ -4878,6 +4589,7 @@ async def create_site(data: SiteCreate, admin: dict = Depends(get_current_admin)
     
     site = Site(**data.model_dump())
     await db.sites.insert_one(site.model_dump())
+    await sync_entities("sites", site.id)
     await log_audit("site", site.id, "create", {"data": data.model_dump()}, admin)
     
     result = site.model_dump()
@@ -4905,6 +4617,7 @@ async def quick_create_site(data: SiteCreate, admin: dict = Depends(get_current_
     
     site = Site(**data.model_dump())
     await db.sites.insert_one(site.model_dump())
+    await sync_entities("sites", site.id)
     await log_audit("site", site.id, "quick_create", {"data": data.model_dump()}, admin)
     
     result = site.model_dump()
@@ -4977,6 +4690,7 @@ async def update_site(site_id: str, updates: SiteUpdate, admin: dict = Depends(g
     changes = {k: {"old": existing.get(k), "new": v} for k, v in update_data.items() if existing.get(k) != v}
     
     await db.sites.update_one({"id": site_id}, {"$set": update_data})
+    await sync_entities("sites", site_id)
     await log_audit("site", site_id, "update", changes, admin)
     
     return await db.sites.find_one({"id": site_id}, {"_id": 0})
@@ -4987,6 +4701,7 @@ async def delete_site(site_id: str, admin: dict = Depends(get_current_admin)):
     result = await db.sites.update_one({"id": site_id}, {"$set": {"is_deleted": True}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Site not found")
+    await sync_entities("sites", site_id)
     await log_audit("site", site_id, "delete", {"is_deleted": True}, admin)
     return {"message": "Site archived"}
 
@@ -5029,37 +4744,7 @@ async def create_deployment(data: DeploymentCreate, admin: dict = Depends(get_cu
     if not site:
         raise HTTPException(status_code=404, detail="Site not found")
     
-    # Process items - create devices for serialized items
-    processed_items = []
-    for item_data in data.items:
-        item = DeploymentItem(**item_data)
-        
-        # For serialized items, create device records
-        if item.is_serialized and item.serial_numbers:
-            linked_device_ids = []
-            for serial in item.serial_numbers:
-                device_data = {
-                    "id": str(uuid.uuid4()),
-                    "company_id": data.company_id,
-                    "site_id": data.site_id,
-                    "deployment_id": "",  # Will be updated after deployment is created
-                    "device_type": item.category,
-                    "brand": item.brand or "Unknown",
-                    "model": item.model or "Unknown",
-                    "serial_number": serial,
-                    "purchase_date": item.installation_date or data.deployment_date,
-                    "warranty_end_date": item.warranty_end_date,
-                    "location": item.zone_location,
-                    "status": "active",
-                    "condition": "new",
-                    "is_deleted": False,
-                    "created_at": get_ist_isoformat()
-                }
-                linked_device_ids.append(device_data["id"])
-            
-            item.linked_device_ids = linked_device_ids
-        
-        processed_items.append(item.model_dump())
+    processed_items = [DeploymentItem(**item_data).model_dump() for item_data in data.items]
     
     # Create deployment
     deployment = Deployment(
@@ -5076,35 +4761,19 @@ async def create_deployment(data: DeploymentCreate, admin: dict = Depends(get_cu
     
     await db.deployments.insert_one(deployment.model_dump())
     
-    # Now create the device records for serialized items
-    for item_idx, item in enumerate(processed_items):
-        if item.get("is_serialized") and item.get("serial_numbers"):
-            for i, serial in enumerate(item["serial_numbers"]):
-                device_id = item["linked_device_ids"][i] if i < len(item.get("linked_device_ids", [])) else str(uuid.uuid4())
-                device_data = {
-                    "id": device_id,
-                    "company_id": data.company_id,
-                    "site_id": data.site_id,
-                    "deployment_id": deployment.id,
-                    "deployment_item_index": item_idx,
-                    "source": "deployment",
-                    "device_type": item.get("category"),
-                    "brand": item.get("brand") or "Unknown",
-                    "model": item.get("model") or "Unknown",
-                    "serial_number": serial,
-                    "purchase_date": item.get("installation_date") or data.deployment_date,
-                    "warranty_end_date": item.get("warranty_end_date"),
-                    "location": item.get("zone_location"),
-                    "status": "active",
-                    "condition": "new",
-                    "is_deleted": False,
-                    "created_at": get_ist_isoformat()
-                }
-                await db.devices.insert_one(device_data)
-    
+    # Create the device records for serialized items, then link them in one update
+    result = deployment.model_dump()
+    device_sync = await sync_items_to_devices(result)
+    linked_update = linked_ids_update(result, device_sync["linked"])
+    if linked_update:
+        await db.deployments.update_one({"id": deployment.id}, {"$set": linked_update})
+    for item_index, device_ids in device_sync["linked"].items():
+        result["items"][item_index]["linked_device_ids"] = device_ids
+    
+    await sync_entities("deployments", deployment.id)
+    await sync_entities("devices", *device_sync["changed_ids"])
     await log_audit("deployment", deployment.id, "create", {"data": data.model_dump()}, admin)
     
-    result = deployment.model_dump()
     result["company_name"] = company.get("name")
     result["site_name"] = site.get("name")
     result["items_count"] = len(processed_items)
@@ -5170,6 +4839,7 @@ async def update_deployment(deployment_id: str, updates: DeploymentUpdate, admin
     update_data["updated_at"] = get_ist_isoformat()
     
     await db.deployments.update_one({"id": deployment_id}, {"$set": update_data})
+    await sync_entities("deployments", deployment_id)
     await log_audit("deployment", deployment_id, "update", update_data, admin)
     
     return await db.deployments.find_one({"id": deployment_id}, {"_id": 0})
@@ -5187,6 +4857,8 @@ async def delete_deployment(deployment_id: str, admin: dict = Depends(get_curren
         {"$set": {"is_deleted": True}}
     )
     
+    await sync_entities("deployments", deployment_id)
+    await sync_matching("devices", {"deployment_id": deployment_id, "source": "deployment"})
     await log_audit("deployment", deployment_id, "delete", {"is_deleted": True}, admin)
     return {"message": "Deployment and linked devices archived"}
 
@@ -5222,6 +4894,7 @@ async def add_deployment_item(deployment_id: str, item_data: dict, admin: dict =
                 "is_deleted": False,
                 "created_at": get_ist_isoformat()
             }
+            device_data.update(device_lookup_keys(device_data))
             await db.devices.insert_one(device_data)
             linked_device_ids.append(device_data["id"])
         
@@ -5235,6 +4908,8 @@ async def add_deployment_item(deployment_id: str, item_data: dict, admin: dict =
             "$set": {"updated_at": get_ist_isoformat()}
         }
     )
+    await sync_entities("deployments", deployment_id)
+    await sync_entities("devices", *item.linked_device_ids)
     
     return item.model_dump()
 
@@ -5259,62 +4934,13 @@ async def update_deployment_item(
     # Merge updates with existing item
     updated_item = {**old_item, **{k: v for k, v in item_data.items() if v is not None}}
     
-    # Handle serial number changes - sync to devices
-    new_serials = item_data.get("serial_numbers", [])
-    old_serials = old_item.get("serial_numbers", [])
-    old_linked_ids = old_item.get("linked_device_ids", [])
-    
-    # If serial numbers are being added/updated
-    if new_serials and updated_item.get("is_serialized"):
-        new_linked_ids = []
-        
-        for i, serial in enumerate(new_serials):
-            if serial:  # Only process non-empty serial numbers
-                # Check if this serial was already linked to a device
-                if i < len(old_linked_ids) and old_linked_ids[i]:
-                    # Update existing device
-                    device_id = old_linked_ids[i]
-                    await db.devices.update_one(
-                        {"id": device_id},
-                        {"$set": {
-                            "serial_number": serial,
-                            "device_type": updated_item.get("category"),
-                            "category": updated_item.get("category"),
-                            "brand": updated_item.get("brand") or "Unknown",
-                            "model": updated_item.get("model") or "Unknown",
-                            "warranty_end_date": updated_item.get("warranty_end_date"),
-                            "location": updated_item.get("zone_location"),
-                            "updated_at": get_ist_isoformat()
-                        }}
-                    )
-                    new_linked_ids.append(device_id)
-                else:
-                    # Create new device for this serial
-                    device_data = {
-                        "id": str(uuid.uuid4()),
-                        "company_id": deployment["company_id"],
-                        "site_id": deployment["site_id"],
-                        "deployment_id": deployment_id,
-                        "deployment_item_index": item_index,
-                        "source": "deployment",
-                        "device_type": updated_item.get("category"),
-                        "category": updated_item.get("category"),
-                        "brand": updated_item.get("brand") or "Unknown",
-                        "model": updated_item.get("model") or "Unknown",
-                        "serial_number": serial,
-                        "purchase_date": updated_item.get("installation_date") or deployment["deployment_date"],
-                        "warranty_end_date": updated_item.get("warranty_end_date"),
-                        "location": updated_item.get("zone_location"),
-                        "status": "active",
-                        "condition": "new",
-                        "is_deleted": False,
-                        "created_at": get_ist_isoformat()
-                    }
-                    await db.devices.insert_one(device_data)
-                    new_linked_ids.append(device_data["id"])
-        
-        updated_item["linked_device_ids"] = new_linked_ids
-        updated_item["serial_numbers"] = new_serials
+    # Sync the item's serials to their devices (renamed serials keep their device)
+    changed_device_ids = []
+    if updated_item.get("is_serialized") and updated_item.get("serial_numbers"):
+        items[item_index] = updated_item
+        device_sync = await sync_items_to_devices(deployment, [item_index])
+        updated_item["linked_device_ids"] = device_sync["linked"].get(item_index, [])
+        changed_device_ids = device_sync["changed_ids"]
     
     # Update the item in deployment
     items[item_index] = updated_item
@@ -5325,6 +4951,9 @@ async def update_deployment_item(
             "updated_at": get_ist_isoformat()
         }}
     )
+    await sync_entities("deployments", deployment_id)
+    await sync_entities("devices", *changed_device_ids)
+    await warranty_pdf_cache.invalidate(changed_device_ids)
     
     await log_audit("deployment", deployment_id, "update_item", {"item_index": item_index, "updates": item_data}, admin)
     
@@ -5337,312 +4966,204 @@ async def sync_deployment_devices(deployment_id: str, admin: dict = Depends(get_
     if not deployment:
         raise HTTPException(status_code=404, detail="Deployment not found")
     
-    created_count = 0
-    updated_count = 0
-    
-    for item_idx, item in enumerate(deployment.get("items", [])):
-        if item.get("is_serialized") and item.get("serial_numbers"):
-            linked_ids = item.get("linked_device_ids", [])
-            new_linked_ids = []
-            
-            for i, serial in enumerate(item["serial_numbers"]):
-                if not serial:  # Skip empty serials
-                    continue
-                    
-                # Check if device already exists for this serial in this deployment
-                existing_device = await db.devices.find_one({
-                    "deployment_id": deployment_id,
-                    "serial_number": serial,
-                    "is_deleted": {"$ne": True}
-                }, {"_id": 0})
-                
-                if existing_device:
-                    # Update existing device
-                    await db.devices.update_one(
-                        {"id": existing_device["id"]},
-                        {"$set": {
-                            "device_type": item.get("category"),
-                            "category": item.get("category"),
-                            "brand": item.get("brand") or "Unknown",
-                            "model": item.get("model") or "Unknown",
-                            "warranty_end_date": item.get("warranty_end_date"),
-                            "location": item.get("zone_location"),
-                            "updated_at": get_ist_isoformat()
-                        }}
-                    )
-                    new_linked_ids.append(existing_device["id"])
-                    updated_count += 1
-                else:
-                    # Create new device
-                    device_data = {
-                        "id": str(uuid.uuid4()),
-                        "company_id": deployment["company_id"],
-                        "site_id": deployment["site_id"],
-                        "deployment_id": deployment_id,
-                        "deployment_item_index": item_idx,
-                        "source": "deployment",
-                        "device_type": item.get("category"),
-                        "category": item.get("category"),
-                        "brand": item.get("brand") or "Unknown",
-                        "model": item.get("model") or "Unknown",
-                        "serial_number": serial,
-                        "purchase_date": item.get("installation_date") or deployment.get("deployment_date"),
-                        "warranty_end_date": item.get("warranty_end_date"),
-                        "location": item.get("zone_location"),
-                        "status": "active",
-                        "condition": "new",
-                        "is_deleted": False,
-                        "created_at": get_ist_isoformat()
-                    }
-                    await db.devices.insert_one(device_data)
-                    new_linked_ids.append(device_data["id"])
-                    created_count += 1
-            
-            # Update linked_device_ids in deployment item
-            if new_linked_ids:
-                await db.deployments.update_one(
-                    {"id": deployment_id},
-                    {"$set": {f"items.{item_idx}.linked_device_ids": new_linked_ids}}
-                )
+    device_sync = await sync_items_to_devices(deployment)
+    linked_update = linked_ids_update(deployment, device_sync["linked"])
+    if linked_update:
+        await db.deployments.update_one({"id": deployment_id}, {"$set": linked_update})
     
+    await sync_entities("devices", *device_sync["changed_ids"])
+    await warranty_pdf_cache.invalidate(device_sync["changed_ids"])
     return {
-        "message": f"Sync complete. Created {created_count} devices, updated {updated_count} devices.",
-        "created": created_count,
-        "updated": updated_count
+        "message": f"Sync complete. Created {device_sync['created']} devices, updated {device_sync['updated']} devices.",
+        "created": device_sync["created"],
+        "updated": device_sync["updated"],
+        "unchanged": device_sync["unchanged"]
     }
 
 # ==================== UNIVERSAL SEARCH ====================
 
+SEARCH_CATEGORIES = ("companies", "sites", "users", "assets", "deployments", "amcs", "services")
+
+async def _search_with_budget(category: str, coro, timed_out: list) -> list:
+    """Await one category search; give up with no results once its time budget is spent"""
+    try:
+        return await asyncio.wait_for(coro, timeout=SEARCH_CATEGORY_TIMEOUT_MS / 1000)
+    except (asyncio.TimeoutError, ExecutionTimeout):
+        logger.warning(f"Universal search: '{category}' exceeded {SEARCH_CATEGORY_TIMEOUT_MS}ms budget")
+        timed_out.append(category)
+        return []
+
 @api_router.get("/search")
 async def universal_search(
     q: str = Query(..., min_length=1, description="Search query"),
     limit: int = Query(5, ge=1, le=10, description="Results per category"),
-    admin: dict = Depends(get_current_admin)
+    admin: dict = Depends(get_current_admin),
+    loader: EntityLoader = Depends(get_loader)
 ):
     """
     Universal search across all entities.
     Returns grouped results from companies, sites, users, assets, deployments, AMCs, and services.
+    Matches come from the prefix/token search index (services.search_index), ranked by relevance.
+    Categories are searched concurrently, each within SEARCH_CATEGORY_TIMEOUT_MS; categories
+    that run out of time come back empty and are listed in `timed_out`.
     """
     if not q or len(q.strip()) < 1:
-        return {
-            "companies": [],
-            "sites": [],
-            "users": [],
-            "assets": [],
-            "deployments": [],
-            "amcs": [],
-            "services": []
-        }
+        return {category: [] for category in SEARCH_CATEGORIES}
     
     query = q.strip()
-    # Create case-insensitive regex pattern for partial matching
-    regex_pattern = {"$regex": query, "$options": "i"}
-    
-    results = {
-        "companies": [],
-        "sites": [],
-        "users": [],
-        "assets": [],
-        "deployments": [],
-        "amcs": [],
-        "services": [],
-        "query": query,
-        "total_count": 0
-    }
     
-    # Search Companies
-    companies = await db.companies.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"name": regex_pattern},
-            {"contact_email": regex_pattern},
-            {"gst_number": regex_pattern},
-            {"address": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
+    async def find(collection: str) -> List[dict]:
+        # Index hits in rank order, hydrated with one batched read
+        ids = await search_entities(collection, query, limit, max_time_ms=SEARCH_CATEGORY_TIMEOUT_MS)
+        docs = await loader.load_many(collection, ids)
+        return [docs[i] for i in ids if i in docs and not docs[i].get("is_deleted")]
     
-    for c in companies:
-        results["companies"].append({
+    async def search_companies():
+        companies = await find("companies")
+        return [{
             "id": c["id"],
             "type": "company",
             "title": c.get("name"),
             "subtitle": c.get("contact_email") or c.get("address", ""),
             "link": f"/admin/companies",
             "icon": "building"
-        })
-    
-    # Search Sites
-    sites = await db.sites.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"name": regex_pattern},
-            {"address": regex_pattern},
-            {"city": regex_pattern},
-            {"primary_contact_name": regex_pattern},
-            {"contact_number": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for s in sites:
-        company = await db.companies.find_one({"id": s.get("company_id")}, {"_id": 0, "name": 1})
-        results["sites"].append({
-            "id": s["id"],
-            "type": "site",
-            "title": s.get("name"),
-            "subtitle": f"{s.get('city', '')} • {company.get('name', '') if company else ''}",
-            "link": f"/admin/sites",
-            "icon": "map-pin"
-        })
-    
-    # Search Users
-    users = await db.users.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"name": regex_pattern},
-            {"email": regex_pattern},
-            {"phone": regex_pattern},
-            {"designation": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
+        } for c in companies]
+    
+    async def search_sites():
+        sites = await find("sites")
+        site_companies = await loader.load_many("companies", [s.get("company_id") for s in sites])
+        results = []
+        for s in sites:
+            company = site_companies.get(s.get("company_id"))
+            results.append({
+                "id": s["id"],
+                "type": "site",
+                "title": s.get("name"),
+                "subtitle": f"{s.get('city', '')} • {company.get('name', '') if company else ''}",
+                "link": f"/admin/sites",
+                "icon": "map-pin"
+            })
+        return results
     
-    for u in users:
-        results["users"].append({
+    async def search_users():
+        users = await find("users")
+        return [{
             "id": u["id"],
             "type": "user",
             "title": u.get("name"),
             "subtitle": u.get("email") or u.get("phone", ""),
             "link": f"/admin/users",
             "icon": "user"
-        })
-    
-    # Search Assets/Devices
-    devices = await db.devices.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"serial_number": regex_pattern},
-            {"asset_tag": regex_pattern},
-            {"brand": regex_pattern},
-            {"model": regex_pattern},
-            {"device_type": regex_pattern},
-            {"location": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for d in devices:
-        company = await db.companies.find_one({"id": d.get("company_id")}, {"_id": 0, "name": 1})
-        results["assets"].append({
-            "id": d["id"],
-            "type": "asset",
-            "title": f"{d.get('brand', '')} {d.get('model', '')}".strip() or d.get("serial_number"),
-            "subtitle": f"S/N: {d.get('serial_number', '')} • {company.get('name', '') if company else ''}",
-            "link": f"/admin/devices",
-            "icon": "laptop",
-            "serial_number": d.get("serial_number"),
-            "asset_tag": d.get("asset_tag")
-        })
-    
-    # Search Deployments
-    deployments = await db.deployments.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"name": regex_pattern},
-            {"installed_by": regex_pattern},
-            {"notes": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Also search deployment items for serial numbers and categories
-    deployment_items_search = await db.deployments.find({
-        "is_deleted": {"$ne": True},
-        "items": {
-            "$elemMatch": {
-                "$or": [
-                    {"serial_numbers": regex_pattern},
-                    {"category": regex_pattern},
-                    {"brand": regex_pattern},
-                    {"model": regex_pattern}
-                ]
-            }
-        }
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Combine and dedupe
-    all_deployments = {d["id"]: d for d in deployments}
-    for d in deployment_items_search:
-        if d["id"] not in all_deployments:
-            all_deployments[d["id"]] = d
-    
-    for d in list(all_deployments.values())[:limit]:
-        site = await db.sites.find_one({"id": d.get("site_id")}, {"_id": 0, "name": 1})
-        results["deployments"].append({
-            "id": d["id"],
-            "type": "deployment",
-            "title": d.get("name"),
-            "subtitle": f"{site.get('name', '') if site else ''} • {len(d.get('items', []))} items",
-            "link": f"/admin/deployments",
-            "icon": "package"
-        })
-    
-    # Search AMC Contracts
-    amcs = await db.amc_contracts.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"name": regex_pattern},
-            {"amc_type": regex_pattern},
-            {"internal_notes": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for a in amcs:
-        company = await db.companies.find_one({"id": a.get("company_id")}, {"_id": 0, "name": 1})
-        status = get_amc_status(a.get("start_date", ""), a.get("end_date", ""))
-        results["amcs"].append({
-            "id": a["id"],
-            "type": "amc",
-            "title": a.get("name"),
-            "subtitle": f"{company.get('name', '') if company else ''} • {status.capitalize()}",
-            "link": f"/admin/amc-contracts",
-            "icon": "file-text",
-            "status": status
-        })
-    
-    # Search Service History
-    services = await db.service_history.find({
-        "is_deleted": {"$ne": True},
-        "$or": [
-            {"ticket_id": regex_pattern},
-            {"action_taken": regex_pattern},
-            {"problem_reported": regex_pattern},
-            {"technician_name": regex_pattern},
-            {"notes": regex_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for s in services:
-        device = await db.devices.find_one({"id": s.get("device_id")}, {"_id": 0, "brand": 1, "model": 1, "serial_number": 1})
-        results["services"].append({
-            "id": s["id"],
-            "type": "service",
-            "title": s.get("action_taken", "")[:50] + ("..." if len(s.get("action_taken", "")) > 50 else ""),
-            "subtitle": f"{device.get('brand', '')} {device.get('model', '')} • {s.get('service_type', '')}".strip() if device else s.get("service_type", ""),
-            "link": f"/admin/service-history",
-            "icon": "wrench",
-            "ticket_id": s.get("ticket_id")
-        })
+        } for u in users]
+    
+    async def search_assets():
+        devices = await find("devices")
+        device_companies = await loader.load_many("companies", [d.get("company_id") for d in devices])
+        results = []
+        for d in devices:
+            company = device_companies.get(d.get("company_id"))
+            results.append({
+                "id": d["id"],
+                "type": "asset",
+                "title": f"{d.get('brand', '')} {d.get('model', '')}".strip() or d.get("serial_number"),
+                "subtitle": f"S/N: {d.get('serial_number', '')} • {company.get('name', '') if company else ''}",
+                "link": f"/admin/devices",
+                "icon": "laptop",
+                "serial_number": d.get("serial_number"),
+                "asset_tag": d.get("asset_tag")
+            })
+        return results
+    
+    async def search_deployments():
+        # Deployment items (serial numbers, categories, brands, models) are indexed with the deployment
+        matched = await find("deployments")
+        deployment_sites = await loader.load_many("sites", [d.get("site_id") for d in matched])
+        results = []
+        for d in matched:
+            site = deployment_sites.get(d.get("site_id"))
+            results.append({
+                "id": d["id"],
+                "type": "deployment",
+                "title": d.get("name"),
+                "subtitle": f"{site.get('name', '') if site else ''} • {len(d.get('items', []))} items",
+                "link": f"/admin/deployments",
+                "icon": "package"
+            })
+        return results
+    
+    async def search_amcs():
+        amcs = await find("amc_contracts")
+        amc_companies = await loader.load_many("companies", [a.get("company_id") for a in amcs])
+        results = []
+        for a in amcs:
+            company = amc_companies.get(a.get("company_id"))
+            status = get_amc_status(a.get("start_date", ""), a.get("end_date", ""))
+            results.append({
+                "id": a["id"],
+                "type": "amc",
+                "title": a.get("name"),
+                "subtitle": f"{company.get('name', '') if company else ''} • {status.capitalize()}",
+                "link": f"/admin/amc-contracts",
+                "icon": "file-text",
+                "status": status
+            })
+        return results
+    
+    async def search_services():
+        services = await find("service_history")
+        service_devices = await loader.load_many("devices", [s.get("device_id") for s in services])
+        results = []
+        for s in services:
+            device = service_devices.get(s.get("device_id"))
+            results.append({
+                "id": s["id"],
+                "type": "service",
+                "title": s.get("action_taken", "")[:50] + ("..." if len(s.get("action_taken", "")) > 50 else ""),
+                "subtitle": f"{device.get('brand', '')} {device.get('model', '')} • {s.get('service_type', '')}".strip() if device else s.get("service_type", ""),
+                "link": f"/admin/service-history",
+                "icon": "wrench",
+                "ticket_id": s.get("ticket_id")
+            })
+        return results
+    
+    searches = {
+        "companies": search_companies(),
+        "sites": search_sites(),
+        "users": search_users(),
+        "assets": search_assets(),
+        "deployments": search_deployments(),
+        "amcs": search_amcs(),
+        "services": search_services()
+    }
+    timed_out = []
+    found = await asyncio.gather(*(
+        _search_with_budget(category, coro, timed_out) for category, coro in searches.items()
+    ))
     
-    # Calculate total count
-    results["total_count"] = (
-        len(results["companies"]) +
-        len(results["sites"]) +
-        len(results["users"]) +
-        len(results["assets"]) +
-        len(results["deployments"]) +
-        len(results["amcs"]) +
-        len(results["services"])
-    )
+    results = dict(zip(searches.keys(), found))
+    results["query"] = query
+    results["total_count"] = sum(len(items) for items in found)
+    results["timed_out"] = timed_out
     
     return results
 
+# ==================== SYSTEM METRICS ====================
+
+@api_router.get("/admin/system/metrics")
+async def get_system_metrics(admin: dict = Depends(get_current_admin)):
+    """In-process cache and worker metrics for this API process"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "reference_cache": reference_cache.stats(),
+        "render_pool": render_pool.stats(),
+        "warranty_pdf_cache": warranty_pdf_cache.stats(),
+        "osticket_dispatcher": osticket_dispatcher.stats(),
+        "http_clients": http_clients.stats(),
+        "osticket_reconciler": osticket_reconciler.stats(),
+        "webhooks": webhook_worker.stats(),
+        "razorpay_gateway": razorpay_gateway.stats()
+    }
+
 # ==================== ADMIN ENDPOINTS - SETTINGS ====================
 
 @api_router.get("/admin/settings")
@@ -5662,6 +5183,7 @@ async def update_settings(updates: SettingsUpdate, admin: dict = Depends(get_cur
         {"$set": update_data},
         upsert=True
     )
+    await reference_cache.bump(SETTINGS)
     
     return await db.settings.find_one({"id": "settings"}, {"_id": 0})
 
@@ -5679,6 +5201,7 @@ async def upload_logo(file: UploadFile = File(...), admin: dict = Depends(get_cu
         {"$set": {"logo_base64": logo_base64, "updated_at": get_ist_isoformat()}},
         upsert=True
     )
+    await reference_cache.bump(SETTINGS)
     
     return {"message": "Logo uploaded successfully", "logo_base64": logo_base64}
 
@@ -5711,7 +5234,8 @@ async def list_licenses(
     q: Optional[str] = None,
     limit: int = Query(default=100, le=500),
     page: int = Query(default=1, ge=1),
-    admin: dict = Depends(get_current_admin)
+    admin: dict = Depends(get_current_admin),
+    loader: EntityLoader = Depends(get_loader)
 ):
     """List all licenses with optional filters"""
     query = {"is_deleted": {"$ne": True}}
@@ -5733,9 +5257,11 @@ async def list_licenses(
     skip = (page - 1) * limit
     licenses = await db.licenses.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     
+    companies = await loader.load_many("companies", [lic.get("company_id") for lic in licenses])
+    
     # Enrich with company names and calculate status
     for lic in licenses:
-        company = await db.companies.find_one({"id": lic.get("company_id")}, {"_id": 0, "name": 1})
+        company = companies.get(lic.get("company_id"))
         lic["company_name"] = company.get("name") if company else "Unknown"
         lic["label"] = lic["software_name"]
         
@@ -5955,6 +5481,7 @@ async def assign_device_to_amc(
     
     assignment = AMCDeviceAssignment(**assignment_data)
     await db.amc_device_assignments.insert_one(assignment.model_dump())
+    await warranty_pdf_cache.invalidate([assignment.device_id])
     
     return assignment.model_dump()
 
@@ -5987,10 +5514,7 @@ async def preview_bulk_amc_assignment(
         # Search by serial number or asset tag
         device = await db.devices.find_one({
             "is_deleted": {"$ne": True},
-            "$or": [
-                {"serial_number": {"$regex": f"^{identifier}$", "$options": "i"}},
-                {"asset_tag": {"$regex": f"^{identifier}$", "$options": "i"}}
-            ]
+            **device_identifier_query(identifier)
         }, {"_id": 0})
         
         if not device:
@@ -6065,6 +5589,7 @@ async def confirm_bulk_amc_assignment(
         await db.amc_device_assignments.insert_one(assignment.model_dump())
         assigned.append(assignment.model_dump())
     
+    await warranty_pdf_cache.invalidate([a["device_id"] for a in assigned])
     return {
         "assigned_count": len(assigned),
         "assignments": assigned,
@@ -6090,6 +5615,7 @@ async def unassign_device_from_amc(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
+    await warranty_pdf_cache.invalidate([device_id])
     return {"message": "Device unassigned from contract"}
 
 # ==================== ADMIN DASHBOARD WITH ALERTS ====================
@@ -6131,142 +5657,127 @@ async def get_dashboard_stats(admin: dict = Depends(get_current_admin)):
 
 @api_router.get("/admin/dashboard/alerts")
 async def get_dashboard_alerts(admin: dict = Depends(get_current_admin)):
-    """Get warranty and AMC expiry alerts"""
-    today = get_ist_now()
-    
-    alerts = {
-        "warranty_expiring_7_days": [],
-        "warranty_expiring_15_days": [],
-        "warranty_expiring_30_days": [],
-        "amc_expiring_7_days": [],
-        "amc_expiring_15_days": [],
-        "amc_expiring_30_days": [],
-        "devices_in_repair": [],
-        "devices_lost": []
-    }
+    """Get warranty and AMC expiry alerts (one aggregation per collection, run concurrently)"""
+    today = get_ist_now().date()
     
-    # Get all devices with warranty
-    devices = await db.devices.find(
-        {"is_deleted": {"$ne": True}, "warranty_end_date": {"$ne": None}},
-        {"_id": 0}
-    ).to_list(1000)
+    def day(offset: int) -> str:
+        return (today + timedelta(days=offset)).strftime("%Y-%m-%d")
     
-    for device in devices:
-        days = days_until_expiry(device.get("warranty_end_date", ""))
-        if 0 < days <= 7:
-            alerts["warranty_expiring_7_days"].append({
-                "device_id": device.get("id"),
-                "brand": device.get("brand"),
-                "model": device.get("model"),
-                "serial_number": device.get("serial_number"),
-                "expiry_date": device.get("warranty_end_date"),
-                "days_remaining": days
-            })
-        elif 7 < days <= 15:
-            alerts["warranty_expiring_15_days"].append({
-                "device_id": device.get("id"),
-                "brand": device.get("brand"),
-                "model": device.get("model"),
-                "serial_number": device.get("serial_number"),
-                "expiry_date": device.get("warranty_end_date"),
-                "days_remaining": days
-            })
-        elif 15 < days <= 30:
-            alerts["warranty_expiring_30_days"].append({
-                "device_id": device.get("id"),
-                "brand": device.get("brand"),
-                "model": device.get("model"),
-                "serial_number": device.get("serial_number"),
-                "expiry_date": device.get("warranty_end_date"),
-                "days_remaining": days
-            })
-        
-        # Status alerts
-        if device.get("status") == "in_repair":
-            alerts["devices_in_repair"].append({
-                "device_id": device.get("id"),
-                "brand": device.get("brand"),
-                "model": device.get("model"),
-                "serial_number": device.get("serial_number")
-            })
-        elif device.get("status") == "lost":
-            alerts["devices_lost"].append({
-                "device_id": device.get("id"),
-                "brand": device.get("brand"),
-                "model": device.get("model"),
-                "serial_number": device.get("serial_number")
-            })
+    # Expiry buckets as half-open YYYY-MM-DD string ranges: 1-7, 8-15 and 16-30 days out.
+    # String ranges keep the predicates index-friendly and also accept ISO datetimes.
+    buckets = {"7": (day(1), day(8)), "15": (day(8), day(16)), "30": (day(16), day(31))}
     
-    # AMC alerts
-    amc_list = await db.amc.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(1000)
-    for amc in amc_list:
-        days = days_until_expiry(amc.get("end_date", ""))
-        device = await db.devices.find_one({"id": amc.get("device_id")}, {"_id": 0, "brand": 1, "model": 1, "serial_number": 1})
-        if not device:
-            continue
-            
-        alert_item = {
-            "amc_id": amc.get("id"),
-            "device_id": amc.get("device_id"),
-            "brand": device.get("brand"),
-            "model": device.get("model"),
-            "serial_number": device.get("serial_number"),
-            "expiry_date": amc.get("end_date"),
-            "days_remaining": days
+    def bucket_facets(date_field: str, projection: dict) -> dict:
+        return {
+            name: [
+                {"$match": {date_field: {"$gte": start, "$lt": end}}},
+                {"$sort": {date_field: 1}},
+                {"$project": projection}
+            ]
+            for name, (start, end) in buckets.items()
         }
-        
-        if 0 < days <= 7:
-            alerts["amc_expiring_7_days"].append(alert_item)
-        elif 7 < days <= 15:
-            alerts["amc_expiring_15_days"].append(alert_item)
-        elif 15 < days <= 30:
-            alerts["amc_expiring_30_days"].append(alert_item)
     
-    # AMC Contract (v2) alerts
-    alerts["amc_contracts_expiring_7_days"] = []
-    alerts["amc_contracts_expiring_15_days"] = []
-    alerts["amc_contracts_expiring_30_days"] = []
-    alerts["companies_without_amc"] = []
+    device_fields = {"_id": 0, "device_id": "$id", "brand": 1, "model": 1, "serial_number": 1}
     
-    contracts = await db.amc_contracts.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(1000)
-    for contract in contracts:
-        days = days_until_expiry(contract.get("end_date", ""))
-        company = await db.companies.find_one({"id": contract.get("company_id")}, {"_id": 0, "name": 1})
-        
-        alert_item = {
-            "contract_id": contract.get("id"),
-            "contract_name": contract.get("name"),
-            "company_id": contract.get("company_id"),
-            "company_name": company.get("name") if company else "Unknown",
-            "amc_type": contract.get("amc_type"),
-            "expiry_date": contract.get("end_date"),
-            "days_remaining": days
-        }
-        
-        if 0 < days <= 7:
-            alerts["amc_contracts_expiring_7_days"].append(alert_item)
-        elif 7 < days <= 15:
-            alerts["amc_contracts_expiring_15_days"].append(alert_item)
-        elif 15 < days <= 30:
-            alerts["amc_contracts_expiring_30_days"].append(alert_item)
-    
-    # Companies without any active AMC contract
-    companies = await db.companies.find({"is_deleted": {"$ne": True}}, {"_id": 0}).to_list(1000)
-    for company in companies:
-        has_active_contract = False
-        for contract in contracts:
-            if contract.get("company_id") == company["id"]:
-                status = get_amc_status(contract.get("start_date", ""), contract.get("end_date", ""))
-                if status == "active":
-                    has_active_contract = True
-                    break
-        
-        if not has_active_contract:
-            alerts["companies_without_amc"].append({
-                "company_id": company["id"],
-                "company_name": company.get("name"),
-                "contact_email": company.get("contact_email")
-            })
+    devices_pipeline = [
+        {"$match": {
+            "is_deleted": {"$ne": True},
+            "$or": [
+                {"warranty_end_date": {"$gte": day(1), "$lt": day(31)}},
+                {"status": {"$in": ["in_repair", "lost"]}}
+            ]
+        }},
+        {"$facet": {
+            **bucket_facets("warranty_end_date", {**device_fields, "expiry_date": "$warranty_end_date"}),
+            "in_repair": [{"$match": {"status": "in_repair"}}, {"$project": device_fields}],
+            "lost": [{"$match": {"status": "lost"}}, {"$project": device_fields}]
+        }}
+    ]
+    
+    legacy_amc_pipeline = [
+        {"$match": {"is_deleted": {"$ne": True}, "end_date": {"$gte": day(1), "$lt": day(31)}}},
+        {"$lookup": {"from": "devices", "localField": "device_id", "foreignField": "id", "as": "_device"}},
+        {"$unwind": "$_device"},
+        {"$facet": bucket_facets("end_date", {
+            "_id": 0,
+            "amc_id": "$id",
+            "device_id": 1,
+            "brand": "$_device.brand",
+            "model": "$_device.model",
+            "serial_number": "$_device.serial_number",
+            "expiry_date": "$end_date"
+        })}
+    ]
+    
+    contracts_pipeline = [
+        {"$match": {"is_deleted": {"$ne": True}, "end_date": {"$gte": day(1), "$lt": day(31)}}},
+        {"$lookup": {"from": "companies", "localField": "company_id", "foreignField": "id", "as": "_company"}},
+        {"$facet": bucket_facets("end_date", {
+            "_id": 0,
+            "contract_id": "$id",
+            "contract_name": "$name",
+            "company_id": 1,
+            "company_name": {"$ifNull": [{"$arrayElemAt": ["$_company.name", 0]}, "Unknown"]},
+            "amc_type": 1,
+            "expiry_date": "$end_date"
+        })}
+    ]
+    
+    # Companies without any active AMC contract (started on/before today, ending today or later)
+    companies_pipeline = [
+        {"$match": {"is_deleted": {"$ne": True}}},
+        {"$lookup": {
+            "from": "amc_contracts",
+            "let": {"company_id": "$id"},
+            "pipeline": [
+                {"$match": {
+                    "$expr": {"$eq": ["$company_id", "$$company_id"]},
+                    "is_deleted": {"$ne": True},
+                    "start_date": {"$lt": day(1)},
+                    "end_date": {"$gte": day(0)}
+                }},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "_active_contracts"
+        }},
+        {"$match": {"_active_contracts": {"$size": 0}}},
+        {"$project": {
+            "_id": 0,
+            "company_id": "$id",
+            "company_name": "$name",
+            "contact_email": {"$ifNull": ["$contact_email", None]}
+        }}
+    ]
+    
+    device_facets, amc_facets, contract_facets, companies_without_amc = await asyncio.gather(
+        db.devices.aggregate(devices_pipeline).to_list(1),
+        db.amc.aggregate(legacy_amc_pipeline).to_list(1),
+        db.amc_contracts.aggregate(contracts_pipeline).to_list(1),
+        db.companies.aggregate(companies_pipeline).to_list(None)
+    )
+    
+    def with_days(items: list) -> list:
+        for item in items:
+            item["days_remaining"] = days_until_expiry(str(item.get("expiry_date", ""))[:10])
+        return items
+    
+    device_facets = device_facets[0] if device_facets else {}
+    amc_facets = amc_facets[0] if amc_facets else {}
+    contract_facets = contract_facets[0] if contract_facets else {}
+    
+    alerts = {}
+    for name in buckets:
+        alerts[f"warranty_expiring_{name}_days"] = with_days(device_facets.get(name, []))
+    for name in buckets:
+        alerts[f"amc_expiring_{name}_days"] = with_days(amc_facets.get(name, []))
+    alerts["devices_in_repair"] = device_facets.get("in_repair", [])
+    alerts["devices_lost"] = device_facets.get("lost", [])
+    
+    # AMC Contract (v2) alerts
+    for name in buckets:
+        alerts[f"amc_contracts_expiring_{name}_days"] = with_days(contract_facets.get(name, []))
+    alerts["companies_without_amc"] = companies_without_amc
     
     return alerts
 
@@ -6313,7 +5824,8 @@ async def get_engineer_profile(engineer: dict = Depends(get_current_engineer)):
 @api_router.get("/engineer/my-visits")
 async def get_engineer_visits(
     status: Optional[str] = None,
-    engineer: dict = Depends(get_current_engineer)
+    engineer: dict = Depends(get_current_engineer),
+    loader: EntityLoader = Depends(get_loader)
 ):
     """Get all field visits assigned to this engineer"""
     query = {
@@ -6326,24 +5838,17 @@ async def get_engineer_visits(
     
     visits = await db.field_visits.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
     
+    devices = await loader.load_many("devices", [v["device_id"] for v in visits])
+    companies = await loader.load_many("companies", [v["company_id"] for v in visits])
+    tickets = await loader.load_many("service_tickets", [v["ticket_id"] for v in visits])
+    
     # Enrich with device and company info
     for visit in visits:
-        device = await db.devices.find_one(
-            {"id": visit["device_id"]},
-            {"_id": 0, "brand": 1, "model": 1, "serial_number": 1, "location": 1}
-        )
-        company = await db.companies.find_one(
-            {"id": visit["company_id"]},
-            {"_id": 0, "name": 1, "address": 1, "contact_phone": 1}
-        )
-        ticket = await db.service_tickets.find_one(
-            {"id": visit["ticket_id"]},
-            {"_id": 0, "ticket_number": 1, "subject": 1, "priority": 1, "issue_category": 1}
+        visit["device"] = pick_fields(devices.get(visit["device_id"]), "brand", "model", "serial_number", "location")
+        visit["company"] = pick_fields(companies.get(visit["company_id"]), "name", "address", "contact_phone")
+        visit["ticket"] = pick_fields(
+            tickets.get(visit["ticket_id"]), "ticket_number", "subject", "priority", "issue_category"
         )
-        
-        visit["device"] = device
-        visit["company"] = company
-        visit["ticket"] = ticket
     
     return visits
 
@@ -6559,6 +6064,7 @@ async def engineer_check_out(
     }
     
     await db.service_history.insert_one(service_record)
+    await sync_entities("service_history", service_record["id"])
     
     return {
         "success": True,
@@ -6620,6 +6126,7 @@ async def update_engineer(
     
     if update_dict:
         await db.engineers.update_one({"id": engineer_id}, {"$set": update_dict})
+        principal_cache.invalidate(ENGINEER, engineer_id)
     
     return {"success": True}
 
@@ -6631,6 +6138,7 @@ async def delete_engineer(engineer_id: str, admin: dict = Depends(get_current_ad
         {"id": engineer_id},
         {"$set": {"is_deleted": True}}
     )
+    principal_cache.invalidate(ENGINEER, engineer_id)
     return {"success": True}
 
 
@@ -6692,7 +6200,8 @@ async def assign_ticket_to_engineer(
 async def list_field_visits(
     status: Optional[str] = None,
     engineer_id: Optional[str] = None,
-    admin: dict = Depends(get_current_admin)
+    admin: dict = Depends(get_current_admin),
+    loader: EntityLoader = Depends(get_loader)
 ):
     """List all field visits"""
     query = {}
@@ -6703,15 +6212,15 @@ async def list_field_visits(
     
     visits = await db.field_visits.find(query, {"_id": 0}).sort("created_at", -1).to_list(200)
     
+    devices = await loader.load_many("devices", [v["device_id"] for v in visits])
+    companies = await loader.load_many("companies", [v["company_id"] for v in visits])
+    tickets = await loader.load_many("service_tickets", [v["ticket_id"] for v in visits])
+    
     # Enrich
     for visit in visits:
-        device = await db.devices.find_one({"id": visit["device_id"]}, {"_id": 0, "brand": 1, "model": 1, "serial_number": 1})
-        company = await db.companies.find_one({"id": visit["company_id"]}, {"_id": 0, "name": 1})
-        ticket = await db.service_tickets.find_one({"id": visit["ticket_id"]}, {"_id": 0, "ticket_number": 1, "subject": 1})
-        
-        visit["device"] = device
-        visit["company"] = company
-        visit["ticket"] = ticket
+        visit["device"] = pick_fields(devices.get(visit["device_id"]), "brand", "model", "serial_number")
+        visit["company"] = pick_fields(companies.get(visit["company_id"]), "name")
+        visit["ticket"] = pick_fields(tickets.get(visit["ticket_id"]), "ticket_number", "subject")
     
     return visits
 
@@ -6876,7 +6385,8 @@ async def list_company_devices(
     search: Optional[str] = None,
     device_type: Optional[str] = None,
     site_id: Optional[str] = None,
-    warranty_status: Optional[str] = None
+    warranty_status: Optional[str] = None,
+    loader: EntityLoader = Depends(get_loader)
 ):
     """List all devices for the company (read-only)"""
     company_id = user["company_id"]
@@ -6890,6 +6400,12 @@ async def list_company_devices(
     devices = await db.devices.find(query, {"_id": 0}).to_list(1000)
     today = get_ist_now().date()
     
+    assignments = await loader.load_grouped(
+        "amc_device_assignments", "device_id", [d["id"] for d in devices], {"status": "active"}
+    )
+    users = await loader.load_many("users", [d.get("assigned_user_id") for d in devices])
+    sites = await loader.load_many("sites", [d.get("site_id") for d in devices])
+    
     result = []
     for device in devices:
         # Calculate warranty status
@@ -6908,10 +6424,8 @@ async def list_company_devices(
             device["warranty_days_left"] = 0
         
         # Check AMC coverage
-        amc_assignment = await db.amc_device_assignments.find_one({
-            "device_id": device["id"],
-            "status": "active"
-        }, {"_id": 0})
+        device_assignments = assignments.get(device["id"])
+        amc_assignment = device_assignments[0] if device_assignments else None
         
         if amc_assignment:
             amc_end = amc_assignment.get("coverage_end")
@@ -6925,12 +6439,12 @@ async def list_company_devices(
         
         # Get assigned user name
         if device.get("assigned_user_id"):
-            assigned_user = await db.users.find_one({"id": device["assigned_user_id"]}, {"_id": 0, "name": 1})
+            assigned_user = users.get(device["assigned_user_id"])
             device["assigned_user_name"] = assigned_user.get("name") if assigned_user else None
         
         # Get site name
         if device.get("site_id"):
-            site = await db.sites.find_one({"id": device["site_id"]}, {"_id": 0, "name": 1})
+            site = sites.get(device["site_id"])
             device["site_name"] = site.get("name") if site else None
         
         # Filter by warranty status if specified
@@ -7281,7 +6795,10 @@ Order Created: {get_ist_isoformat()}</em>
     else:
         consumable_info = f"{len(order_items)} items, {total_quantity} units"
     
-    osticket_result = await create_osticket(
+    # Queue the osTicket ticket; the outbox dispatcher sends it in the background
+    outbox_entry = await enqueue_osticket(
+        "consumable_orders",
+        order.id,
         email=user.get("email", "noreply@warranty-portal.com"),
         name=user.get("name", "Portal User"),
         subject=f"[{order.order_number}] Consumable Order: {consumable_info}",
@@ -7289,24 +6806,15 @@ Order Created: {get_ist_isoformat()}</em>
         phone=user.get("phone", "")
     )
     
-    osticket_id = osticket_result.get("ticket_id")
-    osticket_error = osticket_result.get("error")
-    
-    # Update order with osTicket ID
-    if osticket_id:
-        await db.consumable_orders.update_one(
-            {"id": order.id},
-            {"$set": {"osticket_id": osticket_id}}
-        )
-    
     return {
         "message": "Consumable order submitted successfully",
         "order_number": order.order_number,
         "id": order.id,
         "items_count": len(order_items),
         "total_quantity": total_quantity,
-        "osticket_id": osticket_id,
-        "osticket_error": osticket_error
+        "osticket_id": None,
+        "osticket_status": "queued" if outbox_entry else None,
+        "osticket_error": None if outbox_entry else OSTICKET_NOT_CONFIGURED
     }
 
 @api_router.get("/company/consumable-orders")
@@ -7505,7 +7013,8 @@ async def save_ai_chat_history(data: AISupportHistoryRequest, user: dict = Depen
 @api_router.get("/company/tickets")
 async def list_company_tickets(
     user: dict = Depends(get_current_company_user),
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    loader: EntityLoader = Depends(get_loader)
 ):
     """List service tickets for the company"""
     query = {
@@ -7517,9 +7026,11 @@ async def list_company_tickets(
     
     tickets = await db.service_tickets.find(query, {"_id": 0}).sort("created_at", -1).to_list(200)
     
+    devices = await loader.load_many("devices", [t["device_id"] for t in tickets])
+    
     # Enrich with device info
     for ticket in tickets:
-        device = await db.devices.find_one({"id": ticket["device_id"]}, {"_id": 0, "serial_number": 1, "brand": 1, "model": 1, "device_type": 1})
+        device = devices.get(ticket["device_id"])
         if device:
             ticket["device_info"] = f"{device.get('brand', '')} {device.get('model', '')} ({device.get('serial_number', '')})"
             ticket["device_type"] = device.get("device_type")
@@ -7884,7 +7395,10 @@ Ticket Created: {get_ist_isoformat()}</em>
 </p>
 """
     
-    osticket_result = await create_osticket(
+    # Queue the osTicket ticket; the outbox dispatcher sends it in the background
+    outbox_entry = await enqueue_osticket(
+        "service_tickets",
+        ticket.id,
         email=user.get("email", "noreply@warranty-portal.com"),
         name=user.get("name", "Portal User"),
         subject=f"[{ticket.ticket_number}] {data.subject}",
@@ -7892,22 +7406,13 @@ Ticket Created: {get_ist_isoformat()}</em>
         phone=user.get("phone", "")
     )
     
-    osticket_id = osticket_result.get("ticket_id")
-    osticket_error = osticket_result.get("error")
-    
-    # Update ticket with osTicket reference if created successfully
-    if osticket_id:
-        await db.service_tickets.update_one(
-            {"id": ticket.id},
-            {"$set": {"osticket_id": osticket_id}}
-        )
-    
     return {
         "message": "Ticket created successfully", 
         "ticket_number": ticket.ticket_number, 
         "id": ticket.id,
-        "osticket_id": osticket_id,
-        "osticket_error": osticket_error
+        "osticket_id": None,
+        "osticket_status": "queued" if outbox_entry else None,
+        "osticket_error": None if outbox_entry else OSTICKET_NOT_CONFIGURED
     }
 
 @api_router.get("/company/tickets/{ticket_id}")
@@ -7968,11 +7473,10 @@ async def add_ticket_comment(ticket_id: str, data: ServiceTicketComment, user: d
 @api_router.post("/company/tickets/{ticket_id}/sync")
 async def sync_ticket_from_osticket(ticket_id: str, user: dict = Depends(get_current_company_user)):
     """
-    Manual sync: Fetch latest ticket status and replies from osTicket.
-    This allows users to see updates from osTicket without requiring webhooks.
+    Manual sync: refresh this ticket from osTicket in the background.
+    The fetch shares the reconciliation rate limiter (services.osticket_sync),
+    so this returns the locally stored ticket instead of calling osTicket inline.
     """
-    from services.osticket import fetch_osticket_details
-    
     # Get ticket from our database
     ticket = await db.service_tickets.find_one({
         "id": ticket_id,
@@ -7983,114 +7487,28 @@ async def sync_ticket_from_osticket(ticket_id: str, user: dict = Depends(get_cur
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    osticket_id = ticket.get("osticket_id")
-    if not osticket_id:
+    if not ticket.get("osticket_id"):
         raise HTTPException(
             status_code=400, 
             detail="This ticket is not linked to osTicket. No external reference to sync."
         )
     
-    # Fetch from osTicket API
-    result = await fetch_osticket_details(osticket_id)
-    
-    if result.get("error"):
-        raise HTTPException(
-            status_code=503,
-            detail=f"Could not sync from osTicket: {result['error']}"
-        )
-    
-    osticket_data = result.get("data")
-    if not osticket_data:
-        raise HTTPException(status_code=404, detail="No data returned from osTicket")
-    
-    # Map osTicket status to our status
-    status_mapping = {
-        "open": "open",
-        "new": "open",
-        "in progress": "in_progress",
-        "in-progress": "in_progress",
-        "pending": "pending",
-        "on hold": "on_hold",
-        "resolved": "resolved",
-        "closed": "closed",
-        "answered": "in_progress",
-        "overdue": "overdue"
-    }
-    
-    update_data = {
-        "updated_at": get_ist_isoformat(),
-        "last_synced_at": get_ist_isoformat()
-    }
-    
-    # Handle different osTicket API response formats
-    synced_info = {
-        "synced_at": get_ist_isoformat(),
-        "changes": []
-    }
-    
-    # Extract status from osTicket data
-    os_status = osticket_data.get("status") or osticket_data.get("status_name", "")
-    if os_status:
-        new_status = status_mapping.get(os_status.lower().strip(), None)
-        if new_status and new_status != ticket.get("status"):
-            update_data["status"] = new_status
-            synced_info["changes"].append(f"Status updated to '{new_status}'")
-            
-            if new_status == "resolved":
-                update_data["resolved_at"] = get_ist_isoformat()
-            elif new_status == "closed":
-                update_data["closed_at"] = get_ist_isoformat()
-    
-    # Extract thread/messages if available
-    thread = osticket_data.get("thread") or osticket_data.get("messages") or []
-    new_comments_count = 0
-    
-    if thread and isinstance(thread, list):
-        existing_comment_ids = set()
-        for c in ticket.get("comments", []):
-            if c.get("osticket_message_id"):
-                existing_comment_ids.add(c["osticket_message_id"])
-        
-        for msg in thread:
-            msg_id = str(msg.get("id") or msg.get("message_id", ""))
-            if msg_id and msg_id not in existing_comment_ids:
-                # New message from osTicket
-                comment = {
-                    "id": str(uuid.uuid4()),
-                    "osticket_message_id": msg_id,
-                    "user_id": None,
-                    "user_name": msg.get("poster") or msg.get("staff_name") or "osTicket Staff",
-                    "user_type": "osticket_staff",
-                    "comment": msg.get("body") or msg.get("message") or msg.get("content", ""),
-                    "attachments": [],
-                    "created_at": msg.get("created") or get_ist_isoformat(),
-                    "source": "osticket_sync"
-                }
-                
-                await db.service_tickets.update_one(
-                    {"id": ticket_id},
-                    {"$push": {"comments": comment}}
-                )
-                new_comments_count += 1
-        
-        if new_comments_count > 0:
-            synced_info["changes"].append(f"{new_comments_count} new message(s) synced")
-    
-    # Apply updates
-    await db.service_tickets.update_one({"id": ticket_id}, {"$set": update_data})
-    
-    # Fetch updated ticket
-    updated_ticket = await db.service_tickets.find_one({"id": ticket_id}, {"_id": 0})
+    sync_scheduled = await osticket_reconciler.request_sync("service_tickets", ticket)
     
     # Get device info for response
-    device = await db.devices.find_one({"id": updated_ticket["device_id"]}, {"_id": 0})
-    updated_ticket["device"] = device
+    device = await db.devices.find_one({"id": ticket["device_id"]}, {"_id": 0})
+    ticket["device"] = device
     
     return {
         "success": True,
-        "message": "Ticket synced from osTicket" if synced_info["changes"] else "Already up to date",
-        "changes": synced_info["changes"],
-        "ticket": updated_ticket
+        "message": (
+            "Sync requested - updates from osTicket will appear shortly" if sync_scheduled
+            else "This ticket was synced moments ago - updates from osTicket will appear with the next sync"
+        ),
+        "sync_scheduled": sync_scheduled,
+        "changes": [],
+        "last_synced_at": ticket.get("last_synced_at"),
+        "ticket": ticket
     }
 
 # --- Company Renewal Requests ---
@@ -8202,6 +7620,7 @@ async def update_company_profile(
         {"id": user["id"]},
         {"$set": update_data}
     )
+    principal_cache.invalidate(COMPANY_USER, user["id"])
     
     return {"message": "Profile updated successfully"}
 
@@ -8302,6 +7721,7 @@ async def update_company_user(user_id: str, updates: CompanyUserUpdate, admin: d
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    principal_cache.invalidate(COMPANY_USER, user_id)
     return {"message": "User updated"}
 
 @api_router.post("/admin/company-users/{user_id}/reset-password")
@@ -8324,6 +7744,7 @@ async def delete_company_user(user_id: str, admin: dict = Depends(get_current_ad
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    principal_cache.invalidate(COMPANY_USER, user_id)
     return {"message": "User deleted"}
 
 # ==================== OFFICE SUPPLIES ADMIN ENDPOINTS ====================
@@ -8670,8 +8091,10 @@ Order Created: {get_ist_isoformat()}</em>
 </p>
 """
     
-    # Create osTicket
-    osticket_result = await create_osticket(
+    # Queue the osTicket ticket; the outbox dispatcher sends it in the background
+    outbox_entry = await enqueue_osticket(
+        "supply_orders",
+        order.id,
         email=user.get("email", "noreply@warranty-portal.com"),
         name=user.get("name", "Portal User"),
         subject=f"[{order.order_number}] Office Supplies Order - {company.get('name', 'Company')}",
@@ -8679,23 +8102,14 @@ Order Created: {get_ist_isoformat()}</em>
         phone=user.get("phone", "")
     )
     
-    osticket_id = osticket_result.get("ticket_id")
-    osticket_error = osticket_result.get("error")
-    
-    # Update order with osTicket ID
-    if osticket_id:
-        await db.supply_orders.update_one(
-            {"id": order.id},
-            {"$set": {"osticket_id": osticket_id}}
-        )
-    
     return {
         "message": "Order submitted successfully",
         "order_number": order.order_number,
         "id": order.id,
         "items_count": len(order_items),
-        "osticket_id": osticket_id,
-        "osticket_error": osticket_error
+        "osticket_id": None,
+        "osticket_status": "queued" if outbox_entry else None,
+        "osticket_error": None if outbox_entry else OSTICKET_NOT_CONFIGURED
     }
 
 @api_router.get("/company/supply-orders")
@@ -8716,6 +8130,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
 @app.on_event("startup")
@@ -8723,9 +8138,40 @@ async def startup_event():
     # Ensure uploads directory exists
     UPLOAD_DIR.mkdir(exist_ok=True)
     
+    # Backfill device lookup keys before the unique per-tenant indexes are built
+    await backfill_device_lookup_keys()
+    
+    # Apply the index manifest (no-op when everything already exists)
+    await ensure_indexes()
+    
+    # Build the universal search index on first boot (runs in the background)
+    app.state.search_index_build = await ensure_search_index()
+    
     # Seed default supply categories and products
     await seed_default_supplies()
+    
+    # PDF / QR rendering workers; drop render job files past retention
+    render_pool.start()
+    purge_expired_job_files()
+    
+    # Pooled outbound HTTP clients and the Razorpay SDK thread pool,
+    # then deliver queued osTicket tickets in the background
+    http_clients.start()
+    razorpay_gateway.start()
+    osticket_dispatcher.start()
+    
+    # Periodic osTicket status reconciliation (one worker per round)
+    osticket_reconciler.start()
+    
+    # Apply stored webhook events in the background
+    webhook_worker.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await webhook_worker.shutdown()
+    await osticket_reconciler.shutdown()
+    await osticket_dispatcher.shutdown()
+    await http_clients.close()
+    razorpay_gateway.shutdown()
+    render_pool.shutdown()
     client.close()
@@ -8,7 +8,30 @@ from services.auth import (
     require_company_admin,
     get_current_engineer,
     log_audit,
-    security
+    security,
+    PRINCIPAL_PROJECTION
 )
 from services.osticket import create_osticket
 from services.seeding import seed_default_masters, seed_default_supplies
+from services.indexes import ensure_indexes, index_report
+from services.loader import EntityLoader, get_loader, pick_fields
+from services.search_index import (
+    search_entities,
+    sync_entities,
+    sync_matching,
+    rebuild_search_index,
+    ensure_search_index
+)
+from services.principal_cache import principal_cache, PrincipalCache
+from services.render_pool import render_pool, RenderPool
+from services.render_jobs import create_job, get_job, start_job, job_file_response, purge_expired_job_files
+from services.warranty_pdf_cache import warranty_pdf_cache, WarrantyPdfCache
+from services.warranty_reports import render_warranty_report, load_report_inputs
+from services.osticket_outbox import enqueue_osticket, osticket_dispatcher, OsTicketDispatcher
+from services.http_clients import http_clients, HttpClientRegistry
+from services.osticket_sync import osticket_reconciler, OsTicketReconciler
+from services.webhooks import webhook_worker, store_event, WebhookWorker
+from services.leases import acquire_lease, release_lease
+from services.razorpay_gateway import razorpay_gateway, RazorpayGateway
+from services.bulk_import import CompanyLookup, BulkImport, IMPORT_MODES, create_import, stream_upload_import
+from services.deployment_devices import sync_items_to_devices, linked_ids_update
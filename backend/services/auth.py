@@ -12,6 +12,7 @@ from passlib.context import CryptContext
 from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 from database import db
 from models.common import AuditLog
+from services.principal_cache import principal_cache, ADMIN, COMPANY_USER, ENGINEER
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,10 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Security dependency for JWT authentication
 security = HTTPBearer()
 
+# Principal documents are cached, so never load password hashes with them
+# (org users store theirs as hashed_password, the other accounts as password_hash)
+PRINCIPAL_PROJECTION = {"_id": 0, "password_hash": 0, "hashed_password": 0}
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -50,9 +55,12 @@ async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    admin = await db.admins.find_one({"email": email}, {"_id": 0})
+    admin = principal_cache.get(ADMIN, email)
     if admin is None:
-        raise credentials_exception
+        admin = await db.admins.find_one({"email": email}, PRINCIPAL_PROJECTION)
+        if admin is None:
+            raise credentials_exception
+        principal_cache.set(ADMIN, email, admin)
     return admin
 
 
@@ -72,12 +80,15 @@ async def get_current_company_user(credentials: HTTPAuthorizationCredentials = D
     except JWTError:
         raise credentials_exception
     
-    user = await db.company_users.find_one(
-        {"id": user_id, "is_active": True, "is_deleted": {"$ne": True}}, 
-        {"_id": 0, "password_hash": 0}
-    )
+    user = principal_cache.get(COMPANY_USER, user_id)
     if user is None:
-        raise credentials_exception
+        user = await db.company_users.find_one(
+            {"id": user_id, "is_active": True, "is_deleted": {"$ne": True}}, 
+            PRINCIPAL_PROJECTION
+        )
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(COMPANY_USER, user_id, user)
     return user
 
 
@@ -120,10 +131,13 @@ async def get_current_engineer(credentials: HTTPAuthorizationCredentials = Depen
     except JWTError:
         raise credentials_exception
     
-    engineer = await db.engineers.find_one(
-        {"id": engineer_id, "is_active": True, "is_deleted": {"$ne": True}}, 
-        {"_id": 0, "password_hash": 0}
-    )
+    engineer = principal_cache.get(ENGINEER, engineer_id)
     if engineer is None:
-        raise credentials_exception
+        engineer = await db.engineers.find_one(
+            {"id": engineer_id, "is_active": True, "is_deleted": {"$ne": True}}, 
+            PRINCIPAL_PROJECTION
+        )
+        if engineer is None:
+            raise credentials_exception
+        principal_cache.set(ENGINEER, engineer_id, engineer)
     return engineer
@@ -0,0 +1,784 @@
+"""
+Bulk imports (companies, sites, devices, supply products)
+Records arrive as JSON (the import UI parses the spreadsheet) or as an
+uploaded CSV / XLSX file, and go through the same importers. An importer is
+fed records with add() and imports them in chunks of BULK_IMPORT_CHUNK_SIZE.
+
+Devices, the large imports, are batched per chunk:
+- every row of a chunk is validated first (required fields, company)
+- duplicate serials are found with one `$in` query on serial_key per chunk,
+  along with serials repeated earlier in the same file
+- the remaining rows are written with insert_many(ordered=False); a row the
+  database rejects (e.g. the same serial inserted concurrently) is reported
+  without failing the rest of the chunk
+
+Upsert mode (every kind) matches rows on natural keys instead of rejecting
+existing records: company code, site code within the company (the site name
+when there is no code), normalized serial, product name within its category.
+Serials are unique across companies, so a serial registered to another
+company (or an organization) is reported as a row error, never moved.
+Each chunk fetches the matching records with one `$in` query and applies one
+bulk_write: UpdateOne(upsert=True) for new records, a $set of the changed
+columns for existing ones. Blank cells never clear a stored value. The
+result lists every row as created, updated or unchanged.
+
+Uploaded files are parsed in a worker thread one chunk at a time
+(stream_upload_import), so memory stays bounded however large the file is,
+and progress is reported after every chunk.
+
+Company lookups are read from a projected cursor, so every company resolves,
+however many there are. Row numbers in errors are spreadsheet rows (the
+header is row 1).
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import BULK_IMPORT_CHUNK_SIZE
+from database import db
+from models.company import Company
+from models.device import Device
+from models.site import Site
+from models.supplies import SupplyCategory, SupplyProduct
+from services.search_index import sync_entities
+from services.warranty_pdf_cache import warranty_pdf_cache
+from utils.helpers import get_ist_isoformat, normalize_lookup_key
+from utils.spreadsheets import iter_record_chunks
+
+logger = logging.getLogger(__name__)
+
+# Spreadsheet row of the first record (row 1 is the header)
+FIRST_ROW = 2
+
+# Import modes
+INSERT = "insert"
+UPSERT = "upsert"
+IMPORT_MODES = (INSERT, UPSERT)
+
+# Upsert row outcomes
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+
+
+class CompanyLookup:
+    """Company id by code (case-insensitive) or name"""
+
+    def __init__(self):
+        self.by_code: Dict[str, str] = {}
+        self.by_name: Dict[str, str] = {}
+
+    @classmethod
+    async def load(cls) -> "CompanyLookup":
+        lookup = cls()
+        cursor = db.companies.find({"is_deleted": {"$ne": True}}, {"_id": 0, "id": 1, "code": 1, "name": 1})
+        async for company in cursor:
+            if company.get("code"):
+                lookup.by_code[company["code"].upper()] = company["id"]
+            if company.get("name"):
+                lookup.by_name[company["name"].lower()] = company["id"]
+        return lookup
+
+    def resolve(self, record: dict) -> Optional[str]:
+        """The company a row refers to by company_code, then company_name"""
+        company_id = None
+        if record.get("company_code"):
+            company_id = self.by_code.get(str(record["company_code"]).upper())
+        if not company_id and record.get("company_name"):
+            company_id = self.by_name.get(str(record["company_name"]).lower())
+        return company_id
+
+
+def _supplied(record: dict, columns: Dict[str, str]) -> dict:
+    """Model field -> value for the columns a row actually fills"""
+    return {field: record[column] for field, column in columns.items() if record.get(column) not in (None, "")}
+
+
+class BulkImport:
+    """
+    One import; feed it records with add() and read result().
+    Upsert support: subclasses set `collection` / `update_columns` and
+    implement _resolve(), _find_existing() and _key_filter().
+    """
+
+    collection: str = ""
+    # Model field -> spreadsheet column that may update it in upsert mode
+    update_columns: Dict[str, str] = {}
+
+    def __init__(self, chunk_size: int = BULK_IMPORT_CHUNK_SIZE, mode: str = INSERT):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+        self.chunk_size = max(1, chunk_size)
+        self.mode = mode
+        self.rows = 0
+        self.success = 0
+        self.errors: List[dict] = []
+        # Upsert mode
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.row_results: List[dict] = []
+        self._seen_keys: Dict[Hashable, int] = {}
+
+    async def add(self, records: List[dict]):
+        """Import the next records of the file"""
+        for start in range(0, len(records), self.chunk_size):
+            chunk = records[start:start + self.chunk_size]
+            rows = list(enumerate(chunk, FIRST_ROW + self.rows))
+            self.rows += len(chunk)
+            if self.mode == UPSERT:
+                await self._upsert_chunk(rows)
+            else:
+                await self._import_chunk(rows)
+
+    async def _import_chunk(self, rows: List[Tuple[int, dict]]):
+        raise NotImplementedError
+
+    def _error(self, row: int, message: str):
+        self.errors.append({"row": row, "message": message})
+
+    # ---- Upsert mode ----
+
+    async def _resolve(self, row: int, record: dict) -> Optional[Tuple[Hashable, dict]]:
+        """Validate a row: (natural key, resolved fields such as company_id), or None after reporting an error"""
+        raise NotImplementedError
+
+    def _build(self, record: dict, resolved: dict) -> dict:
+        """The full document for a new record"""
+        raise NotImplementedError
+
+    def _values(self, record: dict, resolved: dict) -> dict:
+        """Fields the row sets on an existing record"""
+        return {**_supplied(record, self.update_columns), **resolved}
+
+    async def _find_existing(self, keys: List[Hashable]) -> Dict[Hashable, dict]:
+        """Live records matching the natural keys, by key"""
+        raise NotImplementedError
+
+    def _key_filter(self, key: Hashable) -> dict:
+        raise NotImplementedError
+
+    def _describe(self, key: Hashable) -> str:
+        return str(key)
+
+    def _conflict(self, current: dict, resolved: dict) -> Optional[str]:
+        """Why the row may not update the matched record, if it may not"""
+        return None
+
+    async def _after_upsert(self, changed_ids: List[str], updated_ids: List[str]):
+        if changed_ids:
+            await sync_entities(self.collection, *changed_ids)
+
+    async def _upsert_chunk(self, rows: List[Tuple[int, dict]]):
+        resolved_rows = []
+        for row, record in rows:
+            try:
+                resolved = await self._resolve(row, record)
+            except Exception as e:
+                self._error(row, str(e))
+                continue
+            if resolved is None:
+                continue
+            key, fields = resolved
+            if key in self._seen_keys:
+                self._error(row, f"{self._describe(key)} is repeated in the file (row {self._seen_keys[key]})")
+                continue
+            self._seen_keys[key] = row
+            resolved_rows.append((row, record, key, fields))
+
+        existing = await self._find_existing(list({key for _, _, key, _ in resolved_rows}))
+        now = get_ist_isoformat()
+        operations = []
+        planned = []  # (row, outcome, record id) per operation
+        for row, record, key, fields in resolved_rows:
+            try:
+                current = existing.get(key)
+                if current is None:
+                    document = self._build(record, fields)
+                    operations.append(UpdateOne(self._key_filter(key), {"$setOnInsert": document}, upsert=True))
+                    planned.append((row, CREATED, document["id"]))
+                    continue
+                conflict = self._conflict(current, fields)
+                if conflict:
+                    self._error(row, conflict)
+                    continue
+                changes = {f: v for f, v in self._values(record, fields).items() if current.get(f) != v}
+                if not changes:
+                    self._record(row, UNCHANGED, current["id"])
+                    continue
+                changes["updated_at"] = now
+                operations.append(UpdateOne({"id": current["id"]}, {"$set": changes}))
+                planned.append((row, UPDATED, current["id"]))
+            except Exception as e:
+                self._error(row, str(e))
+        if not operations:
+            return
+
+        write_errors = {}
+        try:
+            result = await db[self.collection].bulk_write(operations, ordered=False)
+            upserted = set(result.upserted_ids)
+        except BulkWriteError as e:
+            upserted = {u["index"] for u in e.details.get("upserted", [])}
+            write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+        changed_ids, updated_ids = [], []
+        for index, (row, outcome, record_id) in enumerate(planned):
+            error = write_errors.get(index)
+            if error is not None:
+                self._error(row, "Duplicate record" if error.get("code") == 11000 else error.get("errmsg", "Write failed"))
+                continue
+            if outcome == CREATED and index not in upserted:
+                # Created by someone else between the probe and the write; $setOnInsert left it alone
+                outcome = UNCHANGED
+            self._record(row, outcome, record_id)
+            if outcome != UNCHANGED:
+                changed_ids.append(record_id)
+            if outcome == UPDATED:
+                updated_ids.append(record_id)
+        await self._after_upsert(changed_ids, updated_ids)
+
+    def _record(self, row: int, outcome: str, record_id: str):
+        if outcome == CREATED:
+            self.created += 1
+        elif outcome == UPDATED:
+            self.updated += 1
+        else:
+            self.unchanged += 1
+        self.success += 1
+        self.row_results.append({"row": row, "status": outcome, "id": record_id})
+
+    def progress(self) -> dict:
+        progress = {"rows": self.rows, "success": self.success, "errors": len(self.errors)}
+        if self.mode == UPSERT:
+            progress.update(created=self.created, updated=self.updated, unchanged=self.unchanged)
+        return progress
+
+    def result(self) -> dict:
+        self.errors.sort(key=lambda e: e["row"])
+        if self.mode != UPSERT:
+            return {"success": self.success, "errors": self.errors}
+        self.row_results.sort(key=lambda r: r["row"])
+        return {
+            "success": self.success,
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "rows": self.row_results,
+            "errors": self.errors
+        }
+
+
+class CompanyImport(BulkImport):
+
+    collection = "companies"
+    update_columns = {
+        "name": "name",
+        "gst_number": "gst_number",
+        "address": "address",
+        "contact_name": "contact_name",
+        "contact_email": "contact_email",
+        "contact_phone": "contact_phone",
+        "notes": "notes",
+    }
+
+    @staticmethod
+    def _code(record: dict) -> Optional[str]:
+        return record.get("company_code") or record.get("code")
+
+    def _build(self, record: dict, resolved: dict) -> dict:
+        company_code = self._code(record)
+        return Company(
+            name=record.get("name"),
+            code=company_code or f"C{str(uuid.uuid4())[:6].upper()}",
+            industry=record.get("industry"),
+            contact_name=record.get("contact_name"),
+            contact_email=record.get("contact_email"),
+            contact_phone=record.get("contact_phone"),
+            address=record.get("address"),
+            city=record.get("city"),
+            state=record.get("state"),
+            country=record.get("country", "India"),
+            pincode=record.get("pincode"),
+            gst_number=record.get("gst_number"),
+            notes=record.get("notes"),
+            status="active"
+        ).model_dump()
+
+    async def _import_chunk(self, rows: List[Tuple[int, dict]]):
+        imported_ids = []
+        for row, record in rows:
+            try:
+                # Check required fields
+                if not record.get("name"):
+                    self._error(row, "Company name is required")
+                    continue
+
+                # Check for duplicate company code (field is 'code' in Company model)
+                company_code = self._code(record)
+                if company_code:
+                    existing = await db.companies.find_one({
+                        "code": company_code,
+                        "is_deleted": {"$ne": True}
+                    })
+                    if existing:
+                        self._error(row, f"Company code {company_code} already exists")
+                        continue
+
+                company = self._build(record, {})
+                await db.companies.insert_one(company)
+                imported_ids.append(company["id"])
+                self.success += 1
+
+            except Exception as e:
+                self._error(row, str(e))
+
+        await sync_entities("companies", *imported_ids)
+
+    async def _resolve(self, row: int, record: dict) -> Optional[Tuple[Hashable, dict]]:
+        if not record.get("name"):
+            self._error(row, "Company name is required")
+            return None
+        company_code = self._code(record)
+        if not company_code:
+            self._error(row, "Company code is required to upsert")
+            return None
+        return company_code, {}
+
+    async def _find_existing(self, keys: List[Hashable]) -> Dict[Hashable, dict]:
+        if not keys:
+            return {}
+        cursor = db.companies.find({"code": {"$in": keys}, "is_deleted": {"$ne": True}}, {"_id": 0})
+        return {c["code"]: c async for c in cursor}
+
+    def _key_filter(self, key: Hashable) -> dict:
+        return {"code": key, "is_deleted": {"$ne": True}}
+
+    def _describe(self, key: Hashable) -> str:
+        return f"Company code {key}"
+
+    async def _after_upsert(self, changed_ids: List[str], updated_ids: List[str]):
+        await super()._after_upsert(changed_ids, updated_ids)
+        for company_id in updated_ids:
+            await warranty_pdf_cache.invalidate(company_id=company_id)
+
+
+class SiteImport(BulkImport):
+
+    collection = "sites"
+    update_columns = {
+        "name": "name",
+        "site_type": "site_type",
+        "address": "address",
+        "city": "city",
+        "primary_contact_name": "contact_person",
+        "contact_number": "contact_phone",
+        "contact_email": "contact_email",
+        "notes": "notes",
+    }
+
+    def __init__(self, companies: CompanyLookup, chunk_size: int = BULK_IMPORT_CHUNK_SIZE, mode: str = INSERT):
+        super().__init__(chunk_size, mode)
+        self.companies = companies
+
+    def _build(self, record: dict, resolved: dict) -> dict:
+        return Site(
+            company_id=resolved["company_id"],
+            name=record.get("name"),
+            site_code=record.get("site_code"),
+            site_type=record.get("site_type") or "office",
+            address=record.get("address"),
+            city=record.get("city"),
+            state=record.get("state"),
+            pincode=record.get("pincode"),
+            country=record.get("country", "India"),
+            primary_contact_name=record.get("contact_person"),
+            contact_number=record.get("contact_phone"),
+            contact_email=record.get("contact_email"),
+            notes=record.get("notes"),
+            status="active"
+        ).model_dump()
+
+    async def _import_chunk(self, rows: List[Tuple[int, dict]]):
+        imported_ids = []
+        for row, record in rows:
+            try:
+                if not record.get("name"):
+                    self._error(row, "Site name is required")
+                    continue
+
+                company_id = self.companies.resolve(record)
+                if not company_id:
+                    self._error(row, "Company not found")
+                    continue
+
+                site = self._build(record, {"company_id": company_id})
+                await db.sites.insert_one(site)
+                imported_ids.append(site["id"])
+                self.success += 1
+
+            except Exception as e:
+                self._error(row, str(e))
+
+        await sync_entities("sites", *imported_ids)
+
+    async def _resolve(self, row: int, record: dict) -> Optional[Tuple[Hashable, dict]]:
+        if not record.get("name"):
+            self._error(row, "Site name is required")
+            return None
+        company_id = self.companies.resolve(record)
+        if not company_id:
+            self._error(row, "Company not found")
+            return None
+        if record.get("site_code"):
+            return ("site_code", company_id, record["site_code"]), {"company_id": company_id}
+        return ("name", company_id, record["name"]), {"company_id": company_id}
+
+    def _values(self, record: dict, resolved: dict) -> dict:
+        values = super()._values(record, resolved)
+        if record.get("site_code"):
+            values["site_code"] = record["site_code"]
+        return values
+
+    async def _find_existing(self, keys: List[Hashable]) -> Dict[Hashable, dict]:
+        if not keys:
+            return {}
+        codes = [value for field, _, value in keys if field == "site_code"]
+        names = [value for field, _, value in keys if field == "name"]
+        cursor = db.sites.find({
+            "company_id": {"$in": list({company_id for _, company_id, _ in keys})},
+            "is_deleted": {"$ne": True},
+            "$or": [{"site_code": {"$in": codes}}, {"name": {"$in": names}}]
+        }, {"_id": 0})
+        existing = {}
+        async for site in cursor:
+            if site.get("site_code"):
+                existing.setdefault(("site_code", site["company_id"], site["site_code"]), site)
+            existing.setdefault(("name", site["company_id"], site["name"]), site)
+        return existing
+
+    def _key_filter(self, key: Hashable) -> dict:
+        field, company_id, value = key
+        return {"company_id": company_id, field: value, "is_deleted": {"$ne": True}}
+
+    def _describe(self, key: Hashable) -> str:
+        field, _, value = key
+        return f"Site code {value}" if field == "site_code" else f"Site {value}"
+
+
+def build_import_device(record: dict, company_id: str) -> Device:
+    return Device(
+        company_id=company_id,
+        device_type=record.get("device_type", "Laptop"),
+        brand=record.get("brand"),
+        model=record.get("model"),
+        serial_number=record.get("serial_number"),
+        asset_tag=record.get("asset_tag"),
+        purchase_date=record.get("purchase_date", get_ist_isoformat().split("T")[0]),
+        purchase_cost=float(record["purchase_cost"]) if record.get("purchase_cost") else None,
+        vendor=record.get("vendor"),
+        warranty_end_date=record.get("warranty_end_date"),
+        location=record.get("location"),
+        condition=record.get("condition", "good"),
+        status=record.get("status", "active"),
+        notes=record.get("notes")
+    )
+
+
+class DeviceImport(BulkImport):
+
+    collection = "devices"
+    update_columns = {
+        "device_type": "device_type",
+        "brand": "brand",
+        "model": "model",
+        "serial_number": "serial_number",
+        "asset_tag": "asset_tag",
+        "purchase_date": "purchase_date",
+        "purchase_cost": "purchase_cost",
+        "vendor": "vendor",
+        "warranty_end_date": "warranty_end_date",
+        "location": "location",
+        "condition": "condition",
+        "status": "status",
+        "notes": "notes",
+    }
+
+    def __init__(self, companies: CompanyLookup, chunk_size: int = BULK_IMPORT_CHUNK_SIZE, mode: str = INSERT):
+        super().__init__(chunk_size, mode)
+        self.companies = companies
+        # Serial key -> row that claimed it, for duplicates within the file
+        self._seen: Dict[str, int] = {}
+
+    def _check_required(self, row: int, record: dict) -> Optional[str]:
+        """The row's company id, or None after reporting what is missing"""
+        if not record.get("serial_number"):
+            self._error(row, "Serial number is required")
+            return None
+        if not record.get("brand"):
+            self._error(row, "Brand is required")
+            return None
+        if not record.get("model"):
+            self._error(row, "Model is required")
+            return None
+        company_id = self.companies.resolve(record)
+        if not company_id:
+            self._error(row, "Company not found")
+            return None
+        return company_id
+
+    def _validate(self, row: int, record: dict) -> Optional[Device]:
+        company_id = self._check_required(row, record)
+        if not company_id:
+            return None
+        try:
+            return build_import_device(record, company_id)
+        except Exception as e:
+            self._error(row, str(e))
+            return None
+
+    async def _import_chunk(self, rows: List[Tuple[int, dict]]):
+        candidates = []
+        for row, record in rows:
+            device = self._validate(row, record)
+            if device:
+                candidates.append((row, device))
+
+        # One probe for every serial in the chunk
+        keys = list({device.serial_key for _, device in candidates if device.serial_key})
+        existing = set()
+        if keys:
+            cursor = db.devices.find(
+                {"serial_key": {"$in": keys}, "is_deleted": {"$ne": True}},
+                {"_id": 0, "serial_key": 1}
+            )
+            existing = {d["serial_key"] async for d in cursor}
+
+        pending = []
+        for row, device in candidates:
+            key = device.serial_key
+            if key in existing:
+                self._error(row, f"Serial number {device.serial_number} already exists")
+            elif key and key in self._seen:
+                self._error(row, f"Serial number {device.serial_number} is repeated in the file (row {self._seen[key]})")
+            else:
+                if key:
+                    self._seen[key] = row
+                pending.append((row, device))
+        if not pending:
+            return
+
+        rejected = {}
+        try:
+            await db.devices.insert_many([device.model_dump() for _, device in pending], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                rejected[error["index"]] = error
+        inserted_ids = []
+        for index, (row, device) in enumerate(pending):
+            error = rejected.get(index)
+            if error is None:
+                inserted_ids.append(device.id)
+            elif error.get("code") == 11000:
+                self._error(row, f"Serial number {device.serial_number} already exists")
+            else:
+                self._error(row, error.get("errmsg", "Insert failed"))
+        self.success += len(inserted_ids)
+        await sync_entities("devices", *inserted_ids)
+
+    async def _resolve(self, row: int, record: dict) -> Optional[Tuple[Hashable, dict]]:
+        company_id = self._check_required(row, record)
+        if not company_id:
+            return None
+        serial_key = normalize_lookup_key(record["serial_number"])
+        if not serial_key:
+            self._error(row, f"Serial number {record['serial_number']} is not valid")
+            return None
+        return serial_key, {"company_id": company_id}
+
+    def _build(self, record: dict, resolved: dict) -> dict:
+        return build_import_device(record, resolved["company_id"]).model_dump()
+
+    def _values(self, record: dict, resolved: dict) -> dict:
+        # Serials are global; a row never moves a device to its company
+        values = _supplied(record, self.update_columns)
+        if "purchase_cost" in values:
+            values["purchase_cost"] = float(values["purchase_cost"])
+        if "asset_tag" in values:
+            values["asset_tag_key"] = normalize_lookup_key(values["asset_tag"])
+        return values
+
+    async def _find_existing(self, keys: List[Hashable]) -> Dict[Hashable, dict]:
+        if not keys:
+            return {}
+        cursor = db.devices.find({"serial_key": {"$in": keys}, "is_deleted": {"$ne": True}}, {"_id": 0})
+        return {d["serial_key"]: d async for d in cursor}
+
+    def _key_filter(self, key: Hashable) -> dict:
+        return {"serial_key": key, "is_deleted": {"$ne": True}}
+
+    def _describe(self, key: Hashable) -> str:
+        return f"Serial number {key}"
+
+    def _conflict(self, current: dict, resolved: dict) -> Optional[str]:
+        if current.get("organization_id") or current.get("company_id") != resolved["company_id"]:
+            return f"Serial number {current.get('serial_number')} belongs to another company"
+        return None
+
+    async def _after_upsert(self, changed_ids: List[str], updated_ids: List[str]):
+        await super()._after_upsert(changed_ids, updated_ids)
+        await warranty_pdf_cache.invalidate(updated_ids)
+
+
+class SupplyProductImport(BulkImport):
+
+    collection = "supply_products"
+    update_columns = {
+        "description": "description",
+        "unit": "unit",
+        "internal_notes": "internal_notes",
+    }
+
+    def __init__(self, category_by_name: Dict[str, str], chunk_size: int = BULK_IMPORT_CHUNK_SIZE, mode: str = INSERT):
+        super().__init__(chunk_size, mode)
+        self.category_by_name = category_by_name
+
+    async def _category_id(self, row: int, record: dict) -> Optional[str]:
+        """The row's category, created when it does not exist yet"""
+        category_id = None
+        if record.get("category"):
+            category_id = self.category_by_name.get(record["category"].lower())
+
+        if not category_id:
+            # Create category if it doesn't exist
+            if record.get("category"):
+                new_cat = SupplyCategory(name=record["category"])
+                await db.supply_categories.insert_one(new_cat.model_dump())
+                category_id = new_cat.id
+                self.category_by_name[record["category"].lower()] = category_id
+            else:
+                self._error(row, "Category is required")
+        return category_id
+
+    def _build(self, record: dict, resolved: dict) -> dict:
+        return SupplyProduct(
+            category_id=resolved["category_id"],
+            name=record.get("name"),
+            description=record.get("description"),
+            unit=record.get("unit", "piece"),
+            internal_notes=record.get("internal_notes")
+        ).model_dump()
+
+    async def _import_chunk(self, rows: List[Tuple[int, dict]]):
+        for row, record in rows:
+            try:
+                if not record.get("name"):
+                    self._error(row, "Product name is required")
+                    continue
+
+                category_id = await self._category_id(row, record)
+                if not category_id:
+                    continue
+
+                await db.supply_products.insert_one(self._build(record, {"category_id": category_id}))
+                self.success += 1
+
+            except Exception as e:
+                self._error(row, str(e))
+
+    async def _resolve(self, row: int, record: dict) -> Optional[Tuple[Hashable, dict]]:
+        if not record.get("name"):
+            self._error(row, "Product name is required")
+            return None
+        category_id = await self._category_id(row, record)
+        if not category_id:
+            return None
+        return (category_id, record["name"]), {"category_id": category_id}
+
+    async def _find_existing(self, keys: List[Hashable]) -> Dict[Hashable, dict]:
+        if not keys:
+            return {}
+        cursor = db.supply_products.find({
+            "category_id": {"$in": list({category_id for category_id, _ in keys})},
+            "name": {"$in": list({name for _, name in keys})},
+            "is_deleted": {"$ne": True}
+        }, {"_id": 0})
+        return {(p["category_id"], p["name"]): p async for p in cursor}
+
+    def _key_filter(self, key: Hashable) -> dict:
+        category_id, name = key
+        return {"category_id": category_id, "name": name, "is_deleted": {"$ne": True}}
+
+    def _describe(self, key: Hashable) -> str:
+        return f"Product {key[1]}"
+
+    async def _after_upsert(self, changed_ids: List[str], updated_ids: List[str]):
+        pass  # Supply products are not in the search index
+
+
+# Import kinds, as in /admin/bulk-import/{kind}
+IMPORT_KINDS = ("companies", "sites", "devices", "supply-products")
+
+
+async def create_import(kind: str, mode: str = INSERT) -> BulkImport:
+    """A fresh importer of `kind` with its lookups loaded"""
+    if kind == "companies":
+        return CompanyImport(mode=mode)
+    if kind == "sites":
+        return SiteImport(await CompanyLookup.load(), mode=mode)
+    if kind == "devices":
+        return DeviceImport(await CompanyLookup.load(), mode=mode)
+    if kind == "supply-products":
+        cursor = db.supply_categories.find({"is_deleted": {"$ne": True}}, {"_id": 0, "id": 1, "name": 1})
+        return SupplyProductImport({c["name"].lower(): c["id"] async for c in cursor}, mode=mode)
+    raise ValueError(f"Unknown import kind: {kind}")
+
+
+def _ndjson(line: dict) -> str:
+    return json.dumps(line) + "\n"
+
+
+async def stream_upload_import(kind: str, path: str, filename: str, mode: str = INSERT) -> AsyncIterator[str]:
+    """
+    Import an uploaded CSV / XLSX file saved at `path`, yielding one NDJSON
+    line per chunk ({"chunk", "rows", "success", "errors"}) and a final line
+    with "done": true and the import result (or "error"). Deletes the file.
+    """
+    chunks = None
+    try:
+        importer = await create_import(kind, mode)
+        chunks = iter_record_chunks(path, filename, importer.chunk_size)
+        chunk_number = 0
+        while True:
+            # Parse the next chunk off the event loop; only one chunk is in memory at a time
+            records = await asyncio.to_thread(next, chunks, None)
+            if records is None:
+                break
+            chunk_number += 1
+            await importer.add(records)
+            yield _ndjson({"chunk": chunk_number, **importer.progress()})
+        if importer.rows == 0:
+            yield _ndjson({"done": True, "error": "No records provided"})
+        else:
+            yield _ndjson({"done": True, **importer.result()})
+    except ValueError as e:
+        yield _ndjson({"done": True, "error": str(e)})
+    except Exception:
+        logger.exception(f"Bulk import upload of {filename} ({kind}) failed")
+        yield _ndjson({"done": True, "error": "Import failed, please try again"})
+    finally:
+        if chunks is not None:
+            try:
+                chunks.close()
+            except ValueError:
+                pass  # Cancelled while a worker thread is still parsing; it stops at the next chunk
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,157 @@
+"""
+Deployment -> device sync
+Serial numbers of serialized deployment items are mirrored as device records
+(source "deployment"). sync_items_to_devices() reconciles the items of a
+deployment with their devices in one pass:
+- one query fetches every device the items can refer to (linked ids, and the
+  deployment's devices with those serials)
+- each serial keeps the device with that serial; a serial with none takes
+  over the device linked at its position (a renamed serial), otherwise a new
+  device is created
+- creates and changed devices go out in one bulk_write; devices that already
+  match their item are not written at all, so re-syncing an unchanged
+  deployment writes nothing
+
+The caller stores the returned linked_device_ids on the deployment.
+"""
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from database import db
+from utils.helpers import get_ist_isoformat, device_lookup_keys
+
+# Device fields derived from the deployment item (besides the serial number)
+_ITEM_FIELDS = ("device_type", "category", "brand", "model", "warranty_end_date", "location", "deployment_item_index")
+
+
+def _item_device_fields(item_index: int, item: dict) -> dict:
+    return {
+        "device_type": item.get("category"),
+        "category": item.get("category"),
+        "brand": item.get("brand") or "Unknown",
+        "model": item.get("model") or "Unknown",
+        "warranty_end_date": item.get("warranty_end_date"),
+        "location": item.get("zone_location"),
+        "deployment_item_index": item_index,
+    }
+
+
+def new_deployment_device(deployment: dict, item_index: int, item: dict, serial: str) -> dict:
+    """A device record for one serial of a deployment item"""
+    device = {
+        "id": str(uuid.uuid4()),
+        "company_id": deployment["company_id"],
+        "site_id": deployment["site_id"],
+        "deployment_id": deployment["id"],
+        "source": "deployment",
+        **_item_device_fields(item_index, item),
+        "serial_number": serial,
+        "purchase_date": item.get("installation_date") or deployment.get("deployment_date"),
+        "status": "active",
+        "condition": "new",
+        "is_deleted": False,
+        "created_at": get_ist_isoformat()
+    }
+    device.update(device_lookup_keys(device))
+    return device
+
+
+def _serialized_items(deployment: dict, item_indexes: Optional[Iterable[int]]):
+    items = deployment.get("items", [])
+    indexes = range(len(items)) if item_indexes is None else item_indexes
+    for item_index in indexes:
+        item = items[item_index]
+        if item.get("is_serialized") and item.get("serial_numbers"):
+            yield item_index, item
+
+
+async def sync_items_to_devices(deployment: dict, item_indexes: Optional[Iterable[int]] = None) -> dict:
+    """
+    Create / update the devices of a deployment's serialized items (all
+    items, or just `item_indexes`). Returns {"created", "updated",
+    "unchanged", "linked": {item index: device ids}, "changed_ids"}.
+    """
+    items = list(_serialized_items(deployment, item_indexes))
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "linked": {}, "changed_ids": []}
+    if not items:
+        return summary
+
+    linked_ids = [i for _, item in items for i in item.get("linked_device_ids") or [] if i]
+    serials = [s for _, item in items for s in item["serial_numbers"] if s]
+    existing = await db.devices.find(
+        {"is_deleted": {"$ne": True}, "$or": [
+            {"id": {"$in": linked_ids}},
+            {"deployment_id": deployment["id"], "serial_number": {"$in": serials}}
+        ]},
+        {"_id": 0, "id": 1, "deployment_id": 1, "serial_number": 1, **{f: 1 for f in _ITEM_FIELDS}}
+    ).to_list(None)
+    by_id = {d["id"]: d for d in existing}
+    by_serial = {}
+    for device in existing:
+        if device.get("deployment_id") == deployment["id"]:
+            by_serial.setdefault(device["serial_number"], device)
+
+    # Serials keep their own device first, so reordering never renames devices
+    claimed = set()
+    assigned: Dict[tuple, dict] = {}
+    for item_index, item in items:
+        for position, serial in enumerate(item["serial_numbers"]):
+            device = by_serial.get(serial) if serial else None
+            if device and device["id"] not in claimed:
+                claimed.add(device["id"])
+                assigned[(item_index, position)] = device
+    for item_index, item in items:
+        old_linked = item.get("linked_device_ids") or []
+        for position, serial in enumerate(item["serial_numbers"]):
+            if not serial or (item_index, position) in assigned or position >= len(old_linked):
+                continue
+            device = by_id.get(old_linked[position])
+            if device and device["id"] not in claimed:
+                claimed.add(device["id"])
+                assigned[(item_index, position)] = device
+
+    now = get_ist_isoformat()
+    operations = []
+    for item_index, item in items:
+        fields = _item_device_fields(item_index, item)
+        item_linked = []
+        for position, serial in enumerate(item["serial_numbers"]):
+            if not serial:  # Skip empty serials
+                continue
+            device = assigned.get((item_index, position))
+            if device is None:
+                new_device = new_deployment_device(deployment, item_index, item, serial)
+                operations.append(UpdateOne({"id": new_device["id"]}, {"$setOnInsert": new_device}, upsert=True))
+                item_linked.append(new_device["id"])
+                summary["created"] += 1
+                summary["changed_ids"].append(new_device["id"])
+                continue
+
+            desired = {**fields, "serial_number": serial}
+            changes = {k: v for k, v in desired.items() if device.get(k) != v}
+            if changes:
+                changes.update(device_lookup_keys(changes))
+                changes["updated_at"] = now
+                operations.append(UpdateOne({"id": device["id"]}, {"$set": changes}))
+                summary["updated"] += 1
+                summary["changed_ids"].append(device["id"])
+            else:
+                summary["unchanged"] += 1
+            item_linked.append(device["id"])
+        summary["linked"][item_index] = item_linked
+
+    if operations:
+        await db.devices.bulk_write(operations, ordered=False)
+    return summary
+
+
+def linked_ids_update(deployment: dict, linked: Dict[int, List[str]]) -> dict:
+    """$set of the items' linked_device_ids that differ from the stored ones"""
+    items = deployment.get("items", [])
+    return {
+        f"items.{item_index}.linked_device_ids": ids
+        for item_index, ids in linked.items()
+        if ids and ids != items[item_index].get("linked_device_ids")
+    }
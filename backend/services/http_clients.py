@@ -0,0 +1,141 @@
+"""
+Outbound HTTP clients
+One pooled httpx.AsyncClient per integration, opened at startup and closed at
+shutdown, so outbound calls reuse keep-alive connections instead of paying a
+TCP + TLS handshake every time. Each integration has its own timeout and
+connection cap (INTEGRATIONS), so a slow endpoint cannot starve another's pool.
+
+Latency and errors are recorded per integration, along with pool saturation:
+requests that started while every connection was already busy, the peak
+number in flight, and pool timeouts.
+
+Usage:
+    response = await http_clients.request("osticket", "POST", url, json=payload, headers=headers)
+"""
+import logging
+import time
+from typing import Dict
+
+import httpx
+
+from config import (
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    OSTICKET_HTTP_TIMEOUT_SECONDS, OSTICKET_HTTP_MAX_CONNECTIONS,
+    TICKETING_TEST_HTTP_TIMEOUT_SECONDS, TICKETING_TEST_HTTP_MAX_CONNECTIONS
+)
+from utils.timings import Timings
+
+logger = logging.getLogger(__name__)
+
+# Integration name -> client settings
+INTEGRATIONS: Dict[str, dict] = {
+    # Ticket create / fetch against the platform osTicket
+    "osticket": {
+        "timeout": OSTICKET_HTTP_TIMEOUT_SECONDS,
+        "max_connections": OSTICKET_HTTP_MAX_CONNECTIONS,
+    },
+    # Organization "test connection" against a user-supplied ticketing URL
+    "ticketing_test": {
+        "timeout": TICKETING_TEST_HTTP_TIMEOUT_SECONDS,
+        "max_connections": TICKETING_TEST_HTTP_MAX_CONNECTIONS,
+    },
+}
+
+
+class _ClientStats:
+    """Request counters for one integration"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.pool_timeouts = 0
+        self.latency = Timings()
+
+
+class HttpClientRegistry:
+    """Application-scoped pooled HTTP clients, one per integration"""
+
+    def __init__(self, integrations: Dict[str, dict] = INTEGRATIONS):
+        self.integrations = integrations
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _ClientStats] = {name: _ClientStats() for name in integrations}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        settings = self.integrations[name]
+        timeout = settings["timeout"]
+        max_connections = settings["max_connections"]
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+
+    def start(self):
+        """Open every integration's client"""
+        for name in self.integrations:
+            self.client(name)
+        logger.info(f"HTTP clients started: {', '.join(self.integrations)}")
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        """The pooled client for an integration (opened on first use outside the app lifecycle)"""
+        if name not in self.integrations:
+            raise ValueError(f"Unknown HTTP integration: {name}")
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request on an integration's pooled client, recording latency and pool pressure"""
+        client = self.client(name)
+        stats = self._stats[name]
+        if stats.in_flight >= self.integrations[name]["max_connections"]:
+            # Every connection is busy: this request waits for one to free up
+            stats.saturated += 1
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started_at = time.perf_counter()
+        try:
+            return await client.request(method, url, **kwargs)
+        except httpx.PoolTimeout:
+            stats.pool_timeouts += 1
+            stats.errors += 1
+            raise
+        except httpx.HTTPError:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            stats.latency.add((time.perf_counter() - started_at) * 1000)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "max_connections": self.integrations[name]["max_connections"],
+                "timeout_seconds": self.integrations[name]["timeout"],
+                "open": name in self._clients and not self._clients[name].is_closed,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "in_flight": stats.in_flight,
+                "peak_in_flight": stats.peak_in_flight,
+                "saturated": stats.saturated,
+                "pool_timeouts": stats.pool_timeouts,
+                "latency": stats.latency.summary(),
+            }
+            for name, stats in self._stats.items()
+        }
+
+
+http_clients = HttpClientRegistry()
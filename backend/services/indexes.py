@@ -0,0 +1,348 @@
+"""
+MongoDB index manifest
+Declares the indexes every hot collection is expected to have, applies them
+idempotently and reports drift against a live database.
+
+Usage (from the backend directory):
+    python -m services.indexes report
+    python -m services.indexes apply
+"""
+import argparse
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+
+def _index(*keys, unique: bool = False, partial: Optional[dict] = None, expire_after: Optional[int] = None) -> dict:
+    """Build a manifest entry from (field, direction) pairs; `expire_after` (seconds) makes it a TTL index"""
+    return {"keys": list(keys), "unique": unique, "partial": partial, "expire_after": expire_after}
+
+
+ASC = ASCENDING
+DESC = DESCENDING
+
+# Collection name -> expected indexes. The `_id_` index is implicit and never listed.
+INDEX_MANIFEST: Dict[str, List[dict]] = {
+    # ---- Core (reseller) collections ----
+    "devices": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+        _index(("organization_id", ASC), ("warranty_end", ASC)),
+        _index(("serial_number", ASC)),
+        _index(("serial_key", ASC)),
+        _index(("asset_tag_key", ASC)),
+        # Serial numbers and asset tags are unique within an organization (tenant)
+        _index(("organization_id", ASC), ("serial_key", ASC), unique=True, partial={
+            "organization_id": {"$type": "string"}, "serial_key": {"$type": "string"}
+        }),
+        _index(("organization_id", ASC), ("asset_tag_key", ASC), unique=True, partial={
+            "organization_id": {"$type": "string"}, "asset_tag_key": {"$type": "string"}
+        }),
+        _index(("site_id", ASC)),
+        _index(("deployment_id", ASC)),
+        _index(("assigned_user_id", ASC)),
+        _index(("warranty_end_date", ASC)),
+        _index(("status", ASC)),
+    ],
+    "companies": [
+        _index(("id", ASC), unique=True),
+        _index(("is_deleted", ASC), ("name", ASC)),
+        _index(("code", ASC)),
+    ],
+    "sites": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+        _index(("company_id", ASC), ("site_code", ASC)),
+    ],
+    "users": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+    ],
+    "company_users": [
+        _index(("id", ASC), unique=True),
+        _index(("email", ASC)),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+    ],
+    "deployments": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+        _index(("site_id", ASC)),
+    ],
+    "parts": [
+        _index(("id", ASC), unique=True),
+        _index(("device_id", ASC), ("is_deleted", ASC)),
+    ],
+    "service_history": [
+        _index(("id", ASC), unique=True),
+        _index(("device_id", ASC), ("is_deleted", ASC), ("service_date", DESC)),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+    ],
+    "service_tickets": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC), ("created_at", DESC)),
+        _index(("device_id", ASC), ("created_at", DESC)),
+        _index(("osticket_id", ASC)),
+        _index(("status", ASC), ("osticket_id", ASC)),
+        _index(("ticket_number", ASC)),
+    ],
+    "quick_service_requests": [
+        _index(("id", ASC), unique=True),
+        _index(("osticket_id", ASC)),
+        _index(("status", ASC), ("osticket_id", ASC)),
+    ],
+    "amc": [
+        _index(("id", ASC), unique=True),
+        _index(("device_id", ASC), ("is_deleted", ASC)),
+        _index(("end_date", ASC)),
+    ],
+    "amc_contracts": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+        _index(("end_date", ASC)),
+        _index(("start_date", ASC), ("end_date", ASC)),
+    ],
+    "amc_device_assignments": [
+        _index(("id", ASC), unique=True),
+        _index(("device_id", ASC), ("status", ASC)),
+        _index(("amc_contract_id", ASC), ("status", ASC)),
+        _index(("coverage_end", ASC)),
+    ],
+    "amc_usage": [
+        _index(("amc_contract_id", ASC)),
+    ],
+    "licenses": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("is_deleted", ASC)),
+        _index(("end_date", ASC)),
+    ],
+    "assignment_history": [
+        _index(("device_id", ASC), ("created_at", DESC)),
+    ],
+    "consumable_orders": [
+        _index(("id", ASC), unique=True),
+        _index(("device_id", ASC), ("created_at", DESC)),
+        _index(("company_id", ASC), ("created_at", DESC)),
+    ],
+    "engineers": [
+        _index(("id", ASC), unique=True),
+        _index(("email", ASC)),
+    ],
+    "field_visits": [
+        _index(("id", ASC), unique=True),
+        _index(("engineer_id", ASC), ("created_at", DESC)),
+        _index(("ticket_id", ASC)),
+    ],
+    "masters": [
+        _index(("id", ASC), unique=True),
+        _index(("type", ASC), ("sort_order", ASC)),
+    ],
+    "supply_products": [
+        _index(("id", ASC), unique=True),
+        _index(("category_id", ASC)),
+    ],
+    "supply_orders": [
+        _index(("id", ASC), unique=True),
+        _index(("company_id", ASC), ("created_at", DESC)),
+    ],
+    "audit_logs": [
+        _index(("entity_type", ASC), ("entity_id", ASC)),
+    ],
+    "search_index": [
+        _index(("collection", ASC), ("entity_id", ASC), unique=True),
+        _index(("collection", ASC), ("prefixes", ASC)),
+        # Short query tokens match whole tokens
+        _index(("collection", ASC), ("terms", ASC)),
+    ],
+    "render_jobs": [
+        _index(("id", ASC), unique=True),
+        # Job records are removed once expires_at passes; output files are purged separately
+        _index(("expires_at", ASC), expire_after=0),
+    ],
+    "osticket_outbox": [
+        _index(("id", ASC), unique=True),
+        _index(("status", ASC), ("next_attempt_at", ASC)),
+        _index(("collection", ASC), ("record_id", ASC)),
+        # Delivered entries only; pending and dead entries have no expires_at
+        _index(("expires_at", ASC), expire_after=0),
+    ],
+    "webhook_events": [
+        # Retried deliveries collide here and are acknowledged without reprocessing
+        _index(("source", ASC), ("event_id", ASC), unique=True),
+        _index(("status", ASC), ("next_attempt_at", ASC)),
+        _index(("entity_key", ASC), ("status", ASC), ("received_at", ASC)),
+        # Processed events only; pending and failed events have no expires_at
+        _index(("expires_at", ASC), expire_after=0),
+    ],
+    "scheduler_locks": [
+        # Unique id makes the lease upsert fail while another process holds it
+        _index(("id", ASC), unique=True),
+    ],
+    "warranty_pdf_cache": [
+        _index(("device_id", ASC), unique=True),
+        _index(("company_id", ASC)),
+        _index(("amc_contract_id", ASC)),
+    ],
+    # ---- SaaS (organization) collections ----
+    "organizations": [
+        _index(("id", ASC), unique=True),
+        _index(("slug", ASC), unique=True),
+    ],
+    "org_users": [
+        _index(("id", ASC), unique=True),
+        _index(("email", ASC)),
+        _index(("organization_id", ASC)),
+    ],
+    "org_companies": [
+        _index(("id", ASC), unique=True),
+        _index(("organization_id", ASC), ("name", ASC)),
+    ],
+    "org_licenses": [
+        _index(("organization_id", ASC), ("created_at", DESC)),
+    ],
+    "org_amc_contracts": [
+        _index(("organization_id", ASC), ("created_at", DESC)),
+    ],
+    "org_deployments": [
+        _index(("organization_id", ASC), ("scheduled_date", DESC)),
+    ],
+    "org_supply_products": [
+        _index(("organization_id", ASC), ("name", ASC)),
+    ],
+    "org_supply_orders": [
+        _index(("organization_id", ASC), ("created_at", DESC)),
+    ],
+    "usage_records": [
+        _index(("org_id", ASC)),
+    ],
+    "payments": [
+        _index(("org_id", ASC), ("created_at", DESC)),
+        _index(("razorpay_payment_id", ASC), unique=True, partial={"razorpay_payment_id": {"$type": "string"}}),
+    ],
+}
+
+
+def _key_tuple(keys) -> tuple:
+    """Normalize an index key spec (list of pairs or SON) for comparison"""
+    items = keys.items() if hasattr(keys, "items") else keys
+    return tuple(
+        (field, direction if isinstance(direction, str) else int(direction))
+        for field, direction in items
+    )
+
+
+async def ensure_indexes(database=None) -> dict:
+    """
+    Create every manifest index that does not already exist.
+    Safe to call repeatedly; an index whose key pattern already exists is skipped
+    regardless of its name. Failures are logged and returned, never raised.
+    """
+    database = database if database is not None else db
+    created, failed = [], []
+
+    for collection_name, specs in INDEX_MANIFEST.items():
+        collection = database[collection_name]
+        try:
+            existing = await collection.index_information()
+        except OperationFailure as e:
+            failed.append({"collection": collection_name, "error": str(e)})
+            continue
+        existing_keys = {_key_tuple(info["key"]) for info in existing.values()}
+
+        for spec in specs:
+            if _key_tuple(spec["keys"]) in existing_keys:
+                continue
+            try:
+                options = {"unique": spec["unique"]}
+                if spec["partial"]:
+                    options["partialFilterExpression"] = spec["partial"]
+                if spec["expire_after"] is not None:
+                    options["expireAfterSeconds"] = spec["expire_after"]
+                name = await collection.create_index(spec["keys"], **options)
+                created.append(f"{collection_name}.{name}")
+            except OperationFailure as e:
+                logger.error(f"Index creation failed on {collection_name} {spec['keys']}: {e}")
+                failed.append({"collection": collection_name, "keys": spec["keys"], "error": str(e)})
+
+    if created:
+        logger.info(f"Created {len(created)} index(es): {', '.join(created)}")
+    return {"created": created, "failed": failed}
+
+
+async def index_report(database=None) -> dict:
+    """
+    Compare the live database against the manifest.
+    Returns per-collection lists of missing, extra and unused (zero ops since
+    the last mongod restart, per $indexStats) indexes.
+    """
+    database = database if database is not None else db
+    report = {}
+
+    for collection_name, specs in INDEX_MANIFEST.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+        existing_by_key = {
+            _key_tuple(info["key"]): name
+            for name, info in existing.items()
+            if name != "_id_"
+        }
+        expected_keys = [_key_tuple(spec["keys"]) for spec in specs]
+
+        missing = [list(k) for k in expected_keys if k not in existing_by_key]
+        extra = [name for k, name in existing_by_key.items() if k not in expected_keys]
+
+        unused = []
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+            unused = [
+                s["name"] for s in stats
+                if s["name"] != "_id_" and s.get("accesses", {}).get("ops", 0) == 0
+            ]
+        except OperationFailure as e:
+            # $indexStats needs clusterMonitor-level privileges on some deployments
+            logger.warning(f"$indexStats unavailable for {collection_name}: {e}")
+
+        report[collection_name] = {"missing": missing, "extra": extra, "unused": unused}
+
+    return report
+
+
+def _print_report(report: dict):
+    totals = {"missing": 0, "extra": 0, "unused": 0}
+    for collection_name, entry in report.items():
+        if not any(entry.values()):
+            continue
+        print(f"{collection_name}:")
+        for kind in ("missing", "extra", "unused"):
+            for item in entry[kind]:
+                totals[kind] += 1
+                print(f"  {kind:<8} {item}")
+    print(f"\n{totals['missing']} missing, {totals['extra']} extra, {totals['unused']} unused")
+
+
+async def _main(command: str) -> int:
+    if command == "apply":
+        result = await ensure_indexes()
+        for name in result["created"]:
+            print(f"created  {name}")
+        for failure in result["failed"]:
+            print(f"FAILED   {failure}")
+        print(f"\n{len(result['created'])} created, {len(result['failed'])} failed")
+        return 1 if result["failed"] else 0
+
+    report = await index_report()
+    _print_report(report)
+    return 1 if any(entry["missing"] for entry in report.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or audit the MongoDB index manifest")
+    parser.add_argument("command", choices=["apply", "report"], help="apply missing indexes or print a drift report")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command)))
@@ -0,0 +1,31 @@
+"""
+Named leases
+A lease in `scheduler_locks` lets one API process at a time own a piece of
+background work (a scheduled round, one webhook entity's event stream).
+Leases expire on their own, so a crashed owner blocks the work for at most
+the lease duration.
+"""
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+
+
+async def acquire_lease(name: str, owner: str, seconds: float) -> bool:
+    """Take or extend lease `name` for `owner`; False while another owner holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.scheduler_locks.update_one(
+            {"id": name, "$or": [{"locked_until": {"$lte": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "locked_until": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The unique id index rejects the upsert: someone else holds an unexpired lease
+        return False
+
+
+async def release_lease(name: str, owner: str):
+    await db.scheduler_locks.delete_one({"id": name, "owner": owner})
@@ -0,0 +1,105 @@
+"""
+Request-scoped batched entity loader
+Collects ids while a handler enriches rows, resolves them with a single `$in`
+query per collection and memoizes the results for the rest of the request.
+
+Usage:
+    @api_router.get("/things")
+    async def list_things(loader: EntityLoader = Depends(get_loader)):
+        rows = await db.things.find(...).to_list(500)
+        companies = await loader.load_many("companies", [r.get("company_id") for r in rows])
+        for row in rows:
+            company = companies.get(row.get("company_id"))
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from database import db
+
+# Never hand secrets to enrichment code, whatever the caller asks for
+_SENSITIVE_PROJECTION = {"_id": 0, "password_hash": 0, "hashed_password": 0}
+_SENSITIVE_COLLECTIONS = {"admins", "company_users", "engineers", "org_users"}
+
+
+class EntityLoader:
+    """DataLoader-style cache of documents keyed by collection and field value"""
+
+    def __init__(self, database=None):
+        self._db = database if database is not None else db
+        # (collection, field) -> value -> document (None when known to be missing)
+        self._by_key: Dict[tuple, Dict[str, Optional[dict]]] = defaultdict(dict)
+        # (collection, field, filter) -> value -> [documents]
+        self._grouped: Dict[tuple, Dict[str, List[dict]]] = defaultdict(dict)
+
+    @staticmethod
+    def _projection(collection: str) -> dict:
+        return _SENSITIVE_PROJECTION if collection in _SENSITIVE_COLLECTIONS else {"_id": 0}
+
+    async def load_many(self, collection: str, values: Iterable, field: str = "id") -> Dict[str, dict]:
+        """
+        Resolve documents whose `field` is in `values` (one query for all uncached values).
+        Returns {value: document} for the values that exist.
+        """
+        cache = self._by_key[(collection, field)]
+        wanted = {v for v in values if v}
+        missing = [v for v in wanted if v not in cache]
+
+        if missing:
+            docs = await self._db[collection].find(
+                {field: {"$in": missing}}, self._projection(collection)
+            ).to_list(None)
+            for doc in docs:
+                cache.setdefault(doc.get(field), doc)
+            for value in missing:
+                cache.setdefault(value, None)
+
+        return {v: cache[v] for v in wanted if cache.get(v) is not None}
+
+    async def load(self, collection: str, value, field: str = "id") -> Optional[dict]:
+        """Resolve a single document (memoized; prefer load_many inside loops)"""
+        if not value:
+            return None
+        return (await self.load_many(collection, [value], field)).get(value)
+
+    def prime(self, collection: str, docs: Iterable[dict], field: str = "id"):
+        """Seed the cache with documents the handler already fetched"""
+        cache = self._by_key[(collection, field)]
+        for doc in docs:
+            if doc.get(field):
+                cache[doc[field]] = doc
+
+    async def load_grouped(
+        self, collection: str, field: str, values: Iterable, query: Optional[dict] = None
+    ) -> Dict[str, List[dict]]:
+        """
+        One-to-many variant: all documents matching `query` whose `field` is in `values`,
+        grouped by that field. Results are memoized per (collection, field, query).
+        """
+        query = query or {}
+        cache_key = (collection, field, repr(sorted(query.items())))
+        cache = self._grouped[cache_key]
+        wanted = {v for v in values if v}
+        missing = [v for v in wanted if v not in cache]
+
+        if missing:
+            for value in missing:
+                cache[value] = []
+            docs = await self._db[collection].find(
+                {**query, field: {"$in": missing}}, self._projection(collection)
+            ).to_list(None)
+            for doc in docs:
+                cache[doc.get(field)].append(doc)
+
+        return {v: cache[v] for v in wanted}
+
+
+def pick_fields(doc: Optional[dict], *fields: str) -> Optional[dict]:
+    """Mimic a Mongo inclusion projection on an already-loaded document"""
+    if doc is None:
+        return None
+    return {f: doc[f] for f in fields if f in doc}
+
+
+def get_loader() -> EntityLoader:
+    """FastAPI dependency: a fresh loader per request"""
+    return EntityLoader()
@@ -0,0 +1,63 @@
+"""
+Data migrations
+Idempotent backfills that bring existing documents up to the current schema.
+
+Usage (from the backend directory):
+    python -m services.migrations device-lookup-keys
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from database import db
+from utils.helpers import device_lookup_keys
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_device_lookup_keys(batch_size: int = 1000) -> int:
+    """
+    Populate serial_key / asset_tag_key on devices written before the fields existed.
+    Only touches documents missing either key, so repeated runs are cheap.
+    Returns the number of devices updated.
+    """
+    cursor = db.devices.find(
+        {"$or": [{"serial_key": {"$exists": False}}, {"asset_tag_key": {"$exists": False}}]},
+        {"_id": 1, "serial_number": 1, "asset_tag": 1}
+    ).batch_size(batch_size)
+
+    updated = 0
+    ops = []
+    async for device in cursor:
+        keys = device_lookup_keys({
+            "serial_number": device.get("serial_number"),
+            "asset_tag": device.get("asset_tag")
+        })
+        ops.append(UpdateOne({"_id": device["_id"]}, {"$set": keys}))
+        if len(ops) >= batch_size:
+            result = await db.devices.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+            ops = []
+
+    if ops:
+        result = await db.devices.bulk_write(ops, ordered=False)
+        updated += result.modified_count
+
+    if updated:
+        logger.info(f"Backfilled lookup keys on {updated} device(s)")
+    return updated
+
+
+MIGRATIONS = {
+    "device-lookup-keys": backfill_device_lookup_keys,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a data migration")
+    parser.add_argument("name", choices=sorted(MIGRATIONS), help="migration to run")
+    args = parser.parse_args()
+    count = asyncio.run(MIGRATIONS[args.name]())
+    print(f"{args.name}: {count} document(s) updated")
@@ -3,9 +3,9 @@ osTicket integration service
 """
 import logging
 from typing import Optional
-import httpx
 
 from config import OSTICKET_URL, OSTICKET_API_KEY
+from services.http_clients import http_clients
 
 logger = logging.getLogger(__name__)
 
@@ -53,24 +53,23 @@ async def create_osticket(
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            response = await http_client.post(api_url, json=payload, headers=headers)
-            
-            logger.info(f"osTicket response: status={response.status_code}, body={response.text[:200]}")
+        response = await http_clients.request("osticket", "POST", api_url, json=payload, headers=headers)
+        
+        logger.info(f"osTicket response: status={response.status_code}, body={response.text[:200]}")
+        
+        if response.status_code == 201:
+            osticket_id = response.text.strip()
+            logger.info(f"osTicket created successfully: {osticket_id}")
+            return {"ticket_id": osticket_id, "error": None}
+        elif response.status_code == 401:
+            error_msg = f"API key rejected (IP restriction): {response.text}"
+            logger.warning(f"osTicket: {error_msg}")
+            return {"ticket_id": None, "error": error_msg}
+        else:
+            error_msg = f"API error {response.status_code}: {response.text}"
+            logger.error(f"osTicket: {error_msg}")
+            return {"ticket_id": None, "error": error_msg}
             
-            if response.status_code == 201:
-                osticket_id = response.text.strip()
-                logger.info(f"osTicket created successfully: {osticket_id}")
-                return {"ticket_id": osticket_id, "error": None}
-            elif response.status_code == 401:
-                error_msg = f"API key rejected (IP restriction): {response.text}"
-                logger.warning(f"osTicket: {error_msg}")
-                return {"ticket_id": None, "error": error_msg}
-            else:
-                error_msg = f"API error {response.status_code}: {response.text}"
-                logger.error(f"osTicket: {error_msg}")
-                return {"ticket_id": None, "error": error_msg}
-                
     except Exception as e:
         error_msg = f"Connection failed: {str(e)}"
         logger.error(f"osTicket integration failed: {error_msg}")
@@ -102,28 +101,27 @@ async def fetch_osticket_details(ticket_id: str) -> dict:
         
         logger.info(f"Fetching osTicket details: {api_url}")
         
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            response = await http_client.get(api_url, headers=headers)
-            
-            logger.info(f"osTicket fetch response: status={response.status_code}")
+        response = await http_clients.request("osticket", "GET", api_url, headers=headers)
+        
+        logger.info(f"osTicket fetch response: status={response.status_code}")
+        
+        if response.status_code == 200:
+            try:
+                data = response.json()
+                return {"data": data, "error": None}
+            except Exception:
+                # osTicket sometimes returns non-JSON
+                return {"data": {"raw": response.text}, "error": None}
+        elif response.status_code == 401:
+            return {"data": None, "error": "API access denied. Check API key and IP restrictions."}
+        elif response.status_code == 404:
+            return {"data": None, "error": "Ticket not found in osTicket"}
+        elif response.status_code == 400:
+            # 400 often means the endpoint doesn't exist or requires a plugin
+            return {"data": None, "error": "osTicket API does not support ticket retrieval. Install REST API plugin or check osTicket settings."}
+        else:
+            return {"data": None, "error": f"osTicket API error ({response.status_code})"}
             
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    return {"data": data, "error": None}
-                except Exception:
-                    # osTicket sometimes returns non-JSON
-                    return {"data": {"raw": response.text}, "error": None}
-            elif response.status_code == 401:
-                return {"data": None, "error": "API access denied. Check API key and IP restrictions."}
-            elif response.status_code == 404:
-                return {"data": None, "error": "Ticket not found in osTicket"}
-            elif response.status_code == 400:
-                # 400 often means the endpoint doesn't exist or requires a plugin
-                return {"data": None, "error": "osTicket API does not support ticket retrieval. Install REST API plugin or check osTicket settings."}
-            else:
-                return {"data": None, "error": f"osTicket API error ({response.status_code})"}
-                
     except Exception as e:
         logger.error(f"osTicket fetch failed: {str(e)}")
         return {"data": None, "error": f"Connection error: {str(e)}"}
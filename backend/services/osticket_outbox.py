@@ -0,0 +1,328 @@
+"""
+osTicket outbox
+Endpoints that open an osTicket ticket for a local record (service tickets,
+quick service requests, consumable and supply orders) store the record, call
+enqueue_osticket() and return without waiting on osTicket. Without
+OSTICKET_URL / OSTICKET_API_KEY nothing is queued and the record is left as is.
+
+OsTicketDispatcher runs in every API process and delivers the outbox:
+- due entries are claimed atomically (pending -> sending, with a lease), so
+  several workers never send the same entry at the same time
+- at most OSTICKET_OUTBOX_CONCURRENCY tickets are sent at once
+- a created ticket's number is written back to the originating record
+  (osticket_id, osticket_status "created")
+- failures are retried with exponential backoff; after
+  OSTICKET_OUTBOX_MAX_ATTEMPTS the entry is dead-lettered and the error is
+  recorded on the originating record (osticket_status "failed")
+
+An entry whose process died mid-send is claimed again once its lease expires,
+so delivery is at least once. Dead entries can be requeued with retry_entry().
+"""
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from config import (
+    OSTICKET_URL, OSTICKET_API_KEY,
+    OSTICKET_OUTBOX_CONCURRENCY, OSTICKET_OUTBOX_MAX_ATTEMPTS,
+    OSTICKET_OUTBOX_BACKOFF_SECONDS, OSTICKET_OUTBOX_MAX_BACKOFF_SECONDS, OSTICKET_OUTBOX_POLL_SECONDS
+)
+from database import db
+from services.osticket import create_osticket
+from utils.helpers import get_ist_isoformat
+
+logger = logging.getLogger(__name__)
+
+# Entry statuses
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+OUTBOX_STATUSES = (PENDING, SENDING, SENT, DEAD)
+
+# Collections whose records may own an outbox entry
+OUTBOX_COLLECTIONS = {"service_tickets", "quick_service_requests", "consumable_orders", "supply_orders"}
+
+# osticket_error reported when nothing is queued
+NOT_CONFIGURED = "osTicket not configured"
+
+# Longer than the osTicket request timeout (30 s), so a live send is never reclaimed
+_LEASE = timedelta(minutes=2)
+# Delivered entries are kept this long for inspection (TTL index on expires_at)
+_SENT_RETENTION = timedelta(days=7)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue_osticket(
+    collection: str,
+    record_id: str,
+    email: str,
+    name: str,
+    subject: str,
+    message: str,
+    phone: str = "",
+    priority_id: Optional[int] = None
+) -> Optional[dict]:
+    """
+    Queue an osTicket ticket for a stored record; the dispatcher sends it in
+    the background. None (nothing queued) when osTicket is not configured.
+    """
+    if collection not in OUTBOX_COLLECTIONS:
+        raise ValueError(f"Unsupported outbox collection: {collection}")
+    if not OSTICKET_URL or not OSTICKET_API_KEY:
+        logger.warning("osTicket not configured - skipping ticket sync")
+        return None
+
+    now = get_ist_isoformat()
+    entry = {
+        "id": str(uuid.uuid4()),
+        "collection": collection,
+        "record_id": record_id,
+        "payload": {
+            "email": email,
+            "name": name,
+            "subject": subject,
+            "message": message,
+            "phone": phone,
+            "priority_id": priority_id
+        },
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": _utcnow(),
+        "lease_until": None,
+        "last_error": None,
+        "osticket_id": None,
+        "created_at": now,
+        "updated_at": now,
+        "sent_at": None
+    }
+    await db.osticket_outbox.insert_one(entry)
+    await db[collection].update_one({"id": record_id}, {"$set": {"osticket_status": "queued"}})
+    osticket_dispatcher.notify()
+    entry.pop("_id", None)
+    return entry
+
+
+async def retry_entry(entry_id: str) -> Optional[dict]:
+    """Requeue a dead-lettered entry with a fresh attempt budget"""
+    entry = await db.osticket_outbox.find_one_and_update(
+        {"id": entry_id, "status": DEAD},
+        {"$set": {
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": _utcnow(),
+            "updated_at": get_ist_isoformat()
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry:
+        await db[entry["collection"]].update_one(
+            {"id": entry["record_id"]},
+            {"$set": {"osticket_status": "queued", "osticket_error": None}}
+        )
+        osticket_dispatcher.notify()
+    return entry
+
+
+class OsTicketDispatcher:
+    """Background delivery of the osTicket outbox with bounded concurrency and backoff"""
+
+    def __init__(
+        self,
+        concurrency: int = OSTICKET_OUTBOX_CONCURRENCY,
+        max_attempts: int = OSTICKET_OUTBOX_MAX_ATTEMPTS,
+        backoff_seconds: float = OSTICKET_OUTBOX_BACKOFF_SECONDS,
+        max_backoff_seconds: float = OSTICKET_OUTBOX_MAX_BACKOFF_SECONDS,
+        poll_seconds: float = OSTICKET_OUTBOX_POLL_SECONDS
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._in_flight = set()
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"osTicket dispatcher started: concurrency {self.concurrency}, max attempts {self.max_attempts}")
+
+    async def shutdown(self, timeout: float = 5.0):
+        """Stop claiming entries and give in-flight sends a moment to finish"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._in_flight:
+            # Unfinished sends keep their lease and are retried after it expires
+            await asyncio.wait(set(self._in_flight), timeout=timeout)
+
+    def notify(self):
+        """Wake the dispatcher (new or requeued entries)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before retry number `attempts`: exponential, capped, with jitter"""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            try:
+                self._wake.clear()
+                while True:
+                    await slots.acquire()
+                    try:
+                        entry = await self._claim()
+                    except BaseException:
+                        slots.release()
+                        raise
+                    if entry is None:
+                        slots.release()
+                        break
+                    task = asyncio.create_task(self._deliver(entry))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._in_flight.discard)
+                    task.add_done_callback(lambda _: (slots.release(), self.notify()))
+                delay = await self._next_due_in()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("osTicket dispatcher loop failed; retrying")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _claim(self) -> Optional[dict]:
+        now = _utcnow()
+        return await db.osticket_outbox.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": SENDING, "lease_until": {"$lte": now}}
+            ]},
+            {"$set": {"status": SENDING, "lease_until": now + _LEASE, "updated_at": get_ist_isoformat()}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _next_due_in(self) -> float:
+        """Seconds until the earliest pending retry, capped at the poll interval"""
+        entry = await db.osticket_outbox.find_one(
+            {"status": PENDING},
+            {"_id": 0, "next_attempt_at": 1},
+            sort=[("next_attempt_at", 1)]
+        )
+        if not entry:
+            return self.poll_seconds
+        due = entry["next_attempt_at"]
+        if due.tzinfo is None:
+            due = due.replace(tzinfo=timezone.utc)
+        return max(0.0, min(self.poll_seconds, (due - _utcnow()).total_seconds()))
+
+    async def _deliver(self, entry: dict):
+        try:
+            if not OSTICKET_URL or not OSTICKET_API_KEY:
+                # Retrying cannot help; requeue from the admin outbox once configured
+                await self._dead_letter(entry, NOT_CONFIGURED, entry["attempts"])
+                return
+            result = await create_osticket(**entry["payload"])
+            if result.get("ticket_id"):
+                await self._mark_sent(entry, result["ticket_id"])
+            else:
+                await self._failed(entry, result.get("error") or "Unknown error")
+        except Exception as e:
+            logger.exception(f"osTicket outbox entry {entry['id']} failed")
+            await self._failed(entry, str(e) or e.__class__.__name__)
+
+    async def _mark_sent(self, entry: dict, osticket_id: str):
+        # Record the delivery on the entry first: a crash before the write-back must not send twice
+        await db.osticket_outbox.update_one(
+            {"id": entry["id"]},
+            {"$set": {
+                "status": SENT,
+                "osticket_id": osticket_id,
+                "lease_until": None,
+                "last_error": None,
+                "sent_at": get_ist_isoformat(),
+                "updated_at": get_ist_isoformat(),
+                "expires_at": _utcnow() + _SENT_RETENTION
+            }, "$inc": {"attempts": 1}}
+        )
+        await db[entry["collection"]].update_one(
+            {"id": entry["record_id"]},
+            {"$set": {"osticket_id": osticket_id, "osticket_status": "created", "osticket_error": None}}
+        )
+        self.sent += 1
+        logger.info(f"osTicket {osticket_id} created for {entry['collection']} {entry['record_id']}")
+
+    async def _failed(self, entry: dict, error: str):
+        attempts = entry["attempts"] + 1
+        if attempts >= self.max_attempts:
+            await self._dead_letter(entry, error, attempts)
+            return
+        delay = self.backoff(attempts)
+        await db.osticket_outbox.update_one(
+            {"id": entry["id"]},
+            {"$set": {
+                "status": PENDING,
+                "attempts": attempts,
+                "next_attempt_at": _utcnow() + timedelta(seconds=delay),
+                "lease_until": None,
+                "last_error": error,
+                "updated_at": get_ist_isoformat()
+            }}
+        )
+        self.retried += 1
+        logger.warning(f"osTicket outbox entry {entry['id']} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+
+    async def _dead_letter(self, entry: dict, error: str, attempts: int):
+        await db.osticket_outbox.update_one(
+            {"id": entry["id"]},
+            {"$set": {
+                "status": DEAD,
+                "attempts": attempts,
+                "lease_until": None,
+                "last_error": error,
+                "updated_at": get_ist_isoformat()
+            }}
+        )
+        await db[entry["collection"]].update_one(
+            {"id": entry["record_id"]},
+            {"$set": {"osticket_status": "failed", "osticket_error": error}}
+        )
+        self.dead += 1
+        logger.error(f"osTicket outbox entry {entry['id']} dead-lettered after {attempts} attempt(s): {error}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "concurrency": self.concurrency,
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
+
+
+osticket_dispatcher = OsTicketDispatcher()
@@ -0,0 +1,287 @@
+"""
+osTicket status reconciliation
+Besides the osTicket webhook, portal tickets are kept current by a scheduled
+reconciliation: every OSTICKET_SYNC_INTERVAL_SECONDS, open and in-progress
+service tickets and quick service requests that have an osticket_id are
+fetched from osTicket (at most OSTICKET_SYNC_CONCURRENCY at once and
+OSTICKET_SYNC_RATE_PER_SECOND per second), and their status and new thread
+messages are applied with one bulk_write per batch. Only tickets that changed
+are written, and each write is conditional on the status the ticket had when
+it was read, so a webhook that moved the ticket meanwhile is never reverted.
+
+Only one API process runs a given round: the run is guarded by a lease in
+`scheduler_locks`, renewed per batch; a worker that loses it stops its round.
+A manual sync request (request_sync) refreshes just that ticket in the
+background, through the same rate limiter and conditional write, at most once
+per ticket every _MIN_REQUEST_GAP_SECONDS. Portal endpoints read the synced
+state locally and never call osTicket on the request path.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from config import (
+    OSTICKET_URL, OSTICKET_API_KEY,
+    OSTICKET_SYNC_INTERVAL_SECONDS, OSTICKET_SYNC_CONCURRENCY, OSTICKET_SYNC_RATE_PER_SECOND
+)
+from database import db
+from services.leases import acquire_lease
+from services.osticket import fetch_osticket_details
+from utils.helpers import get_ist_isoformat
+
+logger = logging.getLogger(__name__)
+
+# osTicket status name (lower case) -> portal status
+OSTICKET_STATUS_MAP = {
+    "open": "open",
+    "new": "open",
+    "in progress": "in_progress",
+    "in-progress": "in_progress",
+    "pending": "pending",
+    "on hold": "on_hold",
+    "resolved": "resolved",
+    "closed": "closed",
+    "answered": "in_progress",
+    "overdue": "overdue"
+}
+
+# Collections reconciled, and the portal statuses still worth polling
+SYNCED_COLLECTIONS = ("service_tickets", "quick_service_requests")
+SYNCED_STATUSES = ["open", "in_progress"]
+
+_LOCK_NAME = "osticket_sync"
+_BATCH_SIZE = 200
+# A ticket is refreshed on request at most once per this many seconds
+_MIN_REQUEST_GAP_SECONDS = 30.0
+
+
+def plan_ticket_update(record: dict, osticket_data: dict) -> Tuple[dict, List[dict], List[str]]:
+    """
+    Compare a portal ticket with osTicket's copy.
+    Returns ($set fields, new comments, human-readable changes); the comments
+    are osTicket thread messages the record does not have yet.
+    """
+    now = get_ist_isoformat()
+    update_data = {"last_synced_at": now}
+    changes = []
+
+    os_status = osticket_data.get("status") or osticket_data.get("status_name", "")
+    if os_status:
+        new_status = OSTICKET_STATUS_MAP.get(os_status.lower().strip())
+        if new_status and new_status != record.get("status"):
+            update_data["status"] = new_status
+            changes.append(f"Status updated to '{new_status}'")
+            if new_status == "resolved":
+                update_data["resolved_at"] = now
+            elif new_status == "closed":
+                update_data["closed_at"] = now
+
+    new_comments = []
+    thread = osticket_data.get("thread") or osticket_data.get("messages") or []
+    if thread and isinstance(thread, list):
+        existing_ids = {c["osticket_message_id"] for c in record.get("comments") or [] if c.get("osticket_message_id")}
+        for msg in thread:
+            msg_id = str(msg.get("id") or msg.get("message_id", ""))
+            if msg_id and msg_id not in existing_ids:
+                existing_ids.add(msg_id)
+                new_comments.append({
+                    "id": str(uuid.uuid4()),
+                    "osticket_message_id": msg_id,
+                    "user_id": None,
+                    "user_name": msg.get("poster") or msg.get("staff_name") or "osTicket Staff",
+                    "user_type": "osticket_staff",
+                    "comment": msg.get("body") or msg.get("message") or msg.get("content", ""),
+                    "attachments": [],
+                    "created_at": msg.get("created") or now,
+                    "source": "osticket_sync"
+                })
+        if new_comments:
+            changes.append(f"{len(new_comments)} new message(s) synced")
+
+    if changes:
+        update_data["updated_at"] = now
+    return update_data, new_comments, changes
+
+
+class _RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+                now = self._next_at
+            self._next_at = now + self.interval
+
+
+class OsTicketReconciler:
+    """Periodic, rate-limited batch sync of open tickets from osTicket"""
+
+    def __init__(
+        self,
+        interval_seconds: float = OSTICKET_SYNC_INTERVAL_SECONDS,
+        concurrency: int = OSTICKET_SYNC_CONCURRENCY,
+        rate_per_second: float = OSTICKET_SYNC_RATE_PER_SECOND
+    ):
+        self.interval_seconds = interval_seconds
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self._owner = str(uuid.uuid4())
+        self._task: Optional[asyncio.Task] = None
+        # Shared by rounds and manual requests, so both together stay within the limits
+        self._limiter = _RateLimiter(rate_per_second)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._requests: Set[asyncio.Task] = set()
+        self.runs = 0
+        self.skipped = 0
+        self.requested = 0
+        self.last_run: Optional[dict] = None
+
+    def start(self):
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"osTicket reconciliation every {self.interval_seconds:.0f}s")
+
+    async def shutdown(self):
+        tasks = list(self._requests)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def request_sync(self, collection: str, record: dict) -> bool:
+        """
+        Refresh one ticket in the background (a user pressed "sync"). The fetch
+        goes through the round's rate limiter and the write is conditional like
+        a round's. False when osTicket is not configured or the ticket was
+        requested less than _MIN_REQUEST_GAP_SECONDS ago.
+        """
+        if not OSTICKET_URL or not OSTICKET_API_KEY:
+            return False
+        # A throwaway owner: nobody, this worker included, can extend the lease
+        if not await acquire_lease(f"{_LOCK_NAME}:{record['id']}", str(uuid.uuid4()), _MIN_REQUEST_GAP_SECONDS):
+            return False
+        self.requested += 1
+        task = asyncio.create_task(self._sync_requested(collection, record))
+        self._requests.add(task)
+        task.add_done_callback(self._requests.discard)
+        return True
+
+    async def _sync_requested(self, collection: str, record: dict):
+        summary = {"checked": 0, "updated": 0, "errors": 0}
+        try:
+            await self._apply_batch(collection, [record], summary)
+        except Exception:
+            logger.exception(f"osTicket sync of {collection} {record['id']} failed")
+
+    async def _run(self):
+        while True:
+            try:
+                # Hold the round until the next interval; other workers skip it
+                if await acquire_lease(_LOCK_NAME, self._owner, self.interval_seconds):
+                    await self.run_once()
+                else:
+                    self.skipped += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("osTicket reconciliation failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> dict:
+        """Reconcile every open ticket once and return a summary"""
+        started_at = time.perf_counter()
+        summary = {"checked": 0, "updated": 0, "errors": 0}
+        if not OSTICKET_URL or not OSTICKET_API_KEY:
+            summary["skipped"] = "osTicket not configured"
+            self.last_run = summary
+            return summary
+
+        for collection in SYNCED_COLLECTIONS:
+            if not await self._sync_collection(collection, summary):
+                summary["stopped"] = "Round lease taken over by another worker"
+                break
+
+        self.runs += 1
+        summary["duration_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+        summary["finished_at"] = get_ist_isoformat()
+        self.last_run = summary
+        logger.info(f"osTicket reconciliation: {summary}")
+        return summary
+
+    async def _sync_collection(self, collection: str, summary: dict) -> bool:
+        """Sync one collection batch by batch; False when the round lease was lost"""
+        cursor = db[collection].find(
+            {"osticket_id": {"$nin": [None, ""]}, "status": {"$in": SYNCED_STATUSES}, "is_deleted": {"$ne": True}},
+            {"_id": 0, "id": 1, "osticket_id": 1, "status": 1, "comments.osticket_message_id": 1}
+        ).batch_size(_BATCH_SIZE)
+        batch = []
+        async for record in cursor:
+            batch.append(record)
+            if len(batch) >= _BATCH_SIZE:
+                if not await self._sync_batch(collection, batch, summary):
+                    return False
+                batch = []
+        if batch:
+            return await self._sync_batch(collection, batch, summary)
+        return True
+
+    async def _sync_batch(self, collection: str, batch: List[dict], summary: dict) -> bool:
+        # Extend the lease per batch so a long round is never taken over midway
+        if not await acquire_lease(_LOCK_NAME, self._owner, self.interval_seconds):
+            return False
+        await self._apply_batch(collection, batch, summary)
+        return True
+
+    async def _fetch(self, record: dict) -> dict:
+        async with self._slots:
+            await self._limiter.wait()
+            return await fetch_osticket_details(record["osticket_id"])
+
+    async def _apply_batch(self, collection: str, batch: List[dict], summary: dict):
+        results = await asyncio.gather(*(self._fetch(record) for record in batch), return_exceptions=True)
+        operations = []
+        for record, result in zip(batch, results):
+            summary["checked"] += 1
+            if isinstance(result, Exception) or result.get("error") or not result.get("data"):
+                summary["errors"] += 1
+                continue
+            update_data, new_comments, changes = plan_ticket_update(record, result["data"])
+            if not changes:
+                continue
+            update = {"$set": update_data}
+            if new_comments:
+                update["$push"] = {"comments": {"$each": new_comments}}
+            # Status as read: a ticket a webhook moved since then is left alone
+            operations.append(UpdateOne({"id": record["id"], "status": record["status"]}, update))
+        if operations:
+            result = await db[collection].bulk_write(operations, ordered=False)
+            summary["updated"] += result.modified_count
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval_seconds,
+            "concurrency": self.concurrency,
+            "rate_per_second": self.rate_per_second,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "requested": self.requested,
+            "requests_in_flight": len(self._requests),
+            "last_run": self.last_run,
+        }
+
+
+osticket_reconciler = OsTicketReconciler()
@@ -0,0 +1,91 @@
+"""
+Authenticated principal cache
+Short-lived in-process cache of the admin / company user / engineer / org user
+documents resolved by the auth dependencies, so an authenticated request does
+not pay a database round trip just to load its caller.
+
+Entries expire after PRINCIPAL_CACHE_TTL_SECONDS. Writers that update,
+deactivate or delete a principal (or an organization) must invalidate it so
+the change applies to the very next request in this process.
+"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from config import PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES
+
+# Principal kinds; the cache key is (kind, subject)
+ADMIN = "admin"
+COMPANY_USER = "company_user"
+ENGINEER = "engineer"
+ORG_USER = "org_user"
+
+
+class PrincipalCache:
+    """TTL + LRU cache of resolved principals with hit/miss counters"""
+
+    def __init__(self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (kind, subject) -> (expires_at, organization_id, value)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, subject: Hashable) -> Optional[dict]:
+        """Cached principal, or None on a miss. Returns a copy callers may mutate."""
+        key = (kind, subject)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[2])
+
+    def set(self, kind: str, subject: Hashable, value: dict, organization_id: Optional[str] = None):
+        """Cache a principal; `organization_id` lets invalidate_organization() find it"""
+        if self.ttl_seconds <= 0:
+            return
+        key = (kind, subject)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, organization_id, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, kind: str, *subjects: Hashable):
+        """Drop the given principals of one kind"""
+        for subject in subjects:
+            if self._entries.pop((kind, subject), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_organization(self, organization_id: str):
+        """Drop every principal belonging to an organization"""
+        stale = [key for key, entry in self._entries.items() if entry[1] == organization_id]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,99 @@
+"""
+Async Razorpay gateway
+The Razorpay SDK is synchronous (requests), so every services.razorpay_service
+call made from an endpoint used to block the event loop for the whole round
+trip. The gateway runs those calls on a dedicated thread pool of
+RAZORPAY_MAX_THREADS threads: a slow payment gateway ties up only these
+threads, and unrelated API traffic keeps flowing.
+
+Each call is bounded by RAZORPAY_TIMEOUT_SECONDS (also set on the SDK's HTTP
+session, so the thread is freed too). A timed-out call returns the same
+{"error": ...} shape the service functions use. Latency, timeouts and queueing
+are recorded per function.
+
+Usage:
+    result = await razorpay_gateway.call(get_subscription, subscription_id)
+"""
+import asyncio
+import functools
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from config import RAZORPAY_MAX_THREADS, RAZORPAY_TIMEOUT_SECONDS
+from utils.timings import Timings
+
+logger = logging.getLogger(__name__)
+
+# Headroom over the HTTP timeout for SDK work around the request
+_TIMEOUT_MARGIN_SECONDS = 2.0
+
+
+class RazorpayGateway:
+    """Runs synchronous Razorpay SDK calls on a bounded thread pool"""
+
+    def __init__(self, max_threads: int = RAZORPAY_MAX_THREADS, timeout: float = RAZORPAY_TIMEOUT_SECONDS):
+        self.max_threads = max_threads
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.running = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self._latency: Dict[str, Timings] = defaultdict(Timings)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="razorpay")
+            self._slots = asyncio.Semaphore(self.max_threads)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    async def call(self, fn: Callable, *args, **kwargs) -> dict:
+        """Run a services.razorpay_service function off the event loop"""
+        if self._executor is None:
+            self.start()
+        slots = self._slots
+        name = fn.__name__
+        started_at = time.perf_counter()
+
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+            return await asyncio.wait_for(future, timeout=self.timeout + _TIMEOUT_MARGIN_SECONDS)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f"Razorpay {name} timed out after {self.timeout:.0f}s")
+            return {"error": "Payment gateway timed out, please retry"}
+        finally:
+            self.running -= 1
+            slots.release()
+            self._latency[name].add((time.perf_counter() - started_at) * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "max_threads": self.max_threads,
+            "timeout_seconds": self.timeout,
+            "running": self.running,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "calls": {
+                name: {"count": timings.count, **timings.summary()}
+                for name, timings in self._latency.items()
+            },
+        }
+
+
+razorpay_gateway = RazorpayGateway()
@@ -1,13 +1,19 @@
 """
 Razorpay Integration Service
-Handles subscriptions, payments, and webhooks
+Handles subscriptions, payments, and webhooks.
+The SDK is synchronous: async code calls these functions through
+services.razorpay_gateway, never directly.
 """
 import os
 import logging
 import razorpay
+import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 
+from config import RAZORPAY_MAX_THREADS, RAZORPAY_TIMEOUT_SECONDS
+
 logger = logging.getLogger(__name__)
 
 # Initialize Razorpay client
@@ -15,9 +21,27 @@ RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET")
 RAZORPAY_WEBHOOK_SECRET = os.environ.get("RAZORPAY_WEBHOOK_SECRET")
 
+
+class _TimeoutSession(requests.Session):
+    """requests session with a default timeout (the SDK never passes one)"""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+        # Keep-alive pool sized to the gateway's thread pool (services.razorpay_gateway)
+        self.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=RAZORPAY_MAX_THREADS))
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
 razorpay_client = None
 if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    razorpay_client = razorpay.Client(
+        session=_TimeoutSession(RAZORPAY_TIMEOUT_SECONDS),
+        auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+    )
     logger.info("Razorpay client initialized")
 else:
     logger.warning("Razorpay credentials not configured")
@@ -0,0 +1,111 @@
+"""
+Reference data cache
+In-process cache for nearly static collections (settings, masters, pricing
+plans). Every namespace carries a version counter stored in
+`reference_versions`; writers call `bump()` after changing the underlying
+collection. Cached entries are re-validated against the stored version at most
+every REFERENCE_CACHE_REVALIDATE_SECONDS, so other worker processes pick up a
+bump within that window.
+
+Responses built from cached data carry an ETag derived from the version, and
+`not_modified()` turns a matching If-None-Match into a 304.
+"""
+import copy
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from pymongo import ReturnDocument
+
+from config import REFERENCE_CACHE_REVALIDATE_SECONDS
+from database import db
+
+SETTINGS = "settings"
+MASTERS = "masters"
+PLANS = "plans"
+
+
+class ReferenceCache:
+    """Versioned cache of reference data, keyed by namespace and key"""
+
+    def __init__(self, revalidate_seconds: float = REFERENCE_CACHE_REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        # namespace -> (version, checked_at)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        # (namespace, key) -> (version, value)
+        self._entries: Dict[tuple, Tuple[int, object]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def version(self, namespace: str) -> int:
+        """Current version of a namespace (read from the database when stale)"""
+        cached = self._versions.get(namespace)
+        if cached and time.monotonic() - cached[1] < self.revalidate_seconds:
+            return cached[0]
+        doc = await db.reference_versions.find_one({"id": namespace}, {"_id": 0, "version": 1})
+        version = doc.get("version", 0) if doc else 0
+        self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    async def bump(self, namespace: str) -> int:
+        """Record a change to a namespace; drops its cached entries in this process"""
+        doc = await db.reference_versions.find_one_and_update(
+            {"id": namespace},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0, "version": 1}
+        )
+        version = doc["version"]
+        self._versions[namespace] = (version, time.monotonic())
+        for key in [k for k in self._entries if k[0] == namespace]:
+            del self._entries[key]
+        return version
+
+    async def get(self, namespace: str, key: str, loader: Callable[[], Awaitable]) -> Tuple[object, str]:
+        """
+        Cached value for (namespace, key), loading it with `loader()` when missing
+        or outdated. Returns (a copy of the value, etag).
+        """
+        version = await self.version(namespace)
+        entry = self._entries.get((namespace, key))
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            value = entry[1]
+        else:
+            self.misses += 1
+            value = await loader()
+            self._entries[(namespace, key)] = (version, value)
+        return copy.deepcopy(value), self.etag(namespace, key, version)
+
+    @staticmethod
+    def etag(namespace: str, key: str, version: int) -> str:
+        key_hash = hashlib.sha1(key.encode()).hexdigest()[:10]
+        return f'W/"{namespace}-{version}-{key_hash}"'
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "versions": {ns: v for ns, (v, _) in self._versions.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Attach the ETag to `response`; return a 304 response when the client's
+    If-None-Match already names it.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+reference_cache = ReferenceCache()
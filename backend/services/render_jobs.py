@@ -0,0 +1,388 @@
+"""
+Background render jobs
+Large documents (bulk QR label sheets, bulk warranty report exports) are
+rendered as jobs: the submitting
+request records the job in `render_jobs` and returns at once, a background
+task streams the source documents from a cursor and appends rendered pages to
+a file under RENDER_JOB_DIR, and clients poll the job for progress and
+download the finished file (HTTP range requests supported).
+
+Jobs render within RENDER_JOB_MAX_CONCURRENCY pool slots (shared by all jobs
+of the process), so single PDF / QR downloads keep a free slot during exports.
+
+A running job refreshes its updated_at every minute (including during long
+single steps such as the final merge), so only a job whose process is gone
+goes stale and is reported as failed.
+
+Job records expire after RENDER_JOB_TTL_HOURS (TTL index on expires_at);
+purge_expired_job_files() removes the matching output files.
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Coroutine, List, Optional, Set
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from config import RENDER_JOB_DIR, RENDER_JOB_TTL_HOURS, RENDER_JOB_BATCH_SIZE, RENDER_JOB_MAX_CONCURRENCY
+from database import db
+from services.render_pool import render_pool
+from services.warranty_reports import load_report_inputs, render_report_inputs, report_date
+from utils.helpers import get_ist_now, get_ist_isoformat
+from utils.rendering import LABELS_PER_PAGE, PdfPageWriter, merge_pdf_files, render_qr_page_streams, render_sheet_footer_stream
+
+logger = logging.getLogger(__name__)
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Job kinds
+QR_LABELS = "qr_labels"
+WARRANTY_REPORTS = "warranty_reports"
+
+# A running job whose record has not moved for this long lost its process
+_STALE_AFTER = timedelta(minutes=10)
+_HEARTBEAT_SECONDS = 60
+_DOWNLOAD_CHUNK_BYTES = 256 * 1024
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+# asyncio keeps only weak references to tasks; hold running jobs here
+_running_tasks = set()
+
+# Render pool slots shared by every job of this process, kept below the pool's
+# concurrency so interactive PDF / QR downloads never queue behind an export
+_job_slots = asyncio.Semaphore(max(1, min(RENDER_JOB_MAX_CONCURRENCY, render_pool.max_concurrency)))
+
+
+async def create_job(kind: str, created_by: str, total: int, filename: str) -> dict:
+    """Record a queued job and return its public view"""
+    now = get_ist_isoformat()
+    job = {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "status": QUEUED,
+        "total": total,
+        "processed": 0,
+        "filename": filename,
+        "size_bytes": None,
+        "error": None,
+        "created_by": created_by,
+        "created_at": now,
+        "updated_at": now,
+        "completed_at": None,
+        "expires_at": datetime.now(timezone.utc) + timedelta(hours=RENDER_JOB_TTL_HOURS)
+    }
+    await db.render_jobs.insert_one(job)
+    return _public(job)
+
+
+def start_job(job_coroutine: Coroutine) -> asyncio.Task:
+    """Run a job coroutine in the background of this process"""
+    task = asyncio.create_task(job_coroutine)
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return task
+
+
+async def get_job(job_id: str, created_by: str, kind: str, include_file: bool = False) -> dict:
+    """A job of `kind` submitted by `created_by`; 404 when unknown or expired"""
+    job = await db.render_jobs.find_one({"id": job_id, "created_by": created_by, "kind": kind}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job["status"] in (QUEUED, RUNNING):
+        updated_at = datetime.fromisoformat(job["updated_at"])
+        if get_ist_now() - updated_at > _STALE_AFTER:
+            # The process running it restarted; report it instead of polling forever
+            error = "Job was interrupted, please submit it again"
+            # Only if the record is still the stale one read above
+            result = await db.render_jobs.update_one(
+                {"id": job_id, "status": job["status"], "updated_at": job["updated_at"]},
+                {"$set": {"status": FAILED, "error": error, "updated_at": get_ist_isoformat()}}
+            )
+            if result.modified_count:
+                job["status"] = FAILED
+                job["error"] = error
+    return job if include_file else _public(job)
+
+
+def _public(job: dict) -> dict:
+    view = {k: v for k, v in job.items() if k not in ("_id", "file_path", "expires_at")}
+    view["progress"] = round(job["processed"] * 100 / job["total"], 1) if job.get("total") else 0.0
+    return view
+
+
+async def _update(job_id: str, **fields):
+    fields["updated_at"] = get_ist_isoformat()
+    await db.render_jobs.update_one({"id": job_id}, {"$set": fields})
+
+
+def _start_heartbeat(job_id: str) -> asyncio.Task:
+    """Refresh the running job's updated_at until the returned task is cancelled"""
+    async def beat():
+        while True:
+            await asyncio.sleep(_HEARTBEAT_SECONDS)
+            try:
+                await db.render_jobs.update_one(
+                    {"id": job_id, "status": RUNNING},
+                    {"$set": {"updated_at": get_ist_isoformat()}}
+                )
+            except Exception as e:
+                logger.warning(f"Render job {job_id} heartbeat failed: {e}")
+
+    return asyncio.create_task(beat())
+
+
+async def _when_pool_free(call: Callable[[], Awaitable]):
+    """
+    Await `call()` (which renders through the pool) within the job slots,
+    waiting out saturation instead of failing the job
+    """
+    for attempt in range(30):
+        try:
+            async with _job_slots:
+                return await call()
+        except HTTPException as e:
+            if e.status_code != 503:
+                raise
+            await asyncio.sleep(min(1 + attempt, 5))
+    raise RuntimeError("Render pool stayed saturated")
+
+
+def _append_pages(writer: PdfPageWriter, pages: List[bytes]):
+    for page in pages:
+        writer.add_page(page)
+
+
+async def run_qr_label_job(job_id: str, query: dict, frontend_url: str):
+    """
+    Render QR label sheets for every device matching `query` into the job's
+    output file. Devices are streamed in batches, so memory use is bounded by
+    RENDER_JOB_BATCH_SIZE rather than the number of labels.
+    """
+    RENDER_JOB_DIR.mkdir(parents=True, exist_ok=True)
+    path = RENDER_JOB_DIR / f"{job_id}.pdf"
+    partial_path = path.with_suffix(".part")
+    # Whole pages per batch so every batch starts on a fresh page
+    batch_size = max(LABELS_PER_PAGE, RENDER_JOB_BATCH_SIZE // LABELS_PER_PAGE * LABELS_PER_PAGE)
+
+    await _update(job_id, status=RUNNING)
+    heartbeat = _start_heartbeat(job_id)
+    try:
+        processed = 0
+        with open(partial_path, "wb") as file:
+            writer = PdfPageWriter(file)
+
+            async def flush(batch: List[dict]):
+                pages = await _when_pool_free(lambda: render_pool.run("qr_pages", render_qr_page_streams, batch))
+                await asyncio.to_thread(_append_pages, writer, pages)
+
+            batch = []
+            cursor = db.devices.find(
+                query,
+                {"_id": 0, "serial_number": 1, "asset_tag": 1}
+            ).sort("serial_number", 1).batch_size(batch_size)
+            async for device in cursor:
+                batch.append({
+                    "url": f"{frontend_url}/device/{device['serial_number']}",
+                    "serial_number": device.get("serial_number"),
+                    "asset_tag": device.get("asset_tag")
+                })
+                if len(batch) >= batch_size:
+                    await flush(batch)
+                    processed += len(batch)
+                    batch = []
+                    await _update(job_id, processed=processed)
+            if batch:
+                await flush(batch)
+                processed += len(batch)
+
+            footer = f"Generated: {get_ist_now().strftime('%Y-%m-%d %H:%M')} | {processed} QR codes | Size: 1.5\" x 1.5\""
+            await asyncio.to_thread(writer.finish, render_sheet_footer_stream(footer))
+
+        os.replace(partial_path, path)
+        await _update(
+            job_id,
+            status=COMPLETED,
+            processed=processed,
+            total=processed,
+            file_path=str(path),
+            size_bytes=path.stat().st_size,
+            completed_at=get_ist_isoformat()
+        )
+        logger.info(f"QR label job {job_id} completed: {processed} labels")
+    except Exception as e:
+        logger.exception(f"QR label job {job_id} failed")
+        partial_path.unlink(missing_ok=True)
+        await _update(job_id, status=FAILED, error=str(e) or e.__class__.__name__)
+    finally:
+        heartbeat.cancel()
+
+
+def _archive_name(device: dict, used: Set[str]) -> str:
+    """Unique, filesystem-safe ZIP entry name for a device's report"""
+    base = "warranty_report_" + re.sub(r"[^\w.-]+", "_", device.get("serial_number") or device["id"])
+    name, suffix = f"{base}.pdf", 2
+    while name in used:
+        name = f"{base}_{suffix}.pdf"
+        suffix += 1
+    used.add(name)
+    return name
+
+
+async def run_warranty_report_job(job_id: str, query: dict, output_format: str, portal_name: str):
+    """
+    Render the warranty report of every device matching `query` into one ZIP
+    of per-device PDFs ("zip") or a single merged PDF ("pdf"). Devices are
+    streamed in batches; each batch loads its report data with one query per
+    collection and renders in parallel across the render pool.
+    """
+    RENDER_JOB_DIR.mkdir(parents=True, exist_ok=True)
+    path = RENDER_JOB_DIR / f"{job_id}.{output_format}"
+    partial_path = RENDER_JOB_DIR / f"{job_id}.part"
+    # Merged output: per-device files are written here and concatenated at the end
+    pages_dir = RENDER_JOB_DIR / f"{job_id}.pages"
+    date = report_date()
+
+    async def render(inputs: dict) -> bytes:
+        _, pdf_bytes = await _when_pool_free(lambda: render_report_inputs(inputs, date))
+        return pdf_bytes
+
+    await _update(job_id, status=RUNNING)
+    heartbeat = _start_heartbeat(job_id)
+    try:
+        processed = 0
+        report_files: List[str] = []
+        archive = zipfile.ZipFile(partial_path, "w", zipfile.ZIP_DEFLATED) if output_format == "zip" else None
+        if archive is None:
+            pages_dir.mkdir(exist_ok=True)
+        try:
+            used_names: Set[str] = set()
+            cursor = db.devices.find(query, {"_id": 0}).sort("serial_number", 1).batch_size(RENDER_JOB_BATCH_SIZE)
+            batch = []
+
+            async def flush(batch: List[dict]):
+                reports = await load_report_inputs(batch, portal_name)
+                pdfs = await asyncio.gather(*(render(inputs) for inputs, _ in reports))
+                for device, pdf_bytes in zip(batch, pdfs):
+                    if archive is not None:
+                        await asyncio.to_thread(archive.writestr, _archive_name(device, used_names), pdf_bytes)
+                    else:
+                        report_path = pages_dir / f"{len(report_files):07d}.pdf"
+                        await asyncio.to_thread(report_path.write_bytes, pdf_bytes)
+                        report_files.append(str(report_path))
+
+            async for device in cursor:
+                batch.append(device)
+                if len(batch) >= RENDER_JOB_BATCH_SIZE:
+                    await flush(batch)
+                    processed += len(batch)
+                    batch = []
+                    await _update(job_id, processed=processed)
+            if batch:
+                await flush(batch)
+                processed += len(batch)
+        finally:
+            if archive is not None:
+                await asyncio.to_thread(archive.close)
+
+        if archive is None:
+            await _when_pool_free(lambda: render_pool.run("warranty_merge", merge_pdf_files, report_files, str(partial_path)))
+
+        os.replace(partial_path, path)
+        await _update(
+            job_id,
+            status=COMPLETED,
+            processed=processed,
+            total=processed,
+            file_path=str(path),
+            size_bytes=path.stat().st_size,
+            completed_at=get_ist_isoformat()
+        )
+        logger.info(f"Warranty report job {job_id} completed: {processed} devices ({output_format})")
+    except Exception as e:
+        logger.exception(f"Warranty report job {job_id} failed")
+        partial_path.unlink(missing_ok=True)
+        await _update(job_id, status=FAILED, error=str(e) or e.__class__.__name__)
+    finally:
+        heartbeat.cancel()
+        shutil.rmtree(pages_dir, ignore_errors=True)
+
+
+def job_file_response(request: Request, job: dict, media_type: str) -> StreamingResponse:
+    """
+    Stream a completed job's file, honouring a single `Range: bytes=` request
+    (206 Partial Content) so interrupted downloads can resume.
+    """
+    path = Path(job.get("file_path") or "")
+    if not job.get("file_path") or not path.is_file():
+        raise HTTPException(status_code=410, detail="Job output is no longer available")
+    size = path.stat().st_size
+    etag = f'"{job["id"]}-{size}"'
+
+    start, end, status_code = 0, size - 1, 200
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename={job['filename']}"
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    match = _RANGE_PATTERN.match(range_header.strip()) if range_header else None
+    # Malformed, multi-part or outdated (If-Range) ranges fall back to the full file
+    if match and (match[1] or match[2]) and (not if_range or if_range == etag):
+        if match[1]:
+            start = int(match[1])
+            end = min(int(match[2]), size - 1) if match[2] else size - 1
+        else:
+            start = max(0, size - int(match[2]))
+        if start > end:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    def iter_file():
+        with open(path, "rb") as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(_DOWNLOAD_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    return StreamingResponse(iter_file(), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def purge_expired_job_files(directory: Optional[Path] = None) -> int:
+    """Delete job output (and leftover work) files older than the job retention window"""
+    directory = directory or RENDER_JOB_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - RENDER_JOB_TTL_HOURS * 3600
+    removed = 0
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if path.is_dir():
+                # Per-device files left behind by an interrupted merged export
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not purge job file {path}: {e}")
+    return removed
@@ -0,0 +1,135 @@
+"""
+Rendering executor
+Runs CPU-bound PDF / QR rendering (utils.rendering) in a bounded process pool
+so ReportLab, qrcode and PIL never block the event loop.
+
+At most RENDER_MAX_CONCURRENCY jobs run at once; up to RENDER_MAX_QUEUE more
+may wait for a slot, beyond which callers get 503 instead of piling up.
+Queue wait and render time are recorded per job kind.
+
+Usage:
+    pdf_bytes = await render_pool.run("warranty_pdf", render_warranty_pdf, **plain_data)
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from config import RENDER_WORKERS, RENDER_MAX_CONCURRENCY, RENDER_MAX_QUEUE
+from utils.timings import Timings
+
+logger = logging.getLogger(__name__)
+
+
+class RenderPool:
+    """Bounded process pool with admission control and timing metrics"""
+
+    def __init__(self, workers: int = RENDER_WORKERS, max_concurrency: int = RENDER_MAX_CONCURRENCY, max_queue: int = RENDER_MAX_QUEUE):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.failures = 0
+        self._queue_wait: Dict[str, Timings] = defaultdict(Timings)
+        self._render: Dict[str, Timings] = defaultdict(Timings)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: never fork a process that already holds the event loop and driver threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def start(self):
+        """Create the executor (worker processes spawn lazily on the first job)"""
+        if self._executor is None:
+            self._executor = self._new_executor()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            logger.info(f"Render pool started: {self.workers} worker(s), concurrency {self.max_concurrency}, queue {self.max_queue}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    async def run(self, kind: str, fn: Callable, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` in a worker process and return its result.
+        `fn` must be a module-level function and all arguments plain picklable data.
+        """
+        if self._executor is None:
+            self.start()
+        slots = self._slots
+        if slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Document rendering is busy, please retry shortly",
+                headers={"Retry-After": "5"}
+            )
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        self._queue_wait[kind].add((started_at - queued_at) * 1000)
+        self.running += 1
+        executor = self._executor
+        try:
+            if executor is None:
+                # shutdown() ran while this job waited for a slot
+                raise HTTPException(status_code=503, detail="Document rendering is shutting down")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); replace the pool so later jobs can run.
+            # Every in-flight job fails together; only the first replaces the
+            # broken pool, and none restarts a pool shut down meanwhile.
+            self.failures += 1
+            if self._executor is executor:
+                logger.error(f"Render pool broken during '{kind}'; restarting")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+            raise HTTPException(status_code=503, detail="Document rendering failed, please retry")
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.running -= 1
+            slots.release()
+            self._render[kind].add((time.perf_counter() - started_at) * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "jobs": {
+                kind: {
+                    "count": timings.count,
+                    "queue_wait": self._queue_wait[kind].summary(),
+                    "render": timings.summary(),
+                }
+                for kind, timings in self._render.items()
+            },
+        }
+
+
+render_pool = RenderPool()
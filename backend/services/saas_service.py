@@ -10,6 +10,8 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 
+from services.principal_cache import principal_cache
+
 logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -312,6 +314,7 @@ async def update_subscription_status(
         {"id": org_id},
         {"$set": update_data}
     )
+    principal_cache.invalidate_organization(org_id)
 
 
 async def handle_subscription_activated(db, org_id: str, subscription_data: Dict):
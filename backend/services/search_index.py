@@ -0,0 +1,267 @@
+"""
+Universal search index
+Keeps one `search_index` document per searchable entity, holding its tokens and
+their prefixes of MIN_PREFIX_LENGTH characters or more. Lookups are multikey
+index hits on `prefixes` (query tokens shorter than that match whole tokens
+through `terms`), and at most SEARCH_CANDIDATES matches are scored, so search
+cost follows the number of results instead of the collection sizes.
+
+Writers call `sync_entities(collection, *ids)` (or `sync_matching` for
+multi-document updates) after changing a searchable entity.
+
+Usage (from the backend directory):
+    python -m services.search_index rebuild [collection]
+"""
+import argparse
+import asyncio
+import logging
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import DeleteOne, ReplaceOne
+
+from database import db
+from utils.helpers import normalize_lookup_key
+
+logger = logging.getLogger(__name__)
+
+# Source collection -> indexed fields. Title fields rank above the rest;
+# identifier fields also index their separator-free form ("ABC-123" -> "abc123").
+SEARCH_SOURCES: Dict[str, dict] = {
+    "companies": {
+        "title": ["name"],
+        "fields": ["contact_email", "gst_number", "address"],
+    },
+    "sites": {
+        "title": ["name"],
+        "fields": ["address", "city", "primary_contact_name", "contact_number"],
+    },
+    "users": {
+        "title": ["name"],
+        "fields": ["email", "phone", "designation"],
+    },
+    "devices": {
+        "title": ["brand", "model", "serial_number", "asset_tag"],
+        "fields": ["device_type", "location"],
+        "identifiers": ["serial_number", "asset_tag"],
+    },
+    "deployments": {
+        "title": ["name"],
+        "fields": ["installed_by", "notes", "items.serial_numbers", "items.category", "items.brand", "items.model"],
+        "identifiers": ["items.serial_numbers"],
+    },
+    "amc_contracts": {
+        "title": ["name"],
+        "fields": ["amc_type", "internal_notes"],
+    },
+    "service_history": {
+        "title": ["ticket_id", "action_taken"],
+        "fields": ["problem_reported", "technician_name", "notes"],
+        "identifiers": ["ticket_id"],
+    },
+}
+
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_LENGTH = 20
+MAX_QUERY_TOKENS = 8
+# Matches scored and ranked per query
+SEARCH_CANDIDATES = 200
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> List[str]:
+    """Lowercase alphanumeric tokens of a value"""
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _field_values(doc: dict, path: str) -> list:
+    """Values at a dotted path, flattening lists along the way"""
+    values = [doc]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                value = [v.get(part) for v in value if isinstance(v, dict)]
+            elif isinstance(value, dict):
+                value = value.get(part)
+            else:
+                value = None
+            if isinstance(value, list):
+                next_values.extend(value)
+            elif value is not None:
+                next_values.append(value)
+        values = next_values
+    return [v for v in values if v not in (None, "")]
+
+
+def build_search_document(collection: str, doc: dict) -> dict:
+    """Search-index document for one entity"""
+    source = SEARCH_SOURCES[collection]
+    title_terms, terms = set(), set()
+
+    for path in source["title"]:
+        for value in _field_values(doc, path):
+            title_terms.update(tokenize(value))
+    for path in source["fields"]:
+        for value in _field_values(doc, path):
+            terms.update(tokenize(value))
+    for path in source.get("identifiers", []):
+        for value in _field_values(doc, path):
+            key = normalize_lookup_key(str(value))
+            if key:
+                terms.add(key.lower())
+    terms |= title_terms
+
+    prefixes = {
+        term[:length]
+        for term in terms
+        for length in range(MIN_PREFIX_LENGTH, min(len(term), MAX_PREFIX_LENGTH) + 1)
+    }
+    return {
+        "collection": collection,
+        "entity_id": doc["id"],
+        "terms": sorted(terms),
+        "title_terms": sorted(title_terms),
+        "prefixes": sorted(prefixes),
+        "indexed_at": datetime.now(timezone.utc),
+    }
+
+
+def _is_searchable(doc: Optional[dict]) -> bool:
+    return bool(doc) and bool(doc.get("id")) and not doc.get("is_deleted")
+
+
+async def sync_entities(collection: str, *entity_ids) -> int:
+    """
+    Re-index the given entities from their source collection, dropping any that
+    are gone or soft-deleted. Never raises: a stale search hit is better than a
+    failed write. Returns the number of index operations applied.
+    """
+    ids = list({i for i in entity_ids if i})
+    if collection not in SEARCH_SOURCES or not ids:
+        return 0
+
+    try:
+        docs = await db[collection].find({"id": {"$in": ids}}, {"_id": 0}).to_list(None)
+        by_id = {d["id"]: d for d in docs}
+        ops = []
+        for entity_id in ids:
+            doc = by_id.get(entity_id)
+            key = {"collection": collection, "entity_id": entity_id}
+            if _is_searchable(doc):
+                ops.append(ReplaceOne(key, build_search_document(collection, doc), upsert=True))
+            else:
+                ops.append(DeleteOne(key))
+        await db.search_index.bulk_write(ops, ordered=False)
+        return len(ops)
+    except Exception as e:
+        logger.error(f"Search index sync failed for {collection} {ids[:5]}: {e}")
+        return 0
+
+
+async def sync_matching(collection: str, query: dict) -> int:
+    """Re-index every entity matching `query` (for update_many / delete_many writers)"""
+    if collection not in SEARCH_SOURCES:
+        return 0
+    docs = await db[collection].find(query, {"_id": 0, "id": 1}).to_list(None)
+    return await sync_entities(collection, *[d.get("id") for d in docs])
+
+
+async def rebuild_search_index(collections: Optional[Iterable[str]] = None, batch_size: int = 500) -> int:
+    """
+    Rebuild the index for the given collections (default: all) from scratch.
+    Entries neither written by this run nor synced while it ran are removed
+    afterwards. Returns the number of entities indexed.
+    """
+    run_id = str(uuid.uuid4())
+    started_at = datetime.now(timezone.utc)
+    indexed = 0
+
+    for collection in collections or SEARCH_SOURCES:
+        cursor = db[collection].find({"is_deleted": {"$ne": True}}, {"_id": 0}).batch_size(batch_size)
+        ops = []
+        async for doc in cursor:
+            if not doc.get("id"):
+                continue
+            entry = build_search_document(collection, doc)
+            entry["build_id"] = run_id
+            ops.append(ReplaceOne({"collection": collection, "entity_id": doc["id"]}, entry, upsert=True))
+            if len(ops) >= batch_size:
+                await db.search_index.bulk_write(ops, ordered=False)
+                indexed += len(ops)
+                ops = []
+        if ops:
+            await db.search_index.bulk_write(ops, ordered=False)
+            indexed += len(ops)
+
+        await db.search_index.delete_many({
+            "collection": collection,
+            "build_id": {"$ne": run_id},
+            "indexed_at": {"$lt": started_at}
+        })
+
+    logger.info(f"Search index rebuilt: {indexed} entities")
+    return indexed
+
+
+async def ensure_search_index() -> Optional[asyncio.Task]:
+    """Start a background rebuild when the index has never been built"""
+    if await db.search_index.estimated_document_count() > 0:
+        return None
+    logger.info("Search index is empty; rebuilding in the background")
+    return asyncio.create_task(rebuild_search_index())
+
+
+async def search_entities(collection: str, text: str, limit: int = 5, max_time_ms: Optional[int] = None) -> List[str]:
+    """
+    Entity ids in `collection` whose tokens start with every query token, best first.
+    Tokens shorter than MIN_PREFIX_LENGTH must match a whole token.
+    Ranking: exact title token > exact token > prefix-only match.
+    """
+    query_tokens = list(dict.fromkeys(tokenize(text)))[:MAX_QUERY_TOKENS]
+    if not query_tokens:
+        return []
+    query_tokens = [t[:MAX_PREFIX_LENGTH] for t in query_tokens]
+
+    match = {"collection": collection}
+    prefix_tokens = [t for t in query_tokens if len(t) >= MIN_PREFIX_LENGTH]
+    exact_tokens = [t for t in query_tokens if len(t) < MIN_PREFIX_LENGTH]
+    if prefix_tokens:
+        match["prefixes"] = {"$all": prefix_tokens}
+    if exact_tokens:
+        match["terms"] = {"$all": exact_tokens}
+
+    pipeline = [
+        {"$match": match},
+        # Bound the scoring work however broad the query is
+        {"$limit": max(limit, SEARCH_CANDIDATES)},
+        {"$project": {
+            "_id": 0,
+            "entity_id": 1,
+            "score": {"$add": [
+                {"$multiply": [3, {"$size": {"$setIntersection": ["$title_terms", query_tokens]}}]},
+                {"$multiply": [2, {"$size": {"$setIntersection": ["$terms", query_tokens]}}]},
+                # Shorter documents are more specific matches
+                {"$divide": [1, {"$add": [1, {"$size": "$terms"}]}]},
+            ]}
+        }},
+        {"$sort": {"score": -1, "entity_id": 1}},
+        {"$limit": limit},
+    ]
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    hits = await db.search_index.aggregate(pipeline, **options).to_list(limit)
+    return [hit["entity_id"] for hit in hits]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the universal search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("collections", nargs="*", choices=sorted(SEARCH_SOURCES), help="collections to rebuild (default: all)")
+    args = parser.parse_args()
+    count = asyncio.run(rebuild_search_index(args.collections or None))
+    print(f"{count} entities indexed")
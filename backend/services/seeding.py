@@ -5,6 +5,7 @@ import logging
 from database import db
 from models.common import MasterItem
 from models.supplies import SupplyCategory, SupplyProduct
+from services.reference_cache import reference_cache, MASTERS
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +95,7 @@ async def seed_default_masters():
     for item in defaults:
         master = MasterItem(**item)
         await db.masters.insert_one(master.model_dump())
+    await reference_cache.bump(MASTERS)
     
     logger.info(f"Seeded {len(defaults)} default master items")
 
@@ -0,0 +1,173 @@
+"""
+Warranty report PDF cache
+Rendered warranty PDFs are stored on disk under WARRANTY_PDF_CACHE_DIR, named
+by a hash of everything that goes into the document (device, parts, active
+AMC coverage, portal name, report date). Files are evicted least recently used
+first once the directory grows past WARRANTY_PDF_CACHE_MAX_MB.
+
+A pointer per device in `warranty_pdf_cache` remembers which file was last
+rendered for it, so a repeat download skips both the report queries and the
+render. Pointers are only valid for the same report date and settings version,
+and writers that change a device, its parts, its AMC assignments, its company
+or an AMC contract must call invalidate() for the devices they touched.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional
+
+from config import WARRANTY_PDF_CACHE_DIR, WARRANTY_PDF_CACHE_MAX_MB
+from database import db
+
+logger = logging.getLogger(__name__)
+
+
+class WarrantyPdfCache:
+    """Content-addressed disk cache of warranty PDFs with per-device pointers"""
+
+    def __init__(self, directory: Path = WARRANTY_PDF_CACHE_DIR, max_bytes: int = WARRANTY_PDF_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Size written by this process since the last scan (other workers write too)
+        self._approx_bytes: Optional[int] = None
+        self.hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def content_key(inputs: dict) -> str:
+        """Stable hash of the render inputs"""
+        canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mtime doubles as the LRU clock
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        if self._approx_bytes is None:
+            self._approx_bytes = self._scan_size()
+        else:
+            self._approx_bytes += len(data)
+        if self._approx_bytes > self.max_bytes:
+            self._evict()
+
+    def _scan_size(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.glob("*.pdf"))
+
+    def _evict(self):
+        """Delete least recently used files until the cache is under 90% of its limit"""
+        entries = []
+        for path in self.directory.glob("*.pdf"):
+            try:
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+        self._approx_bytes = total
+
+    async def lookup(self, device_id: str, report_date: str, settings_version: int) -> Optional[bytes]:
+        """PDF last rendered for a device, if its pointer is still current"""
+        pointer = await db.warranty_pdf_cache.find_one(
+            {"device_id": device_id, "report_date": report_date, "settings_version": settings_version},
+            {"_id": 0, "key": 1}
+        )
+        data = await asyncio.to_thread(self._read, pointer["key"]) if pointer else None
+        if data is not None:
+            self.hits += 1
+        return data
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """PDF for exact render inputs (another download already rendered them)"""
+        data = await asyncio.to_thread(self._read, key)
+        if data is not None:
+            self.content_hits += 1
+        else:
+            self.misses += 1
+        return data
+
+    async def put(self, key: str, data: bytes):
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            # The cache is an optimization; never fail the download over it
+            logger.warning(f"Could not cache warranty PDF {key}: {e}")
+
+    async def remember(self, device: dict, key: str, report_date: str, settings_version: int, amc_contract_id: Optional[str]):
+        """Point a device at its current PDF"""
+        await db.warranty_pdf_cache.replace_one(
+            {"device_id": device["id"]},
+            {
+                "device_id": device["id"],
+                "company_id": device.get("company_id"),
+                "amc_contract_id": amc_contract_id,
+                "key": key,
+                "report_date": report_date,
+                "settings_version": settings_version
+            },
+            upsert=True
+        )
+
+    async def invalidate(self, device_ids: Optional[List[str]] = None, company_id: Optional[str] = None, amc_contract_id: Optional[str] = None):
+        """Drop the cached PDFs of the given devices, a company's devices or a contract's devices"""
+        conditions = []
+        device_ids = [d for d in (device_ids or []) if d]
+        if device_ids:
+            conditions.append({"device_id": {"$in": device_ids}})
+        if company_id:
+            conditions.append({"company_id": company_id})
+        if amc_contract_id:
+            conditions.append({"amc_contract_id": amc_contract_id})
+        if not conditions:
+            return
+
+        query = {"$or": conditions}
+        keys = [p["key"] async for p in db.warranty_pdf_cache.find(query, {"_id": 0, "key": 1})]
+        if not keys:
+            return
+        await db.warranty_pdf_cache.delete_many(query)
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+        self.invalidations += len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.content_hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "approx_bytes": self._approx_bytes,
+            "hits": self.hits,
+            "content_hits": self.content_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.content_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+warranty_pdf_cache = WarrantyPdfCache()
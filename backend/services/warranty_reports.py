@@ -0,0 +1,194 @@
+"""
+Warranty reports
+Builds the data behind a device's warranty report, renders it through the
+render pool and reuses rendered files from the warranty PDF cache.
+
+Report data for many devices is loaded in bulk (one query per collection per
+batch), which is what bulk exports use; the single-device download goes
+through the same path with a batch of one.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from database import db
+from services.reference_cache import reference_cache, SETTINGS
+from services.render_pool import render_pool
+from services.warranty_pdf_cache import warranty_pdf_cache
+from utils.helpers import get_ist_now, is_warranty_active
+from utils.rendering import render_warranty_pdf
+
+
+def build_report_inputs(
+    device: dict,
+    company_name: str,
+    parts: List[dict],
+    amc_assignment: Optional[dict],
+    amc_contract: Optional[dict],
+    portal_name: str
+) -> Tuple[dict, Optional[str]]:
+    """
+    Plain render_warranty_pdf arguments (everything except generated_at) for a
+    device, plus the id of the AMC contract its active assignment points at.
+    `amc_contract` is only shown while the assignment's coverage is active.
+    """
+    amc_contract_info = None
+    if amc_assignment and amc_contract and is_warranty_active(amc_assignment.get("coverage_end", "")):
+        amc_contract_info = {
+            "name": amc_contract.get("name"),
+            "amc_type": amc_contract.get("amc_type"),
+            "coverage_start": amc_assignment.get("coverage_start"),
+            "coverage_end": amc_assignment.get("coverage_end"),
+            "coverage_includes": amc_contract.get("coverage_includes"),
+            "entitlements": amc_contract.get("entitlements")
+        }
+
+    device_rows = [
+        ["Device Type", device.get("device_type", "-")],
+        ["Brand", device.get("brand", "-")],
+        ["Model", device.get("model", "-")],
+        ["Serial Number", device.get("serial_number", "-")],
+        ["Asset Tag", device.get("asset_tag", "-") or "-"],
+        ["Company", company_name],
+        ["Purchase Date", device.get("purchase_date", "-")],
+        ["Condition", device.get("condition", "-").title()],
+        ["Warranty Expiry", device.get("warranty_end_date", "-") or "Not specified"],
+        ["Warranty Status", "Active" if is_warranty_active(device.get("warranty_end_date", "")) else "Expired / Not Covered"]
+    ]
+
+    parts_rows = None
+    if parts:
+        parts_rows = [["Part Name", "Replaced Date", "Warranty", "Expiry", "Status"]]
+        for part in parts:
+            status = "Active" if is_warranty_active(part.get("warranty_expiry_date", "")) else "Expired"
+            parts_rows.append([
+                part.get("part_name", "-"),
+                part.get("replaced_date", "-"),
+                f"{part.get('warranty_months', 0)} months",
+                part.get("warranty_expiry_date", "-"),
+                status
+            ])
+
+    if amc_contract_info:
+        amc_type_display = (amc_contract_info.get("amc_type") or "standard").replace("_", " ").title()
+        coverage_includes = amc_contract_info.get("coverage_includes", {})
+
+        # Build coverage details string
+        coverage_items = []
+        if coverage_includes.get("onsite_support"):
+            coverage_items.append("Onsite Support")
+        if coverage_includes.get("remote_support"):
+            coverage_items.append("Remote Support")
+        if coverage_includes.get("preventive_maintenance"):
+            coverage_items.append("Preventive Maintenance")
+        coverage_str = ", ".join(coverage_items) if coverage_items else "Standard Coverage"
+
+        # Build entitlements string
+        entitlements = amc_contract_info.get("entitlements", {})
+        entitlement_items = []
+        if entitlements.get("onsite_visits_per_year"):
+            visits = entitlements["onsite_visits_per_year"]
+            entitlement_items.append(f"{visits} Onsite Visits/Year" if visits != -1 else "Unlimited Onsite Visits")
+        if entitlements.get("remote_support_count"):
+            remote = entitlements["remote_support_count"]
+            entitlement_items.append(f"{remote} Remote Support Sessions" if remote != -1 else "Unlimited Remote Support")
+        entitlement_str = ", ".join(entitlement_items) if entitlement_items else "-"
+
+        amc_rows = [
+            ["Contract Name", amc_contract_info.get("name", "-")],
+            ["AMC Type", amc_type_display],
+            ["Coverage Start", amc_contract_info.get("coverage_start", "-")],
+            ["Coverage End", amc_contract_info.get("coverage_end", "-")],
+            ["Status", "Active"],
+            ["Coverage Includes", coverage_str],
+            ["Entitlements", entitlement_str]
+        ]
+    else:
+        amc_rows = [["Status", "No active AMC found for this device"]]
+
+    inputs = {
+        "portal_name": portal_name,
+        "device_rows": device_rows,
+        "parts_rows": parts_rows,
+        "amc_rows": amc_rows
+    }
+    return inputs, (amc_assignment or {}).get("amc_contract_id")
+
+
+async def load_report_inputs(devices: List[dict], portal_name: str) -> List[Tuple[dict, Optional[str]]]:
+    """
+    build_report_inputs() for each device, with companies, parts, active AMC
+    assignments and AMC contracts each fetched in a single query.
+    """
+    device_ids = [d["id"] for d in devices]
+    company_ids = list({d.get("company_id") for d in devices if d.get("company_id")})
+
+    companies, parts, assignments = await asyncio.gather(
+        db.companies.find({"id": {"$in": company_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None),
+        db.parts.find({"device_id": {"$in": device_ids}, "is_deleted": {"$ne": True}}, {"_id": 0}).to_list(None),
+        db.amc_device_assignments.find({"device_id": {"$in": device_ids}, "status": "active"}, {"_id": 0}).to_list(None)
+    )
+    company_names = {c["id"]: c.get("name") for c in companies}
+    parts_by_device: Dict[str, List[dict]] = {}
+    for part in parts:
+        parts_by_device.setdefault(part["device_id"], []).append(part)
+    assignment_by_device: Dict[str, dict] = {}
+    for assignment in assignments:
+        # First active assignment wins, as with find_one
+        assignment_by_device.setdefault(assignment["device_id"], assignment)
+
+    contract_ids = list({
+        a["amc_contract_id"] for a in assignment_by_device.values()
+        if is_warranty_active(a.get("coverage_end", ""))
+    })
+    contracts = await db.amc_contracts.find(
+        {"id": {"$in": contract_ids}, "is_deleted": {"$ne": True}}, {"_id": 0}
+    ).to_list(None) if contract_ids else []
+    contracts_by_id = {c["id"]: c for c in contracts}
+
+    results = []
+    for device in devices:
+        assignment = assignment_by_device.get(device["id"])
+        results.append(build_report_inputs(
+            device,
+            company_names.get(device.get("company_id")) or "Unknown",
+            parts_by_device.get(device["id"], []),
+            assignment,
+            contracts_by_id.get(assignment["amc_contract_id"]) if assignment else None,
+            portal_name
+        ))
+    return results
+
+
+def report_date() -> str:
+    """IST date a report is valid for (part of the cache key)"""
+    return get_ist_now().strftime('%Y-%m-%d')
+
+
+async def render_report_inputs(inputs: dict, date: str) -> Tuple[str, bytes]:
+    """Render inputs to PDF bytes, reusing an identical earlier render. Returns (cache key, bytes)."""
+    key = warranty_pdf_cache.content_key({**inputs, "report_date": date})
+    pdf_bytes = await warranty_pdf_cache.get(key)
+    if pdf_bytes is None:
+        # Render in the worker pool; only plain data crosses the process boundary
+        pdf_bytes = await render_pool.run(
+            "warranty_pdf",
+            render_warranty_pdf,
+            generated_at=get_ist_now().strftime('%d %B %Y, %H:%M'),
+            **inputs
+        )
+        await warranty_pdf_cache.put(key, pdf_bytes)
+    return key, pdf_bytes
+
+
+async def render_warranty_report(device: dict, portal_name: str) -> bytes:
+    """Warranty report PDF for one device, reusing today's cached render when nothing changed"""
+    date = report_date()
+    settings_version = await reference_cache.version(SETTINGS)
+    pdf_bytes = await warranty_pdf_cache.lookup(device["id"], date, settings_version)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    [(inputs, amc_contract_id)] = await load_report_inputs([device], portal_name)
+    key, pdf_bytes = await render_report_inputs(inputs, date)
+    await warranty_pdf_cache.remember(device, key, date, settings_version, amc_contract_id)
+    return pdf_bytes
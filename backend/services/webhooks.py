@@ -0,0 +1,355 @@
+"""
+Webhook ingestion
+Webhook endpoints only verify the delivery, store it in `webhook_events` and
+return 200. The event id is unique per source: Razorpay's X-Razorpay-Event-Id
+(or a hash of the body), or a hash of an osTicket payload that carries its
+updated_at. A retried delivery hits the unique index and is acknowledged as a
+duplicate without being applied again. osTicket payloads without updated_at
+do not identify their delivery (a reopened ticket sends the same body as its
+first opening), so they are stored without deduplication.
+
+WebhookWorker applies stored events in the background:
+- events of one entity (an organization for Razorpay, an osTicket ticket)
+  are applied strictly in arrival order, under a per-entity lease so only one
+  API process works an entity at a time
+- different entities are processed in parallel (WEBHOOK_WORKER_CONCURRENCY)
+- a failing event is retried with backoff and holds back the events after it;
+  after WEBHOOK_MAX_ATTEMPTS it is marked failed and the entity moves on
+
+Processed events are kept for WEBHOOK_RETENTION_DAYS (TTL index on expires_at),
+which bounds how long a late retry is still recognized as a duplicate.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from config import WEBHOOK_WORKER_CONCURRENCY, WEBHOOK_MAX_ATTEMPTS, WEBHOOK_RETENTION_DAYS
+from database import db
+from services.leases import acquire_lease, release_lease
+from services.osticket_sync import OSTICKET_STATUS_MAP
+from services.saas_service import (
+    handle_subscription_activated,
+    handle_subscription_cancelled,
+    handle_payment_failed
+)
+from utils.helpers import get_ist_isoformat
+from utils.timings import Timings
+
+logger = logging.getLogger(__name__)
+
+# Sources
+RAZORPAY = "razorpay"
+OSTICKET = "osticket"
+
+# Event statuses
+PENDING = "pending"
+PROCESSED = "processed"
+FAILED = "failed"
+
+# Longer than any single handler should take; a crashed worker's entity is freed after this
+_ENTITY_LEASE_SECONDS = 60
+_POLL_SECONDS = 5.0
+_ENTITY_BATCH = 100
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB returns naive UTC datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def payload_hash(payload) -> str:
+    """Event id for sources that do not send one: identical deliveries hash the same"""
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def razorpay_entity_key(data: dict) -> str:
+    """Razorpay events are ordered per organization (falling back to the entity id)"""
+    payload = data.get("payload", {})
+    for name in ("subscription", "payment"):
+        entity = payload.get(name, {}).get("entity", {})
+        if entity:
+            org_id = (entity.get("notes") or {}).get("org_id")
+            return f"org:{org_id}" if org_id else f"{name}:{entity.get('id')}"
+    return f"event:{data.get('event')}"
+
+
+async def store_event(source: str, event_id: Optional[str], event_type: Optional[str], entity_key: str, payload: dict) -> bool:
+    """
+    Store a verified delivery; False when this event was already received.
+    event_id None stores the delivery without deduplication.
+    """
+    now = get_ist_isoformat()
+    record_id = str(uuid.uuid4())
+    event = {
+        "id": record_id,
+        "source": source,
+        # Unique per delivery when the source gives nothing to recognize a retry by
+        "event_id": event_id or f"delivery:{record_id}",
+        "event_type": event_type,
+        "entity_key": f"{source}:{entity_key}",
+        "payload": payload,
+        "status": PENDING,
+        "attempts": 0,
+        "error": None,
+        "received_at": _utcnow(),
+        "next_attempt_at": _utcnow(),
+        "created_at": now,
+        "processed_at": None
+    }
+    try:
+        await db.webhook_events.insert_one(event)
+    except DuplicateKeyError:
+        webhook_worker.duplicates += 1
+        logger.info(f"{source} webhook {event_id} already received; ignoring retry")
+        return False
+    webhook_worker.received += 1
+    webhook_worker.notify()
+    return True
+
+
+# ==================== HANDLERS ====================
+
+async def process_razorpay_event(data: dict):
+    """Apply a Razorpay subscription / payment event"""
+    event = data.get("event")
+    payload_data = data.get("payload", {})
+
+    if event == "subscription.activated":
+        subscription = payload_data.get("subscription", {}).get("entity", {})
+        org_id = subscription.get("notes", {}).get("org_id")
+        if org_id:
+            await handle_subscription_activated(db, org_id, subscription)
+
+    elif event == "subscription.cancelled":
+        subscription = payload_data.get("subscription", {}).get("entity", {})
+        org_id = subscription.get("notes", {}).get("org_id")
+        if org_id:
+            await handle_subscription_cancelled(db, org_id)
+
+    elif event == "subscription.halted" or event == "payment.failed":
+        subscription = payload_data.get("subscription", {}).get("entity", {})
+        org_id = subscription.get("notes", {}).get("org_id")
+        if org_id:
+            await handle_payment_failed(db, org_id)
+
+    elif event == "payment.captured":
+        payment = payload_data.get("payment", {}).get("entity", {})
+        org_id = payment.get("notes", {}).get("org_id")
+        if org_id and payment.get("id"):
+            # Keyed by the Razorpay payment id, so a payment is recorded once
+            await db.payments.update_one(
+                {"razorpay_payment_id": payment["id"]},
+                {"$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "org_id": org_id,
+                    "razorpay_payment_id": payment["id"],
+                    "razorpay_order_id": payment.get("order_id"),
+                    "amount": payment.get("amount"),
+                    "currency": payment.get("currency", "INR"),
+                    "status": "captured",
+                    "method": payment.get("method"),
+                    "created_at": datetime.utcnow().isoformat()
+                }},
+                upsert=True
+            )
+
+
+async def process_osticket_event(payload: dict):
+    """Apply an osTicket status change / reply to the matching portal ticket"""
+    collection = "service_tickets"
+    target = await db.service_tickets.find_one({"osticket_id": payload["ticket_id"]}, {"_id": 0, "id": 1})
+    if not target:
+        collection = "quick_service_requests"
+        target = await db.quick_service_requests.find_one({"osticket_id": payload["ticket_id"]}, {"_id": 0, "id": 1})
+    if not target and payload.get("ticket_number"):
+        collection = "service_tickets"
+        target = await db.service_tickets.find_one({"ticket_number": payload["ticket_number"]}, {"_id": 0, "id": 1})
+    if not target:
+        logger.warning(f"osTicket webhook: Ticket not found for osticket_id={payload['ticket_id']}")
+        return
+
+    status = payload.get("status")
+    new_status = OSTICKET_STATUS_MAP.get(status.lower() if status else "", None)
+    update_data = {"updated_at": get_ist_isoformat()}
+    if new_status:
+        update_data["status"] = new_status
+        # Set resolved/closed timestamps
+        if new_status == "resolved":
+            update_data["resolved_at"] = get_ist_isoformat()
+        elif new_status == "closed":
+            update_data["closed_at"] = get_ist_isoformat()
+
+    update = {"$set": update_data}
+    # Add the reply/message as a comment if provided
+    if payload.get("last_message") and payload.get("last_responder"):
+        if collection == "service_tickets":
+            update["$push"] = {"comments": {
+                "id": str(uuid.uuid4()),
+                "text": payload["last_message"],
+                "author": payload["last_responder"],
+                "author_type": "osticket_staff",
+                "created_at": get_ist_isoformat(),
+                "source": "osticket_webhook"
+            }}
+        else:
+            update_data["last_response"] = payload["last_message"]
+
+    await db[collection].update_one({"id": target["id"]}, update)
+    logger.info(f"osTicket webhook: Updated {collection} {target['id']} with status={new_status}")
+
+
+HANDLERS = {
+    RAZORPAY: process_razorpay_event,
+    OSTICKET: process_osticket_event,
+}
+
+
+# ==================== WORKER ====================
+
+class WebhookWorker:
+    """Applies stored webhook events in order per entity"""
+
+    def __init__(self, concurrency: int = WEBHOOK_WORKER_CONCURRENCY, max_attempts: int = WEBHOOK_MAX_ATTEMPTS):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._owner = str(uuid.uuid4())
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        # Receipt to applied, per event
+        self.lag = Timings()
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Webhook worker started: concurrency {self.concurrency}")
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                self._wake.clear()
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Webhook worker failed; retrying")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self):
+        """Process every entity that has a due event"""
+        entity_keys = [
+            row["_id"] async for row in db.webhook_events.aggregate([
+                {"$match": {"status": PENDING, "next_attempt_at": {"$lte": _utcnow()}}},
+                {"$group": {"_id": "$entity_key", "first": {"$min": "$received_at"}}},
+                {"$sort": {"first": 1}},
+                {"$limit": _ENTITY_BATCH}
+            ])
+        ]
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run(entity_key: str):
+            async with slots:
+                await self._process_entity(entity_key)
+
+        await asyncio.gather(*(run(key) for key in entity_keys))
+
+    async def _process_entity(self, entity_key: str):
+        lease = f"webhook:{entity_key}"
+        if not await acquire_lease(lease, self._owner, _ENTITY_LEASE_SECONDS):
+            return  # Another process is applying this entity's events
+        try:
+            cursor = db.webhook_events.find(
+                {"entity_key": entity_key, "status": PENDING}
+            ).sort([("received_at", 1), ("_id", 1)])
+            async for event in cursor:
+                if _as_utc(event["next_attempt_at"]) > _utcnow():
+                    break  # Head of the line is backing off; later events wait for it
+                # Extend the lease per event so a long backlog is never taken over midway
+                if not await acquire_lease(lease, self._owner, _ENTITY_LEASE_SECONDS):
+                    break
+                if not await self._apply(event):
+                    break
+        finally:
+            await release_lease(lease, self._owner)
+
+    async def _apply(self, event: dict) -> bool:
+        """Apply one event; False when it must be retried before its successors"""
+        try:
+            await HANDLERS[event["source"]](event["payload"])
+        except Exception as e:
+            attempts = event["attempts"] + 1
+            error = str(e) or e.__class__.__name__
+            if attempts >= self.max_attempts:
+                logger.exception(f"Webhook event {event['id']} failed permanently")
+                await db.webhook_events.update_one(
+                    {"id": event["id"]},
+                    {"$set": {"status": FAILED, "attempts": attempts, "error": error}}
+                )
+                self.failed += 1
+                return True
+            delay = min(300, 5 * 2 ** (attempts - 1))
+            logger.warning(f"Webhook event {event['id']} failed (attempt {attempts}), retrying in {delay}s: {error}")
+            await db.webhook_events.update_one(
+                {"id": event["id"]},
+                {"$set": {"attempts": attempts, "error": error, "next_attempt_at": _utcnow() + timedelta(seconds=delay)}}
+            )
+            self.retried += 1
+            return False
+
+        await db.webhook_events.update_one(
+            {"id": event["id"]},
+            {"$set": {
+                "status": PROCESSED,
+                "attempts": event["attempts"] + 1,
+                "error": None,
+                "processed_at": get_ist_isoformat(),
+                "expires_at": _utcnow() + timedelta(days=WEBHOOK_RETENTION_DAYS)
+            }}
+        )
+        self.processed += 1
+        self.lag.add((_utcnow() - _as_utc(event["received_at"])).total_seconds() * 1000)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "concurrency": self.concurrency,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lag": self.lag.summary(),
+        }
+
+
+webhook_worker = WebhookWorker()
@@ -4,5 +4,8 @@ from utils.helpers import (
     get_ist_isoformat,
     calculate_warranty_expiry,
     is_warranty_active,
-    days_until_expiry
+    days_until_expiry,
+    normalize_lookup_key,
+    device_lookup_keys,
+    device_identifier_query
 )
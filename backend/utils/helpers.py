@@ -1,9 +1,14 @@
 """
 Utility helper functions
 """
+import re
 from datetime import datetime, timedelta
+from typing import Optional
 from config import IST
 
+# Characters ignored when comparing serial numbers / asset tags
+_LOOKUP_KEY_SEPARATORS = re.compile(r"[\s\-_./\\:#]+")
+
 
 def get_ist_now():
     """Get current datetime in IST"""
@@ -40,3 +45,30 @@ def days_until_expiry(expiry_date: str) -> int:
         return (expiry.date() - today.date()).days
     except:
         return -9999
+
+
+def normalize_lookup_key(value) -> Optional[str]:
+    """Normalize a serial number or asset tag: trimmed, upper-cased, separators removed"""
+    if value is None:
+        return None
+    key = _LOOKUP_KEY_SEPARATORS.sub("", str(value)).upper()
+    return key or None
+
+
+def device_lookup_keys(device: dict) -> dict:
+    """Lookup-key fields for whichever of serial_number / asset_tag are present in a device dict"""
+    keys = {}
+    if "serial_number" in device:
+        keys["serial_key"] = normalize_lookup_key(device["serial_number"])
+    if "asset_tag" in device:
+        keys["asset_tag_key"] = normalize_lookup_key(device["asset_tag"])
+    return keys
+
+
+def device_identifier_query(identifier: str) -> dict:
+    """Exact-match (index seek) filter for a device by serial number or asset tag"""
+    key = normalize_lookup_key(identifier)
+    if not key:
+        # Never let an empty key match devices that have no key stored
+        return {"serial_key": {"$in": []}}
+    return {"$or": [{"serial_key": key}, {"asset_tag_key": key}]}
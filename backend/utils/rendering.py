@@ -0,0 +1,445 @@
+"""
+PDF / QR rendering
+Pure, synchronous renderers that turn plain data (dicts, lists, strings) into
+PDF bytes. They never touch the database or the event loop, so they can run in
+a worker process (see services.render_pool).
+"""
+from io import BytesIO
+import zlib
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+# Bulk QR sheet layout: 1.5 inch QR codes, 4 columns x 5 rows = 20 per A4 page
+SHEET_QR_SIZE = 1.5 * inch  # 108 points
+SHEET_LABEL_HEIGHT = 0.35 * inch  # Space for text below QR
+SHEET_CELL_PADDING = 0.15 * inch  # Padding between cells
+SHEET_CELL_WIDTH = SHEET_QR_SIZE + SHEET_CELL_PADDING
+SHEET_CELL_HEIGHT = SHEET_QR_SIZE + SHEET_LABEL_HEIGHT + SHEET_CELL_PADDING
+SHEET_COLUMNS = 4  # 4 columns of 1.5 inch QR codes fit on A4 width
+SHEET_ROWS = 5  # 5 rows fit on A4 height
+LABELS_PER_PAGE = SHEET_COLUMNS * SHEET_ROWS
+SHEET_MARGIN_X = (A4[0] - (SHEET_COLUMNS * SHEET_CELL_WIDTH)) / 2  # Center the columns
+SHEET_MARGIN_Y = 0.5 * inch  # Top/bottom margin
+
+
+def _qr_matrix(url: str) -> List[List[bool]]:
+    """QR module matrix for `url` (quiet-zone border included)"""
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        border=1,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _qr_rects(url: str, x: float, y: float, size: float) -> Iterator[Tuple[float, float, float, float]]:
+    """
+    Dark-module rectangles (x, y, width, height) of a QR code whose bottom-left
+    corner is (x, y). Adjacent dark modules in a row are merged into one rectangle.
+    """
+    matrix = _qr_matrix(url)
+    module = size / len(matrix)
+    for row_index, row in enumerate(matrix):
+        # Matrix rows run top to bottom; PDF y runs bottom to top
+        row_y = y + size - (row_index + 1) * module
+        col = 0
+        while col < len(row):
+            if not row[col]:
+                col += 1
+                continue
+            run_start = col
+            while col < len(row) and row[col]:
+                col += 1
+            yield x + run_start * module, row_y, (col - run_start) * module, module
+
+
+def draw_qr_vector(c: canvas.Canvas, url: str, x: float, y: float, size: float):
+    """
+    Draw a QR code as filled rectangles in a single path, with (x, y) the
+    bottom-left corner, so it prints crisp at any size.
+    """
+    path = c.beginPath()
+    for rect in _qr_rects(url, x, y, size):
+        path.rect(*rect)
+    c.saveState()
+    c.setFillColorRGB(0, 0, 0)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
+
+
+def draw_qr_raster(c: canvas.Canvas, url: str, x: float, y: float, size: float):
+    """
+    Previous PNG-embedding path (PIL image, LANCZOS resize, PNG encode).
+    Kept only as the baseline for utils.render_benchmark.
+    """
+    import qrcode
+    from PIL import Image
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=10,
+        border=1,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_img = qr_img.resize((300, 300), Image.Resampling.LANCZOS)
+
+    qr_buffer = BytesIO()
+    qr_img.save(qr_buffer, format='PNG')
+    qr_buffer.seek(0)
+    c.drawImage(ImageReader(qr_buffer), x, y, width=size, height=size)
+
+
+def render_warranty_pdf(
+    portal_name: str,
+    generated_at: str,
+    device_rows: List[list],
+    parts_rows: Optional[List[list]],
+    amc_rows: List[list]
+) -> bytes:
+    """Warranty report: device table, optional parts table (header row first), AMC table"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
+    story = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=18, spaceAfter=20, textColor=colors.HexColor('#0F172A'))
+    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, spaceAfter=10, textColor=colors.HexColor('#0F172A'))
+    body_style = ParagraphStyle('Body', parent=styles['Normal'], fontSize=10, spaceAfter=5, textColor=colors.HexColor('#64748B'))
+
+    story.append(Paragraph(f"{portal_name} - Warranty Report", title_style))
+    story.append(Paragraph(f"Generated: {generated_at}", body_style))
+    story.append(Spacer(1, 20))
+
+    key_value_style = TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F8FAFC')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#0F172A')),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
+    ])
+
+    story.append(Paragraph("Device Information", heading_style))
+    device_table = Table(device_rows, colWidths=[2*inch, 4*inch])
+    device_table.setStyle(key_value_style)
+    story.append(device_table)
+    story.append(Spacer(1, 20))
+
+    if parts_rows:
+        story.append(Paragraph("Parts Warranty Status", heading_style))
+        parts_table = Table(parts_rows, colWidths=[1.5*inch, 1.2*inch, 1*inch, 1.2*inch, 1*inch])
+        parts_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0F62FE')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E2E8F0')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ]))
+        story.append(parts_table)
+        story.append(Spacer(1, 20))
+
+    story.append(Paragraph("AMC / Service Coverage", heading_style))
+    amc_table = Table(amc_rows, colWidths=[2*inch, 4*inch])
+    amc_table.setStyle(key_value_style)
+    story.append(amc_table)
+    story.append(Spacer(1, 30))
+
+    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.HexColor('#94A3B8'))
+    story.append(Paragraph("This document is auto-generated and valid as of the date mentioned above.", footer_style))
+    story.append(Paragraph("For any discrepancies, please contact support.", footer_style))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def merge_pdf_files(paths: List[str], output_path: str) -> int:
+    """Concatenate PDF files into `output_path`; returns the page count"""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(output_path, "wb") as output:
+        writer.write(output)
+    return len(writer.pages)
+
+
+def render_qr_label_pdf(label: dict, draw_qr: Callable = draw_qr_vector) -> bytes:
+    """
+    Single 1.5 inch QR label centred on an A4 page.
+    `label`: url, serial_number, asset_tag, caption (brand + model).
+    """
+    pdf_buffer = BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+    page_width, page_height = A4
+
+    # QR size: 1.5 inch x 1.5 inch
+    qr_size = 1.5 * inch
+    label_height = 0.4 * inch  # Space for text below QR
+    total_height = qr_size + label_height
+
+    # Center the QR code on the page
+    x = (page_width - qr_size) / 2
+    y = (page_height - total_height) / 2 + label_height
+
+    draw_qr(c, label["url"], x, y, qr_size)
+
+    # Draw border around QR (for cutting guide)
+    c.setStrokeColorRGB(0.8, 0.8, 0.8)
+    c.setLineWidth(0.5)
+    margin = 5
+    c.rect(x - margin, y - label_height - margin, qr_size + 2*margin, total_height + 2*margin)
+
+    # Draw labels below QR
+    text_x = page_width / 2
+
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(text_x, y - 15, f"S/N: {label.get('serial_number') or 'N/A'}")
+
+    if label.get('asset_tag'):
+        c.setFont("Helvetica", 9)
+        c.drawCentredString(text_x, y - 28, f"Tag: {label['asset_tag']}")
+
+    caption = (label.get("caption") or "").strip()
+    if caption:
+        c.setFont("Helvetica", 8)
+        c.setFillColorRGB(0.5, 0.5, 0.5)
+        c.drawCentredString(text_x, y - 40, caption[:40])
+
+    c.save()
+    return pdf_buffer.getvalue()
+
+
+def _sheet_label_lines(label: dict) -> Tuple[str, Optional[str]]:
+    """Serial and asset tag lines printed under a sheet QR code (truncated to fit)"""
+    serial = label.get('serial_number') or 'N/A'
+    asset_tag = label.get('asset_tag') or ''
+    serial_display = serial if len(serial) <= 20 else serial[:17] + "..."
+    tag_display = asset_tag if len(asset_tag) <= 20 else asset_tag[:17] + "..."
+    return f"S/N: {serial_display}", (f"Tag: {tag_display}" if asset_tag else None)
+
+
+def render_qr_sheet_pdf(labels: List[dict], footer: str, draw_qr: Callable = draw_qr_vector) -> bytes:
+    """
+    A4 sheets of 1.5 inch QR labels, 4 columns x 5 rows = 20 per page.
+    `labels`: dicts with url, serial_number, asset_tag.
+    """
+    page_height = A4[1]
+    qr_size = SHEET_QR_SIZE
+    label_height = SHEET_LABEL_HEIGHT
+    cell_width = SHEET_CELL_WIDTH
+    cell_height = SHEET_CELL_HEIGHT
+    columns = SHEET_COLUMNS
+    rows_per_page = SHEET_ROWS
+    margin_x = SHEET_MARGIN_X
+    margin_y = SHEET_MARGIN_Y
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    current_row = 0
+    current_col = 0
+
+    for label in labels:
+        x = margin_x + (current_col * cell_width)
+        y = page_height - margin_y - ((current_row + 1) * cell_height)
+
+        # Draw QR code (1.5 inch x 1.5 inch)
+        qr_x = x + (cell_width - qr_size) / 2
+        qr_y = y + label_height
+        draw_qr(c, label["url"], qr_x, qr_y, qr_size)
+
+        # Draw labels below QR
+        serial_line, tag_line = _sheet_label_lines(label)
+        text_x = x + cell_width / 2
+
+        c.setFont("Helvetica-Bold", 7)
+        c.setFillColorRGB(0, 0, 0)
+        c.drawCentredString(text_x, y + label_height - 12, serial_line)
+
+        if tag_line:
+            c.setFont("Helvetica", 6)
+            c.setFillColorRGB(0.3, 0.3, 0.3)
+            c.drawCentredString(text_x, y + label_height - 22, tag_line)
+
+        # Draw cutting guide border
+        c.setStrokeColorRGB(0.85, 0.85, 0.85)
+        c.setLineWidth(0.5)
+        c.rect(x + 2, y + 2, cell_width - 4, cell_height - 4)
+
+        c.setFillColorRGB(0, 0, 0)
+
+        # Move to next cell
+        current_col += 1
+        if current_col >= columns:
+            current_col = 0
+            current_row += 1
+            if current_row >= rows_per_page:
+                c.showPage()
+                current_row = 0
+
+    # Footer with generation info
+    c.setFont("Helvetica", 7)
+    c.setFillColorRGB(0.5, 0.5, 0.5)
+    c.drawString(margin_x, 12, footer)
+
+    c.save()
+    return buffer.getvalue()
+
+
+# ---- Incremental sheet rendering (bulk label jobs) ----
+# Pages are rendered to raw PDF content streams in a worker process and
+# appended to a file by PdfPageWriter, so memory use does not grow with the
+# number of labels. Fonts are the standard Type1 Helvetica faces (not embedded).
+_FONTS = {"Helvetica": b"F1", "Helvetica-Bold": b"F2"}
+
+
+def _pdf_text(text: str) -> bytes:
+    """Encode text as a PDF literal string (WinAnsi)"""
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _text_op(font: str, size: float, x: float, y: float, text: str, centred: bool = False) -> bytes:
+    if centred:
+        x -= stringWidth(text, font, size) / 2
+    return b"BT /%s %g Tf %.2f %.2f Td %s Tj ET\n" % (_FONTS[font], size, x, y, _pdf_text(text))
+
+
+def render_qr_page_streams(labels: List[dict]) -> List[bytes]:
+    """
+    Content streams for bulk QR sheet pages, LABELS_PER_PAGE labels per page,
+    laid out exactly like render_qr_sheet_pdf. `labels`: url, serial_number, asset_tag.
+    """
+    page_height = A4[1]
+    pages = []
+    for start in range(0, len(labels), LABELS_PER_PAGE):
+        ops = [b"q\n"]
+        for slot, label in enumerate(labels[start:start + LABELS_PER_PAGE]):
+            row, col = divmod(slot, SHEET_COLUMNS)
+            x = SHEET_MARGIN_X + col * SHEET_CELL_WIDTH
+            y = page_height - SHEET_MARGIN_Y - (row + 1) * SHEET_CELL_HEIGHT
+            qr_x = x + (SHEET_CELL_WIDTH - SHEET_QR_SIZE) / 2
+            qr_y = y + SHEET_LABEL_HEIGHT
+
+            ops.append(b"0 0 0 rg\n")
+            ops.extend(b"%.3f %.3f %.3f %.3f re\n" % rect for rect in _qr_rects(label["url"], qr_x, qr_y, SHEET_QR_SIZE))
+            ops.append(b"f\n")
+
+            serial_line, tag_line = _sheet_label_lines(label)
+            text_x = x + SHEET_CELL_WIDTH / 2
+            ops.append(_text_op("Helvetica-Bold", 7, text_x, y + SHEET_LABEL_HEIGHT - 12, serial_line, centred=True))
+            if tag_line:
+                ops.append(b"0.3 0.3 0.3 rg\n")
+                ops.append(_text_op("Helvetica", 6, text_x, y + SHEET_LABEL_HEIGHT - 22, tag_line, centred=True))
+
+            # Cutting guide border
+            ops.append(b"0.85 0.85 0.85 RG 0.5 w %.2f %.2f %.2f %.2f re S\n" % (
+                x + 2, y + 2, SHEET_CELL_WIDTH - 4, SHEET_CELL_HEIGHT - 4
+            ))
+        ops.append(b"Q\n")
+        pages.append(b"".join(ops))
+    return pages
+
+
+def render_sheet_footer_stream(footer: str) -> bytes:
+    """Content stream for the generation footer drawn on the last sheet page"""
+    return b"q 0.5 0.5 0.5 rg\n" + _text_op("Helvetica", 7, SHEET_MARGIN_X, 12, footer) + b"Q\n"
+
+
+class PdfPageWriter:
+    """
+    Minimal PDF writer that appends A4 pages to a binary file as they arrive.
+    Only per-object offsets are kept in memory. Call finish() exactly once.
+    """
+
+    _CATALOG, _PAGES, _FIRST_FONT = 1, 2, 3
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self._offsets = {}
+        self._next_id = self._FIRST_FONT + len(_FONTS)
+        self._page_ids: List[int] = []
+        # Last page is written lazily so finish() can add a footer stream to it
+        self._pending: Optional[Tuple[int, List[int]]] = None
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for number, font in enumerate(_FONTS, start=self._FIRST_FONT):
+            self._object(number, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % font.encode())
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+
+    def _allocate(self) -> int:
+        number = self._next_id
+        self._next_id += 1
+        return number
+
+    def _object(self, number: int, body: bytes):
+        self._offsets[number] = self._file.tell()
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    def _stream(self, content: bytes) -> int:
+        number = self._allocate()
+        data = zlib.compress(content)
+        self._object(number, b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data))
+        return number
+
+    def _flush_pending(self):
+        if self._pending is None:
+            return
+        page_id, content_ids = self._pending
+        fonts = b" ".join(b"/%s %d 0 R" % (name, number) for number, name in enumerate(_FONTS.values(), start=self._FIRST_FONT))
+        contents = b" ".join(b"%d 0 R" % number for number in content_ids)
+        self._object(page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] /Resources << /Font << %s >> >> /Contents [%s] >>" % (
+            self._PAGES, A4[0], A4[1], fonts, contents
+        ))
+        self._pending = None
+
+    def add_page(self, content: bytes):
+        """Append one page drawn by `content` (an uncompressed content stream)"""
+        self._flush_pending()
+        content_id = self._stream(content)
+        page_id = self._allocate()
+        self._page_ids.append(page_id)
+        self._pending = (page_id, [content_id])
+
+    def finish(self, last_page_overlay: Optional[bytes] = None):
+        """Write the page tree, catalog and cross-reference table"""
+        if last_page_overlay and self._pending is None:
+            self.add_page(b"")
+        if last_page_overlay:
+            self._pending[1].append(self._stream(last_page_overlay))
+        self._flush_pending()
+
+        kids = b" ".join(b"%d 0 R" % number for number in self._page_ids)
+        self._object(self._PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_ids)))
+        self._object(self._CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self._PAGES)
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            self._write(b"%010d 00000 n \n" % self._offsets[number])
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, self._CATALOG, xref_offset))
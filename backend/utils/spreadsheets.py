@@ -0,0 +1,85 @@
+"""
+Spreadsheet reading for bulk imports
+CSV and XLSX files are read row by row (openpyxl in read-only mode), so a file
+is never loaded whole. Rows come back as dicts keyed by the header row with
+string values, the same shape the import UI posts as JSON.
+"""
+import csv
+import zipfile
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+
+# Extensions iter_record_chunks() understands
+SPREADSHEET_EXTENSIONS = (".csv", ".xlsx")
+
+
+def spreadsheet_extension(filename: Optional[str]) -> Optional[str]:
+    """The supported extension of `filename`, or None"""
+    name = (filename or "").lower()
+    for extension in SPREADSHEET_EXTENSIONS:
+        if name.endswith(extension):
+            return extension
+    return None
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _csv_rows(path: str) -> Iterator[List[str]]:
+    # utf-8-sig drops the byte order mark Excel writes at the start of CSV exports
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.reader(f)
+
+
+def _xlsx_rows(path: str) -> Iterator[List[str]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_record_chunks(path: str, filename: str, chunk_size: int) -> Iterator[List[dict]]:
+    """
+    Yield the data rows of a CSV / XLSX file as lists of up to `chunk_size`
+    records. Blank rows and cells are skipped. Raises ValueError for unsupported or
+    unreadable files.
+    """
+    extension = spreadsheet_extension(filename)
+    if extension is None:
+        raise ValueError("Unsupported file type. Upload a .csv or .xlsx file.")
+    rows = _csv_rows(path) if extension == ".csv" else _xlsx_rows(path)
+
+    try:
+        headers = None
+        chunk = []
+        for row in rows:
+            values = [value.strip() for value in row]
+            if not any(values):
+                continue
+            if headers is None:
+                headers = [value.lower().replace(" ", "_") for value in values]
+                continue
+            # Blank cells are left out so the importers' defaults apply
+            chunk.append({header: value for header, value in zip(headers, values) if header and value})
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+        raise ValueError(f"Could not read {filename}: {e}")
+    finally:
+        rows.close()
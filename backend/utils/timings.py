@@ -0,0 +1,34 @@
+"""
+Latency metrics
+Running count / average / max plus a window of recent samples for p95,
+shared by the in-process worker pools and HTTP clients.
+"""
+from collections import deque
+
+# Recent samples kept per measurement for percentile metrics
+SAMPLE_WINDOW = 200
+
+
+class Timings:
+    """Count, max and recent samples (ms) for one measurement"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples.append(ms)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+        return {
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p95_ms": round(p95, 2),
+            "max_ms": round(self.max_ms, 2),
+        }
@@ -372,8 +372,22 @@ const Devices = () => {
         requestData.company_id = filterCompany;
       }
       
-      const response = await axios.post(`${API}/devices/bulk-qr-pdf`, requestData, {
-        headers: { Authorization: `Bearer ${token}` },
+      // Render in the background, then download the finished PDF
+      const headers = { Authorization: `Bearer ${token}` };
+      const { data: submitted } = await axios.post(`${API}/devices/bulk-qr-jobs`, requestData, { headers });
+      let job = submitted;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1500));
+        ({ data: job } = await axios.get(`${API}/devices/bulk-qr-jobs/${submitted.id}`, { headers }));
+        toast.dismiss();
+        toast.loading(`Generating QR codes PDF... ${job.processed} / ${job.total}`);
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || 'QR code generation failed');
+      }
+      
+      const response = await axios.get(`${API}/devices/bulk-qr-jobs/${submitted.id}/download`, {
+        headers,
         responseType: 'blob'
       });
       
@@ -400,8 +414,7 @@ const Devices = () => {
       window.URL.revokeObjectURL(url);
       
       toast.dismiss();
-      const count = selectedCount > 0 ? selectedCount : devices.length;
-      toast.success(`QR codes PDF downloaded! Contains ${count} devices.`);
+      toast.success(`QR codes PDF downloaded! Contains ${job.processed} devices.`);
       
       // Clear selection after download
       if (selectedCount > 0) {
@@ -409,7 +422,7 @@ const Devices = () => {
       }
     } catch (error) {
       toast.dismiss();
-      toast.error(error.response?.data?.detail || 'Failed to generate QR codes PDF');
+      toast.error(error.response?.data?.detail || error.message || 'Failed to generate QR codes PDF');
     }
   };
 
@@ -0,0 +1,205 @@
+"""
+Test Suite for Admin List/Aggregate Endpoints
+Tests:
+- GET /api/admin/devices - aggregation with AMC status filter and X-Total-Count
+- GET /api/admin/companies/{id}/overview - batched 360° view
+- GET /api/admin/dashboard/alerts - $facet expiry buckets
+- GET /api/admin/amc-contracts - status filtered before pagination, joined counts
+- GET /api/search - indexed prefix/token search, concurrent categories with per-category budget
+"""
+
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_EMAIL = "admin@demo.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin auth headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json().get('access_token')}"}
+
+
+class TestAdminDeviceList:
+    """Test /api/admin/devices aggregation"""
+
+    def test_list_returns_total_count_header(self, admin_headers):
+        """Response should be a list with an X-Total-Count header"""
+        response = requests.get(f"{BASE_URL}/api/admin/devices", headers=admin_headers, params={"limit": 5})
+
+        assert response.status_code == 200
+        devices = response.json()
+        assert isinstance(devices, list)
+        total = int(response.headers["X-Total-Count"])
+        assert len(devices) <= total
+        for device in devices:
+            assert device["amc_status"] in ("active", "none", "expired")
+            assert "company_name" in device
+            assert "label" in device
+            assert "_id" not in device
+        print(f"✓ {len(devices)} of {total} devices returned")
+
+    def test_amc_status_filter_applied_before_pagination(self, admin_headers):
+        """Filtered pages should be full (up to limit) and match the filtered total"""
+        for amc_status in ("active", "none", "expired"):
+            response = requests.get(
+                f"{BASE_URL}/api/admin/devices",
+                headers=admin_headers,
+                params={"amc_status": amc_status, "limit": 2}
+            )
+            assert response.status_code == 200
+            devices = response.json()
+            total = int(response.headers["X-Total-Count"])
+            assert len(devices) == min(2, total)
+            assert all(d["amc_status"] == amc_status for d in devices)
+            print(f"✓ amc_status={amc_status}: {total} total")
+
+
+class TestCompanyOverview:
+    """Test /api/admin/companies/{id}/overview"""
+
+    def test_overview_summary_matches_sections(self, admin_headers):
+        """Summary counts should agree with the returned sections"""
+        companies = requests.get(f"{BASE_URL}/api/admin/companies", headers=admin_headers).json()
+        if not companies:
+            pytest.skip("No companies available")
+
+        response = requests.get(
+            f"{BASE_URL}/api/admin/companies/{companies[0]['id']}/overview", headers=admin_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        summary = data["summary"]
+
+        assert summary["total_devices"] == len(data["devices"])
+        assert summary["active_amc_devices"] == sum(1 for d in data["devices"] if d["amc_status"] == "active")
+        assert summary["total_deployments"] == len(data["deployments"])
+        for dep in data["deployments"]:
+            assert "site_name" in dep and "items_count" in dep
+        for amc in data["amc_contracts"]:
+            assert isinstance(amc["devices_covered"], int)
+        device_ids = {d["id"] for d in data["devices"]}
+        for svc in data["services"]:
+            assert svc["device_id"] in device_ids
+            assert "device_info" in svc
+        print(f"✓ Overview for {data['company']['name']}: {summary}")
+
+
+class TestDashboardAlerts:
+    """Test /api/admin/dashboard/alerts"""
+
+    def test_alert_buckets_respect_day_ranges(self, admin_headers):
+        """Every bucket should hold only items inside its day range"""
+        response = requests.get(f"{BASE_URL}/api/admin/dashboard/alerts", headers=admin_headers)
+        assert response.status_code == 200
+        alerts = response.json()
+
+        ranges = {"7": (1, 7), "15": (8, 15), "30": (16, 30)}
+        for prefix in ("warranty_expiring", "amc_expiring", "amc_contracts_expiring"):
+            for name, (low, high) in ranges.items():
+                for item in alerts[f"{prefix}_{name}_days"]:
+                    assert low <= item["days_remaining"] <= high, item
+        for key in ("devices_in_repair", "devices_lost", "companies_without_amc"):
+            assert isinstance(alerts[key], list)
+        print(f"✓ Alert buckets: { {k: len(v) for k, v in alerts.items()} }")
+
+
+class TestAmcContractList:
+    """Test /api/admin/amc-contracts aggregation"""
+
+    def test_status_filter_applied_before_pagination(self, admin_headers):
+        """Filtered pages should be full (up to limit) and carry the joined counts"""
+        for status in ("active", "upcoming", "expired"):
+            response = requests.get(
+                f"{BASE_URL}/api/admin/amc-contracts",
+                headers=admin_headers,
+                params={"status": status, "limit": 2}
+            )
+            assert response.status_code == 200
+            contracts = response.json()
+            total = int(response.headers["X-Total-Count"])
+            assert len(contracts) == min(2, total)
+            for contract in contracts:
+                assert contract["status"] == status
+                assert isinstance(contract["usage_count"], int)
+                assert isinstance(contract["assigned_devices_count"], int)
+                assert contract["label"] == contract["name"]
+                assert "company_name" in contract
+            print(f"✓ status={status}: {total} total")
+
+
+class TestUniversalSearch:
+    """Test /api/search fan-out"""
+
+    def test_search_returns_all_categories(self, admin_headers):
+        """Every category should be present and total_count should add up"""
+        response = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": "a", "limit": 3})
+        assert response.status_code == 200
+        data = response.json()
+
+        categories = ("companies", "sites", "users", "assets", "deployments", "amcs", "services")
+        for category in categories:
+            assert isinstance(data[category], list)
+            assert len(data[category]) <= 3
+        assert data["total_count"] == sum(len(data[c]) for c in categories)
+        assert set(data["timed_out"]) <= set(categories)
+        print(f"✓ Search 'a': {data['total_count']} results, timed out: {data['timed_out']}")
+
+    def test_search_treats_query_as_literal_text(self, admin_headers):
+        """Regex metacharacters should not error or match everything"""
+        response = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": ".*(["})
+        assert response.status_code == 200
+        assert response.json()["total_count"] == 0
+        print("✓ Regex metacharacters searched literally")
+
+    def test_search_index_follows_writes(self, admin_headers):
+        """A new company should be found by name prefix, and disappear once archived"""
+        token = f"zq{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/api/admin/companies", headers=admin_headers, json={
+            "name": f"{token.upper()} Logistics",
+            "contact_name": "Search Test",
+            "contact_email": f"{token}@example.com",
+            "contact_phone": "9999999999"
+        })
+        assert response.status_code == 200
+        company_id = response.json()["id"]
+
+        for query in (token[:6], f"{token} logi", token.upper()):
+            data = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": query}).json()
+            assert data["companies"] and data["companies"][0]["id"] == company_id, query
+
+        requests.delete(f"{BASE_URL}/api/admin/companies/{company_id}", headers=admin_headers)
+        data = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": token}).json()
+        assert all(c["id"] != company_id for c in data["companies"])
+        print(f"✓ Company '{token}' indexed on create and dropped on archive")
+
+    def test_short_tokens_match_whole_tokens(self, admin_headers):
+        """Tokens under three characters match whole tokens only, not prefixes"""
+        token = f"zq{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/api/admin/companies", headers=admin_headers, json={
+            "name": f"{token.upper()} HP Logistics",
+            "contact_name": "Search Test",
+            "contact_email": f"{token}@example.com",
+            "contact_phone": "9999999999"
+        })
+        assert response.status_code == 200, response.text
+        company_id = response.json()["id"]
+        try:
+            data = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": f"{token} hp"}).json()
+            assert data["companies"] and data["companies"][0]["id"] == company_id
+            data = requests.get(f"{BASE_URL}/api/search", headers=admin_headers, params={"q": f"{token} lo"}).json()
+            assert all(c["id"] != company_id for c in data["companies"])
+        finally:
+            requests.delete(f"{BASE_URL}/api/admin/companies/{company_id}", headers=admin_headers)
+        print("✓ Short tokens matched as whole tokens")
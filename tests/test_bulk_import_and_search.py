@@ -3,14 +3,17 @@ Test Suite for Bulk Import APIs and Office Supplies Search Feature
 Tests:
 - POST /api/admin/bulk-import/companies
 - POST /api/admin/bulk-import/sites
-- POST /api/admin/bulk-import/devices
+- POST /api/admin/bulk-import/devices - duplicates in the database and within the file
 - POST /api/admin/bulk-import/supply-products
+- POST /api/admin/bulk-import/{kind}/upload - CSV upload with streamed progress
+- Upsert mode - created / updated / unchanged per row
 - Office Supplies search functionality
 """
 
 import pytest
 import requests
 import os
+import json
 import uuid
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
@@ -340,6 +343,153 @@ class TestBulkImportDevices:
         assert len(data["errors"]) >= 1
         assert "already exists" in data["errors"][0]["message"].lower()
 
+    def test_bulk_import_devices_duplicate_within_file(self, admin_headers):
+        """Test a serial repeated in one file is imported once (normalized match)"""
+        unique_id = str(uuid.uuid4())[:6].upper()
+        records = [
+            {
+                "company_name": "Acme Corporation",
+                "brand": "Dell",
+                "model": "Test",
+                "serial_number": serial
+            }
+            for serial in (f"FILE-DUP-{unique_id}", f"file dup {unique_id.lower()}", f"FILE-OK-{unique_id}")
+        ]
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": records},
+            headers=admin_headers
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] == 2
+        assert data["errors"] == [{"row": 3, "message": f"Serial number file dup {unique_id.lower()} is repeated in the file (row 2)"}]
+
+
+class TestBulkImportUpsert:
+    """Test upsert mode matching on natural keys"""
+
+    def test_upsert_devices(self, admin_headers):
+        """Test re-importing a register creates, updates and skips rows by serial"""
+        unique_id = str(uuid.uuid4())[:6].upper()
+        records = [
+            {"company_name": "Acme Corporation", "brand": "Dell", "model": "Test", "serial_number": f"UPS-{unique_id}-{i}"}
+            for i in range(2)
+        ]
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": records, "mode": "upsert"},
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["created"] == 2
+
+        records[0]["location"] = "Floor 3"
+        records.append({"company_name": "Acme Corporation", "brand": "HP", "model": "Test", "serial_number": f"UPS-{unique_id}-2"})
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": records, "mode": "upsert"},
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["updated"], data["unchanged"]) == (1, 1, 1)
+        assert [r["status"] for r in data["rows"]] == ["updated", "unchanged", "created"]
+        assert data["errors"] == []
+        print(f"✓ Upsert summary: {data['created']} created, {data['updated']} updated, {data['unchanged']} unchanged")
+
+    def test_upsert_devices_other_company_serial(self, admin_headers):
+        """A serial registered to another company is a row error, not a move"""
+        unique_id = str(uuid.uuid4())[:6].upper()
+        companies = [{"name": f"TEST_UpsertOwner{i}_{unique_id}", "company_code": f"UPO{i}{unique_id}"} for i in range(2)]
+        response = requests.post(f"{BASE_URL}/api/admin/bulk-import/companies", json={"records": companies}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["success"] == 2
+
+        serial = f"UPS-OWN-{unique_id}"
+        device = {"brand": "Dell", "model": "Test", "serial_number": serial}
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": [{**device, "company_code": companies[0]["company_code"]}], "mode": "upsert"},
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["created"] == 1
+
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": [{**device, "company_code": companies[1]["company_code"], "location": "Moved"}], "mode": "upsert"},
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["updated"], data["unchanged"]) == (0, 0, 0)
+        assert len(data["errors"]) == 1
+        assert "belongs to another company" in data["errors"][0]["message"]
+        print(f"✓ Other company's serial rejected: {data['errors'][0]['message']}")
+
+    def test_upsert_companies_requires_code(self, admin_headers):
+        """Test company upserts need the company code to match on"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/companies",
+            json={"records": [{"name": "No Code Ltd"}], "mode": "upsert"},
+            headers=admin_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["errors"][0]["message"] == "Company code is required to upsert"
+
+    def test_invalid_mode_rejected(self, admin_headers):
+        """Test unknown import modes are rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices",
+            json={"records": [{"serial_number": "X"}], "mode": "replace"},
+            headers=admin_headers
+        )
+        assert response.status_code == 400
+
+
+class TestBulkImportUpload:
+    """Test CSV / XLSX upload imports"""
+
+    @staticmethod
+    def _upload(admin_headers, kind, filename, content):
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/{kind}/upload",
+            files={"file": (filename, content)},
+            headers={"Authorization": admin_headers["Authorization"]}
+        )
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        return [json.loads(line) for line in response.text.splitlines() if line]
+
+    def test_upload_devices_csv(self, admin_headers):
+        """Test a device CSV is imported with per-chunk progress"""
+        unique_id = str(uuid.uuid4())[:6].upper()
+        rows = [f"UPL-{unique_id}-{i},Dell,Latitude,Acme Corporation" for i in range(5)]
+        content = "serial_number,brand,model,company_name\n" + "\n".join(rows + [",Dell,Latitude,Acme Corporation"])
+
+        lines = self._upload(admin_headers, "devices", "devices.csv", content.encode())
+        progress, result = lines[:-1], lines[-1]
+        assert progress and progress[-1]["rows"] == 6
+        assert result["done"] is True
+        assert result["success"] == 5
+        assert result["errors"] == [{"row": 7, "message": "Serial number is required"}]
+        print(f"✓ Upload progress: {progress}")
+
+    def test_upload_rejects_unsupported_file(self, admin_headers):
+        """Test non-spreadsheet uploads are rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/bulk-import/devices/upload",
+            files={"file": ("devices.txt", b"serial_number\nX1")},
+            headers={"Authorization": admin_headers["Authorization"]}
+        )
+        assert response.status_code == 400
+
+    def test_upload_header_only(self, admin_headers):
+        """Test a file without data rows reports no records"""
+        lines = self._upload(admin_headers, "companies", "companies.csv", b"name,company_code\n")
+        assert lines == [{"done": True, "error": "No records provided"}]
+
 
 class TestBulkImportSupplyProducts:
     """Test bulk import supply products endpoint"""
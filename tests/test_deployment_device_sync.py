@@ -0,0 +1,126 @@
+"""
+Test Suite for Deployment -> Device Sync
+Tests:
+- POST /api/admin/deployments - serialized items create linked devices
+- POST /api/admin/deployments/{id}/sync-devices - re-sync of an unchanged deployment writes nothing
+- PUT /api/admin/deployments/{id}/items/{index} - renamed serials keep their device,
+  reordered serials never rename devices
+"""
+
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_EMAIL = "admin@demo.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin auth headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json().get('access_token')}", "Content-Type": "application/json"}
+
+
+@pytest.fixture(scope="module")
+def site(admin_headers):
+    """An existing site (with its company) to deploy to"""
+    response = requests.get(f"{BASE_URL}/api/admin/sites?limit=1", headers=admin_headers)
+    assert response.status_code == 200
+    sites = response.json()
+    if not sites:
+        pytest.skip("No sites to deploy to")
+    return sites[0]
+
+
+@pytest.fixture
+def deployment(admin_headers, site):
+    """A new deployment with one serialized item of two cameras"""
+    unique_id = str(uuid.uuid4())[:6].upper()
+    serials = [f"TEST_DEP_A_{unique_id}", f"TEST_DEP_B_{unique_id}"]
+    response = requests.post(f"{BASE_URL}/api/admin/deployments", headers=admin_headers, json={
+        "company_id": site["company_id"],
+        "site_id": site["id"],
+        "name": f"TEST_Deployment_{unique_id}",
+        "deployment_date": "2026-01-15",
+        "items": [{
+            "item_type": "device",
+            "category": "CCTV",
+            "brand": "Hikvision",
+            "model": "DS-2CD",
+            "quantity": 2,
+            "is_serialized": True,
+            "serial_numbers": serials
+        }]
+    })
+    assert response.status_code == 200, f"Create failed: {response.text}"
+    return response.json()
+
+
+def _device(admin_headers, device_id):
+    response = requests.get(f"{BASE_URL}/api/admin/devices/{device_id}", headers=admin_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestDeploymentDeviceSync:
+    """Test syncing serialized deployment items to devices"""
+
+    def test_create_links_devices(self, admin_headers, deployment):
+        """create_deployment returns the created devices in linked_device_ids"""
+        item = deployment["items"][0]
+        assert len(item["linked_device_ids"]) == 2
+        for device_id, serial in zip(item["linked_device_ids"], item["serial_numbers"]):
+            device = _device(admin_headers, device_id)
+            assert device["serial_number"] == serial
+            assert device["deployment_id"] == deployment["id"]
+        print(f"✓ Deployment created with devices {item['linked_device_ids']}")
+
+    def test_resync_unchanged_is_noop(self, admin_headers, deployment):
+        """Re-syncing an unchanged deployment creates and updates nothing"""
+        response = requests.post(f"{BASE_URL}/api/admin/deployments/{deployment['id']}/sync-devices", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 0
+        assert data["updated"] == 0
+        assert data["unchanged"] == 2
+        print(f"✓ Re-sync: {data}")
+
+    def test_renamed_serial_keeps_device(self, admin_headers, deployment):
+        """A renamed serial updates the device at its position instead of creating one"""
+        item = deployment["items"][0]
+        first_serial, second_serial = item["serial_numbers"]
+        renamed = f"{second_serial}_RENAMED"
+        response = requests.put(
+            f"{BASE_URL}/api/admin/deployments/{deployment['id']}/items/0",
+            headers=admin_headers,
+            json={"serial_numbers": [first_serial, renamed]}
+        )
+        assert response.status_code == 200
+        assert response.json()["item"]["linked_device_ids"] == item["linked_device_ids"]
+        assert _device(admin_headers, item["linked_device_ids"][1])["serial_number"] == renamed
+        print("✓ Renamed serial kept its device")
+
+    def test_reordered_serials_keep_devices(self, admin_headers, deployment):
+        """Reordering serials reorders the links; no device changes its serial"""
+        item = deployment["items"][0]
+        first_serial, second_serial = item["serial_numbers"]
+        first_id, second_id = item["linked_device_ids"]
+        response = requests.put(
+            f"{BASE_URL}/api/admin/deployments/{deployment['id']}/items/0",
+            headers=admin_headers,
+            json={"serial_numbers": [second_serial, first_serial]}
+        )
+        assert response.status_code == 200
+        assert response.json()["item"]["linked_device_ids"] == [second_id, first_id]
+        assert _device(admin_headers, first_id)["serial_number"] == first_serial
+        assert _device(admin_headers, second_id)["serial_number"] == second_serial
+        print("✓ Reordered serials kept their devices")
@@ -138,6 +138,22 @@ class TestPublicDeviceInfoEndpoint:
             assert "warranty_active" in part
         
         print(f"✓ Parts: {len(data['parts'])} parts found")
+
+    def test_device_info_lookup_ignores_case_and_separators(self):
+        """Serial lookup should match on the normalized key (case/separator insensitive)"""
+        variant = "-".join([TEST_DEVICE_SERIAL[:2].lower(), TEST_DEVICE_SERIAL[2:]])
+        response = requests.get(f"{BASE_URL}/api/device/{variant}/info")
+
+        assert response.status_code == 200
+        assert response.json()["device"]["serial_number"] == TEST_DEVICE_SERIAL
+        print(f"✓ '{variant}' resolved to {TEST_DEVICE_SERIAL}")
+
+    def test_device_info_regex_metacharacters_do_not_match(self):
+        """Regex metacharacters in the identifier must not act as wildcards"""
+        response = requests.get(f"{BASE_URL}/api/device/{TEST_DEVICE_SERIAL[:4]}.*/info")
+
+        assert response.status_code == 404
+        print("✓ Wildcard identifier returns 404")
     
     def test_device_info_invalid_device_returns_404(self):
         """GET /api/device/{invalid}/info should return 404"""
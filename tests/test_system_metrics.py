@@ -0,0 +1,236 @@
+"""
+Test Suite for In-Process Caches and Metrics
+Tests:
+- GET /api/admin/system/metrics - principal cache hit rate
+- ETag / 304 on settings, masters and plans reference data
+- Render pool job metrics after PDF / QR downloads
+- GET /api/warranty/pdf/{serial} - cached render and invalidation on device update
+- POST /api/admin/warranty-reports/jobs - bulk warranty report export (zip / merged pdf)
+- Pooled outbound HTTP client metrics per integration
+- Razorpay SDK thread pool metrics
+"""
+
+import pytest
+import requests
+import os
+import io
+import time
+import zipfile
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_EMAIL = "admin@demo.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin auth headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json().get('access_token')}"}
+
+
+class TestPrincipalCache:
+    """Test the authenticated principal cache"""
+
+    def test_repeated_requests_hit_cache(self, admin_headers):
+        """Back-to-back authenticated calls should be served from the cache"""
+        before = requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers)
+        assert before.status_code == 200
+        stats_before = before.json()["principal_cache"]
+
+        for _ in range(3):
+            requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers)
+
+        stats_after = requests.get(
+            f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers
+        ).json()["principal_cache"]
+        # Multiple uvicorn workers keep separate caches, so only require progress
+        assert stats_after["hits"] + stats_after["misses"] > stats_before["hits"] + stats_before["misses"]
+        assert 0.0 <= stats_after["hit_rate"] <= 1.0
+        print(f"✓ Principal cache: {stats_after}")
+
+    def test_metrics_require_admin(self):
+        """Metrics endpoint should reject anonymous callers"""
+        response = requests.get(f"{BASE_URL}/api/admin/system/metrics")
+        assert response.status_code in (401, 403)
+        print("✓ Metrics endpoint requires admin auth")
+
+
+class TestReferenceDataCache:
+    """Test ETag revalidation on reference data endpoints"""
+
+    @pytest.mark.parametrize("path", ["/api/settings/public", "/api/masters/public", "/api/plans"])
+    def test_matching_etag_returns_304(self, path):
+        """A request carrying the current ETag should get 304 with no body"""
+        first = requests.get(f"{BASE_URL}{path}")
+        assert first.status_code == 200
+        etag = first.headers.get("ETag")
+        assert etag, f"No ETag on {path}"
+
+        second = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert not second.content
+        print(f"✓ {path}: 304 for {etag}")
+
+    def test_settings_update_changes_etag(self, admin_headers):
+        """Saving settings should bump the version behind the ETag"""
+        before = requests.get(f"{BASE_URL}/api/settings/public")
+        etag = before.headers["ETag"]
+
+        response = requests.put(f"{BASE_URL}/api/admin/settings", headers=admin_headers, json={
+            "company_name": before.json()["company_name"]
+        })
+        assert response.status_code == 200
+
+        after = requests.get(f"{BASE_URL}/api/settings/public", headers={"If-None-Match": etag})
+        assert after.status_code == 200
+        assert after.headers["ETag"] != etag
+        print(f"✓ Settings ETag {etag} -> {after.headers['ETag']}")
+
+
+class TestRenderPool:
+    """Test PDF / QR rendering through the worker pool"""
+
+    def test_qr_label_rendered_and_recorded(self, admin_headers):
+        """A QR label download should return a PDF and show up in the pool metrics"""
+        devices = requests.get(f"{BASE_URL}/api/admin/devices?limit=1", headers=admin_headers).json()
+        if not devices:
+            pytest.skip("No devices to render")
+        serial = devices[0]["serial_number"]
+
+        response = requests.get(f"{BASE_URL}/api/device/{serial}/qr")
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF")
+
+        stats = requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers).json()["render_pool"]
+        assert stats["workers"] >= 1
+        assert set(stats) >= {"running", "waiting", "rejected", "jobs"}
+        # Multiple uvicorn workers keep separate pools; the job may have landed on another one
+        if "qr_label" in stats["jobs"]:
+            assert stats["jobs"]["qr_label"]["count"] >= 1
+        print(f"✓ Render pool: {stats}")
+
+
+class TestHttpClients:
+    """Test the pooled outbound HTTP client metrics"""
+
+    def test_integrations_reported(self, admin_headers):
+        stats = requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers).json()["http_clients"]
+        assert {"osticket", "ticketing_test"} <= set(stats)
+        for name, client in stats.items():
+            assert client["max_connections"] >= 1
+            assert client["in_flight"] <= client["peak_in_flight"]
+            assert set(client["latency"]) == {"avg_ms", "p95_ms", "max_ms"}
+        print(f"✓ HTTP clients: {stats}")
+
+
+class TestRazorpayGateway:
+    """Test the Razorpay SDK thread pool metrics"""
+
+    def test_gateway_reported(self, admin_headers):
+        stats = requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers).json()["razorpay_gateway"]
+        assert stats["max_threads"] >= 1
+        assert 0 <= stats["running"] <= stats["max_threads"]
+        assert stats["waiting"] >= 0
+        print(f"✓ Razorpay gateway: {stats}")
+
+class TestWarrantyPdfCache:
+    """Test the rendered warranty PDF cache"""
+
+    def test_repeat_download_cached_until_device_changes(self, admin_headers):
+        """Repeat downloads return the cached file; editing the device re-renders it"""
+        devices = requests.get(f"{BASE_URL}/api/admin/devices?limit=1", headers=admin_headers).json()
+        if not devices:
+            pytest.skip("No devices to render")
+        device = devices[0]
+        url = f"{BASE_URL}/api/warranty/pdf/{device['serial_number']}"
+
+        first = requests.get(url)
+        second = requests.get(url)
+        assert first.status_code == 200 and second.status_code == 200
+        # Same bytes (including the generated-at timestamp) means the render was reused
+        assert second.content == first.content
+
+        original = device.get("condition") or "good"
+        changed = "fair" if original != "fair" else "good"
+        try:
+            response = requests.put(f"{BASE_URL}/api/admin/devices/{device['id']}", headers=admin_headers, json={"condition": changed})
+            assert response.status_code == 200
+            third = requests.get(url)
+            assert third.status_code == 200
+            assert third.content != first.content
+        finally:
+            requests.put(f"{BASE_URL}/api/admin/devices/{device['id']}", headers=admin_headers, json={"condition": original})
+
+        stats = requests.get(f"{BASE_URL}/api/admin/system/metrics", headers=admin_headers).json()["warranty_pdf_cache"]
+        assert 0.0 <= stats["hit_rate"] <= 1.0
+        print(f"✓ Warranty PDF cache: {stats}")
+
+
+class TestWarrantyReportExport:
+    """Test bulk warranty report export as a background job"""
+
+    def _run(self, admin_headers, body):
+        response = requests.post(f"{BASE_URL}/api/admin/warranty-reports/jobs", headers=admin_headers, json=body)
+        if response.status_code == 404:
+            pytest.skip("No devices to export")
+        assert response.status_code == 202, f"Submit failed: {response.text}"
+        job = response.json()
+        for _ in range(300):
+            job = requests.get(f"{BASE_URL}/api/admin/warranty-reports/jobs/{job['id']}", headers=admin_headers).json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(1)
+        assert job["status"] == "completed", f"Job ended as {job['status']}: {job.get('error')}"
+        assert job["processed"] == job["total"]
+        download = requests.get(f"{BASE_URL}/api/admin/warranty-reports/jobs/{job['id']}/download", headers=admin_headers)
+        assert download.status_code == 200
+        return job, download.content
+
+    def test_zip_export_has_one_pdf_per_device(self, admin_headers):
+        devices = requests.get(f"{BASE_URL}/api/admin/devices?limit=5", headers=admin_headers).json()
+        if not devices:
+            pytest.skip("No devices to export")
+        job, content = self._run(admin_headers, {"device_ids": [d["id"] for d in devices], "format": "zip"})
+        names = zipfile.ZipFile(io.BytesIO(content)).namelist()
+        assert len(names) == job["total"] == len(devices)
+        assert all(name.endswith(".pdf") for name in names)
+        print(f"✓ Warranty report ZIP: {len(names)} reports")
+
+    def test_merged_pdf_export(self, admin_headers):
+        devices = requests.get(f"{BASE_URL}/api/admin/devices?limit=3", headers=admin_headers).json()
+        if not devices:
+            pytest.skip("No devices to export")
+        job, content = self._run(admin_headers, {"device_ids": [d["id"] for d in devices], "format": "pdf"})
+        assert content.startswith(b"%PDF")
+        print(f"✓ Warranty report PDF: {job['total']} devices, {len(content)} bytes")
+
+    def test_single_pdf_not_blocked_by_export(self, admin_headers):
+        """A single warranty PDF still renders while an export job is running"""
+        devices = requests.get(f"{BASE_URL}/api/admin/devices?limit=200", headers=admin_headers).json()
+        if len(devices) < 2:
+            pytest.skip("Not enough devices to export")
+        response = requests.post(
+            f"{BASE_URL}/api/admin/warranty-reports/jobs",
+            headers=admin_headers,
+            json={"device_ids": [d["id"] for d in devices], "format": "zip"}
+        )
+        assert response.status_code == 202, f"Submit failed: {response.text}"
+        job_id = response.json()["id"]
+
+        started = time.time()
+        single = requests.get(f"{BASE_URL}/api/warranty/pdf/{devices[-1]['serial_number']}", timeout=30)
+        assert single.status_code == 200, f"Single PDF failed during export: {single.status_code}"
+        assert single.content.startswith(b"%PDF")
+        job = requests.get(f"{BASE_URL}/api/admin/warranty-reports/jobs/{job_id}", headers=admin_headers).json()
+        print(f"✓ Single PDF in {time.time() - started:.2f}s while export was {job['status']}")
+
+    def test_invalid_format_rejected(self, admin_headers):
+        response = requests.post(f"{BASE_URL}/api/admin/warranty-reports/jobs", headers=admin_headers, json={"format": "docx"})
+        assert response.status_code == 400